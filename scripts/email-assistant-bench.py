@@ -0,0 +1,1393 @@
+#!/usr/bin/env python3
+"""
+Email Assistant benchmark - end-to-end throughput against local stand-ins
+
+Runs EmailAssistant.process_emails over a synthetic mailbox served by an
+in-process IMAP server or a stub Microsoft Graph server, with a fake LLM
+endpoint speaking the Ollama, Anthropic and OpenAI wire formats. Reports
+emails/sec, per-email latency percentiles, bytes transferred, peak RSS and
+LLM calls as JSON, so runs can be compared across commits.
+"""
+
+import argparse
+import importlib
+import json
+import logging
+import platform
+import random
+import re
+import select
+import socketserver
+import subprocess
+import sys
+import threading
+import time
+import zlib
+from abc import ABC, abstractmethod
+from dataclasses import asdict, dataclass
+from email import message_from_bytes, policy
+from email.message import EmailMessage
+from email.utils import format_datetime, parseaddr
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+import yaml
+
+SCRIPT_DIR = Path(__file__).resolve().parent
+ASSISTANT_PATH = SCRIPT_DIR / "email-assistant.py"
+
+logger = logging.getLogger("email-assistant-bench")
+
+
+def load_assistant():
+    """Import email-assistant.py from this script's directory
+
+    Its file name is not an identifier, so the import statement cannot name
+    it, but importlib can. Importing it under its file name from sys.path
+    lets parser processes unpickle its functions the same way.
+    """
+    if str(SCRIPT_DIR) not in sys.path:
+        sys.path.insert(0, str(SCRIPT_DIR))
+    return importlib.import_module(ASSISTANT_PATH.stem)
+
+
+# ============================================================================
+# SYNTHETIC MAILBOX
+# ============================================================================
+
+
+@dataclass
+class MailboxSpec:
+    """Shape of the synthetic mailbox"""
+
+    size: int = 500
+    # Fraction of emails with a PDF attachment, and its size
+    attachments: float = 0.1
+    attachment_kb: int = 200
+    # Fraction of emails sent as multipart text and HTML
+    html: float = 0.4
+    seed: int = 1
+
+
+# (sender, subject template, body sentence) of the kinds of mail a real
+# inbox gets; {n} is replaced by a per-email number
+_MAIL_KINDS = [
+    ("news@digest.example.com", "Weekly digest #{n}", "Top stories this week"),
+    ("orders@shop.example.com", "Your order {n} has shipped", "Track your parcel"),
+    ("receipts@pay.example.net", "Receipt for payment {n}", "Thanks for paying"),
+    ("alerts@bank.example.org", "Security alert {n}", "New sign-in detected"),
+    ("noreply@social.example.com", "{n} people viewed your profile", "See who"),
+    ("promo@deals.example.com", "{n}% off everything today", "Limited offer"),
+    ("ci@build.example.dev", "Build {n} failed on main", "Pipeline failed"),
+    ("alice@friends.example.org", "Re: dinner on the {n}th?", "Sounds good to me"),
+    ("boss@work.example.com", "Quarterly planning {n}", "Please review the doc"),
+    ("calendar@work.example.com", "Invitation: sync {n}", "You have been invited"),
+]
+
+
+def synthetic_mailbox(spec: MailboxSpec) -> List[bytes]:
+    """Generate spec.size RFC 5322 messages, oldest first"""
+    rng = random.Random(spec.seed)
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    messages = []
+    for index in range(spec.size):
+        sender, subject, sentence = rng.choice(_MAIL_KINDS)
+        number = rng.randint(1, 99)
+        words = " ".join(
+            rng.choice(sentence.split()) for _ in range(rng.randint(20, 200))
+        )
+        footer = f"--\nUnsubscribe: https://example.com/u/{index}\n"
+        body = f"{sentence}.\n\n{words}\n\n{footer}"
+
+        message = EmailMessage()
+        message["Subject"] = subject.format(n=number)
+        message["From"] = f"{sender.split('@')[0].title()} <{sender}>"
+        message["To"] = "me@example.com"
+        message["Date"] = format_datetime(start + timedelta(minutes=index))
+        message["Message-ID"] = f"<{index}.{spec.seed}@bench.example.com>"
+        if sender.startswith(("news", "promo")):
+            message["List-Id"] = f"<{sender.split('@')[1]}>"
+        message.set_content(body)
+        if rng.random() < spec.html:
+            message.add_alternative(f"<html><body><p>{body}</p></body></html>", "html")
+        if rng.random() < spec.attachments:
+            message.add_attachment(
+                rng.randbytes(spec.attachment_kb * 1024),
+                maintype="application",
+                subtype="pdf",
+                filename=f"document-{index}.pdf",
+            )
+        messages.append(message.as_bytes(policy=policy.SMTP))
+    return messages
+
+
+def _text_of(message) -> Tuple[str, bool]:
+    """The first text part of a parsed message, and whether it is HTML"""
+    html = None
+    for part in message.walk():
+        if part.get_content_maintype() != "text" or part.get_filename():
+            continue
+        text = part.get_payload(decode=True).decode(
+            part.get_content_charset() or "utf-8", "replace"
+        )
+        if part.get_content_subtype() == "plain":
+            return text, False
+        html = html or text
+    return html or "", html is not None
+
+
+# ============================================================================
+# IMAP STAND-IN
+# ============================================================================
+
+
+class IMAPMessage:
+    def __init__(self, uid: int, raw: bytes, modseq: int):
+        self.uid = uid
+        self.raw = raw
+        self.flags: set = set()
+        self.modseq = modseq
+        self._structure: Optional[str] = None
+
+    @property
+    def parsed(self):
+        return message_from_bytes(self.raw, policy=policy.compat32)
+
+    def bodystructure(self) -> str:
+        if self._structure is None:
+            self._structure = _bodystructure(self.parsed)
+        return self._structure
+
+
+class IMAPFolder:
+    def __init__(self, name: str):
+        self.name = name
+        self.uidvalidity = 1
+        self.uidnext = 1
+        self.highestmodseq = 1
+        self.messages: List[IMAPMessage] = []
+
+    def append(self, raw: bytes, flags=()) -> IMAPMessage:
+        self.highestmodseq += 1
+        message = IMAPMessage(self.uidnext, raw, self.highestmodseq)
+        message.flags.update(flags)
+        self.uidnext += 1
+        self.messages.append(message)
+        return message
+
+
+class IMAPStore:
+    """Folders shared by all connections, with traffic counters"""
+
+    CAPABILITIES = ("IMAP4rev1", "UIDPLUS", "MOVE", "CONDSTORE", "ENABLE", "IDLE")
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        # Notified when mail is delivered, for connections in IDLE
+        self.delivered = threading.Condition(self.lock)
+        self.folders = {"INBOX": IMAPFolder("INBOX")}
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.commands = 0
+
+    def folder(self, name: str) -> IMAPFolder:
+        if name.upper() == "INBOX":
+            name = "INBOX"
+        return self.folders.setdefault(name, IMAPFolder(name))
+
+    def deliver(self, raw: bytes, folder: str = "INBOX") -> IMAPMessage:
+        """Add new mail, as another client or the MTA would"""
+        with self.delivered:
+            message = self.folder(folder).append(raw)
+            self.delivered.notify_all()
+        return message
+
+
+_IMAP_ATOM = re.compile(r"[^ ()\[]+(\[[^\]]*\](<[\d.]+>)?)?")
+
+
+def _imap_tokens(data: str) -> List[Any]:
+    """Parse IMAP command arguments into nested lists of strings"""
+    stack: List[List[Any]] = [[]]
+    pos = 0
+    while pos < len(data):
+        char = data[pos]
+        if char == " ":
+            pos += 1
+        elif char == "(":
+            stack.append([])
+            pos += 1
+        elif char == ")":
+            done = stack.pop()
+            stack[-1].append(done)
+            pos += 1
+        elif char == '"':
+            end = pos + 1
+            value = ""
+            while data[end] != '"':
+                if data[end] == "\\":
+                    end += 1
+                value += data[end]
+                end += 1
+            stack[-1].append(value)
+            pos = end + 1
+        else:
+            match = _IMAP_ATOM.match(data, pos)
+            stack[-1].append(match.group(0))
+            pos = match.end()
+    return stack[0]
+
+
+def _imap_set(spec: str, maximum: int) -> set:
+    values = set()
+    for part in spec.split(","):
+        low, _, high = part.partition(":")
+        low = maximum if low == "*" else int(low)
+        high = low if not high else maximum if high == "*" else int(high)
+        values.update(range(min(low, high), max(low, high) + 1))
+    return values
+
+
+def _quote(value: Optional[str]) -> str:
+    if value is None:
+        return "NIL"
+    return '"' + str(value).replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def _split_raw(raw: bytes) -> Tuple[bytes, bytes]:
+    for separator in (b"\r\n\r\n", b"\n\n"):
+        if separator in raw:
+            head, body = raw.split(separator, 1)
+            return head + separator, body
+    return raw, b""
+
+
+def _bodystructure(part) -> str:
+    if part.is_multipart():
+        parts = "".join(_bodystructure(p) for p in part.get_payload())
+        return f"({parts} {_quote(part.get_content_subtype().upper())})"
+    maintype = part.get_content_maintype().upper()
+    params = part.get_params() or []
+    names = " ".join(f"{_quote(k.upper())} {_quote(v)}" for k, v in params[1:])
+    encoding = (part.get("Content-Transfer-Encoding") or "7BIT").upper()
+    _, body = _split_raw(part.as_bytes())
+    structure = (
+        f"({_quote(maintype)} {_quote(part.get_content_subtype().upper())} "
+        f"{f'({names})' if names else 'NIL'} NIL NIL {_quote(encoding)} {len(body)}"
+    )
+    if maintype == "TEXT":
+        lines = body.count(b"\n")
+        structure += f" {lines}"
+    disposition = part.get_content_disposition()
+    if disposition:
+        # Extension data: MD5, then the disposition and its parameters
+        params = part.get_params(header="content-disposition") or []
+        names = " ".join(f"{_quote(k.upper())} {_quote(v)}" for k, v in params[1:])
+        structure += (
+            f" NIL ({_quote(disposition.upper())} {f'({names})' if names else 'NIL'})"
+        )
+    return structure + ")"
+
+
+def _section(message: IMAPMessage, section: str) -> bytes:
+    head, body = _split_raw(message.raw)
+    upper = section.upper()
+    if upper == "":
+        return message.raw
+    if upper == "HEADER":
+        return head
+    if upper == "TEXT":
+        return body
+    fields = re.match(r"HEADER\.FIELDS(\.NOT)? \((.*)\)", upper)
+    if fields:
+        wanted = set(fields.group(2).split())
+        lines = re.split(rb"\r?\n(?=\S)", head.rstrip(b"\r\n"))
+        kept = [
+            line
+            for line in lines
+            if (line.split(b":", 1)[0].decode().upper() in wanted)
+            != bool(fields.group(1))
+        ]
+        return b"".join(line + b"\r\n" for line in kept) + b"\r\n"
+    part = message.parsed
+    if not part.is_multipart():
+        return body if section == "1" else b""
+    for index in section.split("."):
+        if not part.is_multipart():
+            return b""
+        part = part.get_payload()[int(index) - 1]
+    return _split_raw(part.as_bytes())[1]
+
+
+class _IMAPHandler(socketserver.StreamRequestHandler):
+    """Serves the subset of IMAP4rev1 that IMAPProvider uses
+
+    Like a real server, mail delivered to the selected folder since the
+    last response is announced with an untagged EXISTS before the next
+    command's response, or straight away while in IDLE.
+    """
+
+    def send(self, data):
+        if isinstance(data, str):
+            data = data.encode()
+        self.server.store.bytes_sent += len(data)
+        self.wfile.write(data)
+
+    def handle(self):
+        self.store = self.server.store
+        self.selected: Optional[IMAPFolder] = None
+        # Messages in the selected folder the client has been told about
+        self.reported = 0
+        self.send("* OK benchmark IMAP server ready\r\n")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            self.store.bytes_received += len(line)
+            line = line.decode().rstrip("\r\n")
+            tag, _, rest = line.partition(" ")
+            command, _, args = rest.partition(" ")
+            uid = command.upper() == "UID"
+            if uid:
+                command, _, args = args.partition(" ")
+            handler = getattr(self, f"cmd_{command.lower()}", None)
+            with self.store.lock:
+                self.store.commands += 1
+                if command.upper() != "IDLE":
+                    self._report_exists()
+                if handler is None:
+                    self.send(f"{tag} BAD unknown command\r\n")
+                elif handler(tag, args, uid) == "BYE":
+                    self.wfile.flush()
+                    return
+            self.wfile.flush()
+
+    def _report_exists(self):
+        if self.selected is None:
+            return
+        count = len(self.selected.messages)
+        if count > self.reported:
+            self.send(f"* {count} EXISTS\r\n")
+        self.reported = count
+
+    def cmd_idle(self, tag, args, uid):
+        # Runs under the store lock, which waiting on delivered releases
+        self.send("+ idling\r\n")
+        while not select.select([self.connection], [], [], 0)[0]:
+            self._report_exists()
+            self.wfile.flush()
+            self.store.delivered.wait(0.05)
+        if self.rfile.readline().strip().upper() != b"DONE":
+            self.send(f"{tag} BAD expected DONE\r\n")
+            return
+        self.send(f"{tag} OK idle done\r\n")
+
+    def cmd_capability(self, tag, args, uid):
+        self.send(f"* CAPABILITY {' '.join(self.store.CAPABILITIES)}\r\n")
+        self.send(f"{tag} OK done\r\n")
+
+    def cmd_login(self, tag, args, uid):
+        self.send(f"{tag} OK logged in\r\n")
+
+    def cmd_enable(self, tag, args, uid):
+        self.send(f"* ENABLED {args}\r\n{tag} OK enabled\r\n")
+
+    def cmd_noop(self, tag, args, uid):
+        self.send(f"{tag} OK noop\r\n")
+
+    def cmd_logout(self, tag, args, uid):
+        self.send(f"* BYE bye\r\n{tag} OK logout\r\n")
+        return "BYE"
+
+    def cmd_list(self, tag, args, uid):
+        for name in self.store.folders:
+            self.send(f'* LIST (\\HasNoChildren) "/" {_quote(name)}\r\n')
+        self.send(f"{tag} OK list\r\n")
+
+    def cmd_select(self, tag, args, uid):
+        folder = self.store.folder(_imap_tokens(args)[0])
+        self.selected = folder
+        self.reported = len(folder.messages)
+        self.send(
+            f"* FLAGS (\\Seen \\Deleted \\Flagged)\r\n"
+            f"* {len(folder.messages)} EXISTS\r\n* 0 RECENT\r\n"
+            f"* OK [UIDVALIDITY {folder.uidvalidity}] uids valid\r\n"
+            f"* OK [UIDNEXT {folder.uidnext}] next uid\r\n"
+            f"* OK [HIGHESTMODSEQ {folder.highestmodseq}] modseq\r\n"
+            f"{tag} OK [READ-WRITE] selected\r\n"
+        )
+
+    def _resolve(self, spec: str, uid: bool) -> List[Tuple[int, IMAPMessage]]:
+        messages = self.selected.messages
+        if uid:
+            wanted = _imap_set(spec, messages[-1].uid if messages else 0)
+            return [(i + 1, m) for i, m in enumerate(messages) if m.uid in wanted]
+        wanted = _imap_set(spec, len(messages))
+        return [(i + 1, m) for i, m in enumerate(messages) if i + 1 in wanted]
+
+    def cmd_search(self, tag, args, uid):
+        tokens = _imap_tokens(args)
+        matches = list(enumerate(self.selected.messages, 1))
+        index = 0
+        while index < len(tokens):
+            token = tokens[index].upper()
+            if token == "UID":
+                index += 1
+                wanted = {m.uid for _, m in self._resolve(tokens[index], True)}
+                matches = [(n, m) for n, m in matches if m.uid in wanted]
+            elif token == "MODSEQ":
+                index += 1
+                matches = [(n, m) for n, m in matches if m.modseq >= int(tokens[index])]
+            elif token == "UNSEEN":
+                matches = [(n, m) for n, m in matches if "\\Seen" not in m.flags]
+            index += 1
+        found = "".join(f" {m.uid if uid else n}" for n, m in matches)
+        self.send(f"* SEARCH{found}\r\n{tag} OK search\r\n")
+
+    def cmd_fetch(self, tag, args, uid):
+        spec, _, items = args.partition(" ")
+        tokens = _imap_tokens(items)
+        if tokens and isinstance(tokens[0], list):
+            tokens = tokens[0]
+        items = [token for token in tokens if isinstance(token, str)]
+        for number, message in self._resolve(spec, uid):
+            parts: List[Any] = [f"UID {message.uid}"] if uid else []
+            for item in items:
+                upper = item.upper()
+                if upper == "UID" and not uid:
+                    parts.append(f"UID {message.uid}")
+                elif upper == "FLAGS":
+                    parts.append(f"FLAGS ({' '.join(sorted(message.flags))})")
+                elif upper == "RFC822.SIZE":
+                    parts.append(f"RFC822.SIZE {len(message.raw)}")
+                elif upper == "BODYSTRUCTURE":
+                    parts.append(f"BODYSTRUCTURE {message.bodystructure()}")
+                elif upper.startswith("BODY"):
+                    match = re.match(
+                        r"BODY(\.PEEK)?\[([^\]]*)\](?:<(\d+)\.(\d+)>)?", item, re.I
+                    )
+                    data = _section(message, match.group(2))
+                    name = f"BODY[{match.group(2)}]"
+                    if match.group(3) is not None:
+                        offset, count = int(match.group(3)), int(match.group(4))
+                        data = data[offset : offset + count]
+                        name += f"<{offset}>"
+                    parts.append((name, data))
+                    if not match.group(1):
+                        message.flags.add("\\Seen")
+            response = f"* {number} FETCH (".encode()
+            for position, part in enumerate(parts):
+                separator = b" " if position else b""
+                if isinstance(part, tuple):
+                    name, data = part
+                    response += (
+                        separator + f"{name} {{{len(data)}}}\r\n".encode() + data
+                    )
+                else:
+                    response += separator + part.encode()
+            self.send(response + b")\r\n")
+        self.send(f"{tag} OK fetch\r\n")
+
+    def cmd_store(self, tag, args, uid):
+        spec, _, rest = args.partition(" ")
+        tokens = _imap_tokens(rest)
+        mode = tokens[0].upper()
+        flags = set(tokens[1] if isinstance(tokens[1], list) else tokens[1:])
+        for number, message in self._resolve(spec, uid):
+            if mode.startswith("+"):
+                message.flags |= flags
+            elif mode.startswith("-"):
+                message.flags -= flags
+            else:
+                message.flags = set(flags)
+            self.selected.highestmodseq += 1
+            message.modseq = self.selected.highestmodseq
+            if not mode.endswith(".SILENT"):
+                self.send(
+                    f"* {number} FETCH (FLAGS ({' '.join(sorted(message.flags))}))\r\n"
+                )
+        self.send(f"{tag} OK store\r\n")
+
+    def cmd_copy(self, tag, args, uid, move=False):
+        spec, _, destination = args.partition(" ")
+        target = self.store.folder(_imap_tokens(destination)[0])
+        chosen = [m for _, m in self._resolve(spec, uid)]
+        for message in chosen:
+            target.append(message.raw, message.flags - {"\\Deleted"})
+        if move:
+            self._expunge(chosen)
+        self.send(f"{tag} OK {'move' if move else 'copy'}\r\n")
+
+    def cmd_move(self, tag, args, uid):
+        if "MOVE" not in self.store.CAPABILITIES:
+            self.send(f"{tag} BAD unknown command\r\n")
+            return
+        self.cmd_copy(tag, args, uid, move=True)
+
+    def _expunge(self, victims: List[IMAPMessage]):
+        messages = self.selected.messages
+        doomed = {id(v) for v in victims}
+        for index in range(len(messages) - 1, -1, -1):
+            if id(messages[index]) in doomed:
+                del messages[index]
+                self.reported -= 1
+                self.send(f"* {index + 1} EXPUNGE\r\n")
+
+    def cmd_expunge(self, tag, args, uid):
+        if uid and "UIDPLUS" not in self.store.CAPABILITIES:
+            self.send(f"{tag} BAD unknown command\r\n")
+            return
+        victims = [m for m in self.selected.messages if "\\Deleted" in m.flags]
+        if uid:
+            allowed = {m.uid for _, m in self._resolve(args.strip(), True)}
+            victims = [m for m in victims if m.uid in allowed]
+        self._expunge(victims)
+        self.send(f"{tag} OK expunge\r\n")
+
+
+class FakeIMAPServer(socketserver.ThreadingTCPServer):
+    """In-process IMAP server on an ephemeral localhost port"""
+
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, messages: List[bytes], folder: str = "INBOX"):
+        super().__init__(("127.0.0.1", 0), _IMAPHandler)
+        self.store = IMAPStore()
+        for raw in messages:
+            self.store.folder(folder).append(raw)
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+    def traffic(self) -> Dict[str, int]:
+        return {
+            "sent": self.store.bytes_sent,
+            "received": self.store.bytes_received,
+            "requests": self.store.commands,
+        }
+
+
+# ============================================================================
+# HTTP STAND-INS
+# ============================================================================
+
+
+class _JSONHandler(BaseHTTPRequestHandler):
+    """JSON request/response plumbing with traffic counting"""
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def read_json(self) -> Any:
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length)
+        self.server.count(len(self.requestline) + len(str(self.headers)) + length)
+        return json.loads(body) if body else None
+
+    def reply(self, status: int, body: Any = None):
+        data = json.dumps(body).encode() if body is not None else b""
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+        self.server.count(0, len(data))
+
+    def do_GET(self):
+        self.read_json()
+        self.reply(*self.server.route("GET", self.path, None, self.headers))
+
+    def do_POST(self):
+        body = self.read_json()
+        self.reply(*self.server.route("POST", self.path, body, self.headers))
+
+    def do_PATCH(self):
+        body = self.read_json()
+        self.reply(*self.server.route("PATCH", self.path, body, self.headers))
+
+    def do_DELETE(self):
+        self.read_json()
+        self.reply(*self.server.route("DELETE", self.path, None, self.headers))
+
+
+class _JSONServer(ThreadingHTTPServer, ABC):
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _JSONHandler)
+        self._lock = threading.Lock()
+        self.bytes_received = 0
+        self.bytes_sent = 0
+        self.requests = 0
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def count(self, received: int, sent: int = 0):
+        with self._lock:
+            if received:
+                self.requests += 1
+            self.bytes_received += received
+            self.bytes_sent += sent
+
+    def traffic(self) -> Dict[str, int]:
+        return {
+            "sent": self.bytes_sent,
+            "received": self.bytes_received,
+            "requests": self.requests,
+        }
+
+    @abstractmethod
+    def route(self, method: str, path: str, body: Any, headers) -> Tuple[int, Any]:
+        """Status and JSON body answering a request"""
+
+
+class FakeGraphServer(_JSONServer):
+    """Stub of the Microsoft Graph mail endpoints Office365Provider calls"""
+
+    def __init__(self, messages: List[bytes], folder: str = "inbox"):
+        super().__init__()
+        self.messages: Dict[str, Dict[str, Any]] = {}
+        self.folders: Dict[str, str] = {}
+        for index, raw in enumerate(messages):
+            message_id = f"AAMkBench{index:08d}"
+            self.messages[message_id] = self._resource(message_id, raw, index)
+            self.folders[message_id] = folder
+
+    @property
+    def url(self) -> str:
+        return f"{super().url}/v1.0"
+
+    @staticmethod
+    def folder_id(name: str) -> str:
+        """The id Graph gives a folder, unlike the name requests use"""
+        return f"AAMkFolder-{name}"
+
+    @staticmethod
+    def _resource(message_id: str, raw: bytes, index: int) -> Dict[str, Any]:
+        parsed = message_from_bytes(raw, policy=policy.default)
+        name, address = parseaddr(str(parsed["From"]))
+        text, _ = _text_of(parsed)
+        received = datetime(2024, 1, 1, tzinfo=timezone.utc) + timedelta(minutes=index)
+        return {
+            "id": message_id,
+            "subject": str(parsed["Subject"]),
+            "from": {"emailAddress": {"name": name, "address": address}},
+            "bodyPreview": " ".join(text.split())[:255],
+            "body": {"contentType": "text", "content": text},
+            "receivedDateTime": received.strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "isRead": False,
+            "internetMessageHeaders": [
+                {"name": key, "value": str(value)} for key, value in parsed.items()
+            ],
+        }
+
+    def route(self, method, path, body, headers):
+        url = urlparse(path)
+        route = url.path.removeprefix("/v1.0")
+        query = parse_qs(url.query)
+        if route == "/$batch":
+            responses = []
+            for request in body["requests"]:
+                status, data = self.route(
+                    request["method"], request["url"], request.get("body"), {}
+                )
+                responses.append({"id": request["id"], "status": status, "body": data})
+            return 200, {"responses": responses}
+        with self._lock:
+            return self._route(method, route, query, body)
+
+    def _route(self, method, route, query, body):
+        if route == "/me/mailFolders":
+            folders = sorted(set(self.folders.values()))
+            return 200, {
+                "value": [{"id": self.folder_id(f), "displayName": f} for f in folders]
+            }
+        folder = re.fullmatch(r"/me/mailFolders/([^/]+)", route)
+        if folder and method == "GET":
+            name = folder.group(1)
+            return 200, {"id": self.folder_id(name), "displayName": name}
+        listing = re.fullmatch(r"/me/mailFolders/([^/]+)/messages", route)
+        if listing and method == "GET":
+            folder = listing.group(1)
+            top = int(query.get("$top", ["10"])[0])
+            skip = int(query.get("$skip", ["0"])[0])
+            fields = query.get("$select", [""])[0].split(",")
+            found = sorted(
+                (m for i, m in self.messages.items() if self.folders[i] == folder),
+                key=lambda m: m["receivedDateTime"],
+                reverse=True,
+            )
+            page = [
+                {k: v for k, v in m.items() if not fields[0] or k in fields}
+                for m in found[skip : skip + top]
+            ]
+            result: Dict[str, Any] = {"value": page}
+            if skip + top < len(found):
+                result["@odata.nextLink"] = (
+                    f"{self.url}/me/mailFolders/{folder}/messages"
+                    f"?$top={top}&$skip={skip + top}&$select={','.join(fields)}"
+                )
+            return 200, result
+        item = re.fullmatch(r"/me/messages/([^/]+)(/move)?", route)
+        if item:
+            message_id = item.group(1)
+            if message_id not in self.messages:
+                return 404, {"error": {"code": "ErrorItemNotFound"}}
+            if item.group(2) and method == "POST":
+                self.folders[message_id] = body["destinationId"]
+                return 201, self.messages[message_id]
+            if method == "PATCH":
+                self.messages[message_id].update(body)
+                return 200, self.messages[message_id]
+            if method == "DELETE":
+                del self.messages[message_id], self.folders[message_id]
+                return 204, None
+            parent = self.folder_id(self.folders[message_id])
+            return 200, dict(self.messages[message_id], parentFolderId=parent)
+        return 400, {"error": {"message": f"Unsupported {method} {route}"}}
+
+
+_DECISIONS = [
+    ("archive", 40),
+    ("keep_inbox", 30),
+    ("mark_read", 15),
+    ("delete", 10),
+    ("move_folder", 5),
+]
+_EMAIL_ID = re.compile(r"^\[(\d+)\]$", re.MULTILINE)
+
+
+class FakeLLMServer(_JSONServer):
+    """Fake LLM answering categorization requests in three wire formats
+
+    Serves Ollama (/api/generate), Anthropic (/v1/messages) and OpenAI
+    (/v1/chat/completions). Each email gets a decision and confidence
+    derived from a hash of its text, so runs are repeatable. Every request
+    takes latency plus per_email per email in it, plus up to jitter more;
+    at most concurrency requests are served at once (0 for no limit).
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.2,
+        jitter: float = 0.05,
+        per_email: float = 0.0,
+        concurrency: int = 0,
+        seed: int = 1,
+    ):
+        super().__init__()
+        self.latency = latency
+        self.jitter = jitter
+        self.per_email = per_email
+        self._slots = threading.Semaphore(concurrency) if concurrency else None
+        self._random = random.Random(seed)
+        self._prefixes: set = set()
+        self.calls: Dict[str, int] = {"ollama": 0, "anthropic": 0, "openai": 0}
+
+    def route(self, method, path, body, headers):
+        route = urlparse(path).path
+        if route == "/api/tags":
+            return 200, {"models": [{"name": "bench"}]}
+        if route == "/api/generate":
+            api, system, content = "ollama", body.get("system", ""), body["prompt"]
+        elif route == "/v1/messages":
+            system = "".join(block["text"] for block in body.get("system") or [])
+            api, content = "anthropic", _message_text(body["messages"][-1])
+        elif route == "/v1/chat/completions":
+            system = "".join(
+                m["content"] for m in body["messages"] if m["role"] == "system"
+            )
+            api, content = "openai", _message_text(body["messages"][-1])
+        else:
+            return 404, {"error": {"message": f"Unsupported {method} {route}"}}
+
+        text, emails = self._answer(content)
+        with self._lock:
+            self.calls[api] += 1
+            cached = system in self._prefixes
+            self._prefixes.add(system)
+            delay = self.latency + self.per_email * emails
+            delay += self._random.random() * self.jitter
+        if self._slots:
+            with self._slots:
+                time.sleep(delay)
+        else:
+            time.sleep(delay)
+
+        prefix, prompt, output = len(system) // 4, len(content) // 4, len(text) // 4
+        if api == "ollama":
+            return 200, {
+                "model": body["model"],
+                "response": text,
+                "done": True,
+                "prompt_eval_count": prompt + (0 if cached else prefix),
+                "eval_count": output,
+            }
+        if api == "anthropic":
+            return 200, {
+                "id": "msg_bench",
+                "type": "message",
+                "role": "assistant",
+                "model": body["model"],
+                "content": [{"type": "text", "text": text}],
+                "stop_reason": "end_turn",
+                "usage": {
+                    "input_tokens": prompt,
+                    "cache_read_input_tokens": prefix if cached else 0,
+                    "cache_creation_input_tokens": 0 if cached else prefix,
+                    "output_tokens": output,
+                },
+            }
+        return 200, {
+            "id": "chatcmpl-bench",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body["model"],
+            "choices": [
+                {
+                    "index": 0,
+                    "message": {"role": "assistant", "content": text},
+                    "finish_reason": "stop",
+                }
+            ],
+            "usage": {
+                "prompt_tokens": prefix + prompt,
+                "completion_tokens": output,
+                "total_tokens": prefix + prompt + output,
+                "prompt_tokens_details": {"cached_tokens": prefix if cached else 0},
+            },
+        }
+
+    def _answer(self, content: str) -> Tuple[str, int]:
+        """JSON answer for a single or batch request, and its email count"""
+        ids = _EMAIL_ID.findall(content)
+        if not ids:
+            return json.dumps(_decide(content)), 1
+        blocks = _EMAIL_ID.split(content)[1:]
+        results = [
+            {"id": ids[i], **_decide(blocks[2 * i + 1])} for i in range(len(ids))
+        ]
+        return json.dumps({"results": results}), len(ids)
+
+
+def _message_text(message: Dict[str, Any]) -> str:
+    content = message["content"]
+    if isinstance(content, str):
+        return content
+    return "".join(block.get("text", "") for block in content)
+
+
+def _decide(text: str) -> Dict[str, Any]:
+    """A repeatable decision for one email's text"""
+    digest = zlib.crc32(text.encode())
+    pick = digest % 100
+    for action, weight in _DECISIONS:
+        if pick < weight:
+            break
+        pick -= weight
+    return {
+        "action": action,
+        "reason": "benchmark decision",
+        "folder": "Bench" if action == "move_folder" else None,
+        "confidence": round(0.5 + (digest >> 8) % 50 / 100, 2),
+    }
+
+
+# ============================================================================
+# MEASUREMENT
+# ============================================================================
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """The q-th percentile (0-100) of values, linearly interpolated"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * q / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def peak_rss_mb() -> Optional[float]:
+    """Peak resident set size of this process so far"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+class LatencyRecorder:
+    """Time each email from being fetched to its decision being reported"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.fetched: Dict[Tuple[str, str], float] = {}
+        self.latencies: List[float] = []
+
+    def attach(self, assistant):
+        provider = assistant.email_provider
+        fetch = provider.iter_emails
+        report = assistant._report_decision
+
+        def iter_emails(*args, **kwargs):
+            for email in fetch(*args, **kwargs):
+                with self._lock:
+                    self.fetched[(email.folder, email.id)] = time.perf_counter()
+                yield email
+
+        def report_decision(position, email, category, label=None):
+            with self._lock:
+                start = self.fetched.pop((email.folder, email.id), None)
+                if start is not None:
+                    self.latencies.append(time.perf_counter() - start)
+            return report(position, email, category, label=label)
+
+        provider.iter_emails = iter_emails
+        assistant._report_decision = report_decision
+
+    def summary(self) -> Dict[str, Optional[float]]:
+        def ms(value):
+            return round(value * 1000, 2) if value is not None else None
+
+        return {
+            "p50": ms(percentile(self.latencies, 50)),
+            "p95": ms(percentile(self.latencies, 95)),
+            "p99": ms(percentile(self.latencies, 99)),
+            "max": ms(max(self.latencies, default=None)),
+        }
+
+
+def model_usage(model) -> Dict[str, Any]:
+    """Token usage of the model, per tier for a cascade"""
+    if hasattr(model, "tiers"):
+        return {tier.name: tier.model.usage.counts for tier in model.tiers}
+    return model.usage.counts
+
+
+def git_revision() -> Optional[str]:
+    try:
+        result = subprocess.run(
+            ["git", "describe", "--always", "--dirty"],
+            cwd=SCRIPT_DIR,
+            capture_output=True,
+            text=True,
+            timeout=10,
+        )
+        return result.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+# Packages the assistant should only import for the backends that use them
+LAZY_PACKAGES = ("anthropic", "openai", "msal", "requests", "yaml", "numpy")
+
+
+def parse_importtime(output: str) -> Dict[str, int]:
+    """Cumulative microseconds of each top-level import in -X importtime output"""
+    imports = {}
+    for line in output.splitlines():
+        match = re.match(r"import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)", line)
+        if match and not match.group(3):
+            imports[match.group(4)] = int(match.group(2))
+    return imports
+
+
+def time_startup(command: List[str], runs: int) -> Dict[str, Any]:
+    """Wall time of runs invocations of command, then one under -X importtime"""
+    walls = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(command, capture_output=True, check=True, timeout=120)
+        walls.append((time.perf_counter() - start) * 1000)
+    traced = subprocess.run(
+        [command[0], "-X", "importtime", *command[1:]],
+        capture_output=True,
+        text=True,
+        timeout=120,
+    )
+    imports = parse_importtime(traced.stderr)
+    slowest = sorted(imports.items(), key=lambda item: -item[1])[:10]
+    return {
+        "wall_ms": {
+            "min": round(min(walls), 1),
+            "p50": round(percentile(walls, 50), 1),
+            "max": round(max(walls), 1),
+        },
+        "import_ms": round(sum(imports.values()) / 1000, 1),
+        "slowest_imports": [
+            {"module": name, "ms": round(us / 1000, 1)} for name, us in slowest
+        ],
+        "packages_imported": [
+            name
+            for name in LAZY_PACKAGES
+            if re.search(rf"\| \s*{name}(\.\S+)?$", traced.stderr, re.M)
+        ],
+    }
+
+
+# ============================================================================
+# BENCHMARK
+# ============================================================================
+
+
+def bench_config(
+    args: argparse.Namespace,
+    mail: Any,
+    llm: FakeLLMServer,
+    state_dir: str,
+) -> Dict[str, Any]:
+    """Assistant settings pointing at the stand-ins, over any --config file"""
+    settings: Dict[str, Any] = {}
+    if args.config:
+        with open(args.config) as f:
+            settings = yaml.safe_load(f) or {}
+    settings.pop("accounts", None)
+
+    if args.provider == "imap":
+        settings["email"] = {
+            "provider": "imap",
+            "username": "bench",
+            "password": "bench",
+            "imap": {
+                "host": "127.0.0.1",
+                "port": mail.port,
+                "ssl": False,
+                "parse_workers": args.parse_workers,
+            },
+        }
+    else:
+        settings["email"] = {
+            "provider": "office365",
+            "office365": {"client_id": "bench", "graph_url": mail.url},
+        }
+
+    ai = settings.setdefault("ai", {})
+    ai["model"] = args.llm
+    ai["ollama"] = {**ai.get("ollama", {}), "url": llm.url}
+    ai["anthropic"] = {
+        **ai.get("anthropic", {}),
+        "api_key": "bench",
+        "base_url": llm.url,
+    }
+    ai["openai"] = {
+        **ai.get("openai", {}),
+        "api_key": "bench",
+        "base_url": f"{llm.url}/v1",
+    }
+
+    # Keep the run's history and state away from the real ones
+    settings.setdefault("classifier", {})["history_path"] = f"{state_dir}/history.jsonl"
+    settings.setdefault("sync", {})["path"] = f"{state_dir}/sync.json"
+    settings.setdefault("cache", {})["path"] = f"{state_dir}/cache.sqlite3"
+    return settings
+
+
+def run_benchmark(args: argparse.Namespace) -> Dict[str, Any]:
+    """Run one benchmark and return its results"""
+    assistant_module = load_assistant()
+
+    spec = MailboxSpec(
+        size=args.emails,
+        attachments=args.attachments,
+        attachment_kb=args.attachment_kb,
+        html=args.html,
+        seed=args.seed,
+    )
+    messages = synthetic_mailbox(spec)
+    llm = FakeLLMServer(
+        latency=args.llm_latency / 1000,
+        jitter=args.llm_jitter / 1000,
+        per_email=args.llm_per_email / 1000,
+        concurrency=args.llm_concurrency,
+        seed=args.seed,
+    )
+    if args.provider == "imap":
+        mail = FakeIMAPServer(messages)
+        folder = "INBOX"
+    else:
+        mail = FakeGraphServer(messages)
+        folder = "inbox"
+        # The stub needs no token, so skip the MSAL sign-in
+        assistant_module.Office365Provider._authenticate = lambda self, **_: setattr(
+            self, "access_token", "bench"
+        )
+    del messages
+
+    with TemporaryDirectory() as state_dir:
+        config = assistant_module.Config.from_dict(
+            bench_config(args, mail, llm, state_dir)
+        )
+        assistant = assistant_module.EmailAssistant(
+            config,
+            dry_run=not args.execute,
+            workers=args.workers,
+            batch_size=args.batch_size,
+            use_cache=args.cache,
+            incremental=False,
+        )
+        recorder = LatencyRecorder()
+        recorder.attach(assistant)
+
+        baseline_rss = peak_rss_mb()
+        start = time.perf_counter()
+        summary = assistant.process_emails(folder=folder, limit=args.emails)
+        elapsed = time.perf_counter() - start
+
+    mail_traffic, llm_traffic = mail.traffic(), llm.traffic()
+    mail.shutdown()
+    llm.shutdown()
+
+    return {
+        "revision": git_revision(),
+        "time": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "parameters": {
+            "provider": args.provider,
+            "llm": args.llm,
+            "mailbox": asdict(spec),
+            "workers": assistant.workers,
+            "batch_size": assistant.batch_size,
+            "parse_workers": args.parse_workers,
+            "execute": args.execute,
+            "cache": args.cache,
+            "llm_latency_ms": args.llm_latency,
+            "llm_jitter_ms": args.llm_jitter,
+            "llm_per_email_ms": args.llm_per_email,
+            "llm_concurrency": args.llm_concurrency,
+            "config": args.config,
+        },
+        "emails": summary.total,
+        "seconds": round(elapsed, 3),
+        "emails_per_sec": round(summary.total / elapsed, 2) if elapsed else None,
+        "latency_ms": recorder.summary(),
+        # Seen from the assistant: downloaded is what the stand-ins sent
+        "bytes": {
+            "mail_downloaded": mail_traffic["sent"],
+            "mail_uploaded": mail_traffic["received"],
+            "llm_downloaded": llm_traffic["sent"],
+            "llm_uploaded": llm_traffic["received"],
+            "total": sum(
+                mail_traffic[k] + llm_traffic[k] for k in ("sent", "received")
+            ),
+        },
+        "mail_requests": mail_traffic["requests"],
+        "llm_calls": sum(llm.calls.values()),
+        "llm_calls_by_api": llm.calls,
+        "model_usage": model_usage(assistant.ai_model),
+        # The stand-ins run in this process, so both include their memory
+        "rss_mb": {"before_run": baseline_rss, "peak": peak_rss_mb()},
+        "actions": summary.actions,
+    }
+
+
+def startup_benchmark(args: argparse.Namespace) -> Dict[str, Any]:
+    """Time CLI startup for --help and, against the stand-ins, for --test"""
+    commands = {"help": [sys.executable, str(ASSISTANT_PATH), "--help"]}
+    llm = FakeLLMServer(latency=0, jitter=0, seed=args.seed)
+    # Graph sign-in cannot be skipped in a separate process, so --test is
+    # only timed for IMAP
+    mail = None
+    if args.provider == "imap":
+        mail = FakeIMAPServer(synthetic_mailbox(MailboxSpec(size=1)))
+
+    with TemporaryDirectory() as state_dir:
+        if mail:
+            config_path = Path(state_dir) / "config.yaml"
+            config_path.write_text(
+                yaml.safe_dump(bench_config(args, mail, llm, state_dir))
+            )
+            commands["test"] = [
+                sys.executable,
+                str(ASSISTANT_PATH),
+                "--config",
+                str(config_path),
+                "--test",
+            ]
+        startup = {
+            name: time_startup(command, args.startup_runs)
+            for name, command in commands.items()
+        }
+
+    if mail:
+        mail.shutdown()
+    llm.shutdown()
+    return {
+        "revision": git_revision(),
+        "time": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "parameters": {
+            "provider": args.provider,
+            "llm": args.llm,
+            "runs": args.startup_runs,
+        },
+        "startup": startup,
+    }
+
+
+def compare(current: Dict[str, Any], previous: Dict[str, Any]) -> List[str]:
+    """Lines describing how current differs from a previous result"""
+
+    def change(new, old):
+        if new is None or not old:
+            return "n/a"
+        return f"{(new - old) / old:+.1%}"
+
+    lines = [f"Compared with {previous.get('revision') or 'previous run'}:"]
+    if "startup" in current:
+        for name, now in current["startup"].items():
+            before = previous.get("startup", {}).get(name, {})
+            new, old = now["wall_ms"]["p50"], before.get("wall_ms", {}).get("p50")
+            lines.append(f"  {name} startup ms: {old} -> {new} ({change(new, old)})")
+            new, old = now["import_ms"], before.get("import_ms")
+            lines.append(f"  {name} import ms: {old} -> {new} ({change(new, old)})")
+        return lines
+    for label, key in (("emails/sec", "emails_per_sec"), ("llm calls", "llm_calls")):
+        lines.append(
+            f"  {label}: {previous.get(key)} -> {current.get(key)} "
+            f"({change(current.get(key), previous.get(key))})"
+        )
+    for name in ("p50", "p95", "p99"):
+        new = current["latency_ms"].get(name)
+        old = previous.get("latency_ms", {}).get(name)
+        lines.append(f"  {name} latency ms: {old} -> {new} ({change(new, old)})")
+    new, old = current["bytes"]["total"], previous.get("bytes", {}).get("total")
+    lines.append(f"  bytes: {old} -> {new} ({change(new, old)})")
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the email assistant against local stand-ins",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  # 1000 IMAP emails, Ollama format, 200ms +- 50ms per request
+  %(prog)s --emails 1000 --output bench.json
+
+  # Graph provider, Anthropic format, compared with an earlier run
+  %(prog)s --provider office365 --llm anthropic --compare bench.json
+
+  # Assistant settings (processing, clustering, rules...) from a config file
+  %(prog)s --config email-assistant.config.yaml --workers 8
+
+  # CLI startup time and what it imports, compared with an earlier run
+  %(prog)s --startup --compare startup.json
+        """,
+    )
+    parser.add_argument("--provider", choices=["imap", "office365"], default="imap")
+    parser.add_argument(
+        "--llm",
+        choices=["ollama", "anthropic", "openai", "cascade"],
+        default="ollama",
+        help="Wire format of the fake LLM; cascade uses ai.cascade from --config",
+    )
+    parser.add_argument("--emails", type=int, default=500, help="Mailbox size")
+    parser.add_argument(
+        "--attachments",
+        type=float,
+        default=0.1,
+        help="Fraction of emails with an attachment",
+    )
+    parser.add_argument(
+        "--attachment-kb", type=int, default=200, help="Size of each attachment"
+    )
+    parser.add_argument(
+        "--html", type=float, default=0.4, help="Fraction of emails with HTML"
+    )
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument(
+        "--llm-latency", type=float, default=200, help="Milliseconds per request"
+    )
+    parser.add_argument(
+        "--llm-jitter", type=float, default=50, help="Extra random milliseconds"
+    )
+    parser.add_argument(
+        "--llm-per-email",
+        type=float,
+        default=0,
+        help="Extra milliseconds per email in a request",
+    )
+    parser.add_argument(
+        "--llm-concurrency",
+        type=int,
+        default=0,
+        help="Requests the fake LLM serves at once (0 for no limit)",
+    )
+    parser.add_argument("--workers", type=int, help="Classification workers")
+    parser.add_argument("--batch-size", type=int, help="Emails per model request")
+    parser.add_argument(
+        "--parse-workers",
+        type=int,
+        default=0,
+        help="IMAP parser processes, as in backlog mode (default: parse in-process)",
+    )
+    parser.add_argument("--config", help="Assistant config file to take settings from")
+    parser.add_argument(
+        "--execute", action="store_true", help="Apply actions instead of a dry run"
+    )
+    parser.add_argument(
+        "--cache", action="store_true", help="Use the categorization cache"
+    )
+    parser.add_argument(
+        "--startup",
+        action="store_true",
+        help="Measure CLI startup (--help, and --test for IMAP) instead of throughput",
+    )
+    parser.add_argument(
+        "--startup-runs",
+        type=int,
+        default=10,
+        help="Timed invocations per startup command (default: 10)",
+    )
+    parser.add_argument("--output", help="Write results to this JSON file")
+    parser.add_argument("--compare", help="Earlier results JSON file to compare with")
+    parser.add_argument(
+        "--verbose", action="store_true", help="Show the assistant's log output"
+    )
+    args = parser.parse_args()
+
+    # Quiet the assistant and HTTP libraries unless asked, but not this script
+    logging.basicConfig(
+        level=logging.INFO if args.verbose else logging.WARNING,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    )
+    logger.setLevel(logging.INFO)
+    results = startup_benchmark(args) if args.startup else run_benchmark(args)
+
+    text = json.dumps(results, indent=2)
+    if args.output:
+        Path(args.output).write_text(text + "\n")
+        logger.info(f"Results written to {args.output}")
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+        for line in compare(results, previous):
+            logger.info(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -5,27 +5,72 @@ Supports multiple AI models (Ollama, Anthropic, OpenAI) and email providers (Off
 """
 
 import argparse
+import bisect
+import copy
+import cProfile
+import functools
+import gzip
+import hashlib
+import importlib
+import io
 import json
 import logging
 import os
+import pstats
+import queue
+import quopri
+import random
+import re
+import select
+import signal
+import sqlite3
 import sys
+import threading
+import time
+import zlib
 from abc import ABC, abstractmethod
-from dataclasses import dataclass
+from base64 import b64decode, urlsafe_b64encode
+from collections import deque
+from contextlib import contextmanager
+from email import message_from_bytes
+from email.header import decode_header, make_header
+from email.utils import parseaddr, parsedate_to_datetime
+from dataclasses import dataclass, field
 from enum import Enum
+from html.parser import HTMLParser
+from itertools import takewhile
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+)
 
-# Third-party imports (will be in requirements.txt)
-try:
-    import anthropic
-    import openai
+# Third-party packages (in requirements.txt) are imported by the backends
+# that use them, so a run only pays for the SDKs it has configured
+if TYPE_CHECKING:
     import requests
-    import yaml
-    from msal import ConfidentialClientApplication, PublicClientApplication
-except ImportError as e:
-    print(f"Missing required package: {e.name}")
-    print("Run: pip install -r requirements.txt")
-    sys.exit(1)
+
+# Optional: only needed for the local classifier, imported by _load_numpy
+np = None
+
+
+def _load_numpy() -> bool:
+    """Import numpy on first use, returning whether it is installed"""
+    global np
+    if np is None:
+        try:
+            import numpy
+        except ImportError:
+            return False
+        np = numpy
+    return True
 
 
 # Setup logging
@@ -59,6 +104,9 @@ class Email:
     received_datetime: str
     is_read: bool
     folder: Optional[str] = None
+    size: Optional[int] = None
+    # Extra headers requested from the provider, keyed by lower-case name
+    headers: Dict[str, str] = field(default_factory=dict)
 
     def to_summary(self) -> str:
         """Create a summary for AI analysis"""
@@ -78,6 +126,503 @@ class EmailCategory:
     reason: str
     folder: Optional[str] = None
     confidence: Optional[float] = None
+    # What produced the decision: "rule", "cluster", "local", or None for the model
+    source: Optional[str] = None
+
+    ERROR_PREFIX = "Error during categorization"
+
+    @classmethod
+    def for_error(cls, error: Exception) -> "EmailCategory":
+        """Fallback for an email that could not be categorized: leave it alone"""
+        return cls(action=EmailAction.KEEP_INBOX, reason=f"{cls.ERROR_PREFIX}: {error}")
+
+    @property
+    def failed(self) -> bool:
+        """Whether this is the fallback for a failed categorization"""
+        return self.reason.startswith(self.ERROR_PREFIX)
+
+
+# ============================================================================
+# METRICS
+# ============================================================================
+
+
+class Histogram:
+    """Counts of observed durations in cumulative buckets, in seconds"""
+
+    BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+    def __init__(self):
+        self.counts = [0] * len(self.BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.BUCKETS, value)
+        if index < len(self.counts):
+            self.counts[index] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative(self) -> List[Tuple[str, int]]:
+        """(upper bound, count at or below it) pairs, ending with +Inf"""
+        total, pairs = 0, []
+        for bound, count in zip(self.BUCKETS, self.counts):
+            total += count
+            pairs.append((f"{bound:g}", total))
+        return pairs + [("+Inf", self.count)]
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Estimate a quantile by interpolating within its bucket"""
+        if not self.count:
+            return None
+        rank, seen, lower = q * self.count, 0, 0.0
+        for bound, count in zip(self.BUCKETS, self.counts):
+            if count and seen + count >= rank:
+                return lower + (bound - lower) * (rank - seen) / count
+            seen += count
+            lower = bound
+        return lower
+
+
+class Metrics:
+    """Stage timings and counters for a run, safe to update from workers
+
+    Stages are fetch, parse, prompt (compaction and request building), model
+    and apply; each histogram observation is one call of that stage, such
+    as one FETCH command or one model request. Exported as a Prometheus
+    textfile (for node_exporter's textfile collector) or a JSON report.
+    """
+
+    PREFIX = "email_assistant"
+
+    COUNTERS = {
+        "model_requests": "Model API requests, by backend",
+        "model_tokens": "Model tokens, by backend and type",
+        "http_retries": "HTTP requests retried, by reason",
+        "imap_reconnects": "IMAP commands retried on a new connection",
+        "categorization_errors": "Emails left in the inbox after a model error",
+        "batch_fallbacks": "Emails asked again individually after a bad batch answer",
+        "cache_lookups": "Categorization cache lookups, by result",
+        "decisions": "Categorization decisions, by source",
+        "actions": "Provider actions, by result",
+        "token_refreshes": "Office 365 access tokens refreshed, by reason",
+        "sync_given_up": "Emails incremental sync stopped retrying after failures",
+    }
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = time.time()
+        self.histograms: Dict[Tuple[str, tuple], Histogram] = {}
+        self.counters: Dict[Tuple[str, tuple], float] = {}
+
+    def observe(self, stage: str, seconds: float, **labels: str):
+        key = (stage, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(seconds)
+
+    @contextmanager
+    def timer(self, stage: str, **labels: str) -> Iterator[None]:
+        """Time the block as one call of stage"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start, **labels)
+
+    def inc(self, name: str, value: float = 1, **labels: str):
+        if name not in self.COUNTERS:
+            raise ValueError(f"Unknown metric: {name}")
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def to_prometheus(self) -> str:
+        """The metrics in the Prometheus text exposition format"""
+        metric = f"{self.PREFIX}_stage_seconds"
+        lines = [
+            f"# HELP {metric} Time per call of each processing stage",
+            f"# TYPE {metric} histogram",
+        ]
+        with self._lock:
+            for (stage, labels), histogram in sorted(self.histograms.items()):
+                names = _prometheus_labels((("stage", stage),) + labels)
+                for bound, count in histogram.cumulative():
+                    bucket = _prometheus_labels(
+                        (("stage", stage),) + labels + (("le", bound),)
+                    )
+                    lines.append(f"{metric}_bucket{bucket} {count}")
+                lines.append(f"{metric}_sum{names} {histogram.sum:.6f}")
+                lines.append(f"{metric}_count{names} {histogram.count}")
+
+            for name, help_text in self.COUNTERS.items():
+                values = [
+                    (labels, value)
+                    for (counter, labels), value in sorted(self.counters.items())
+                    if counter == name
+                ]
+                if not values:
+                    continue
+                metric = f"{self.PREFIX}_{name}_total"
+                lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} counter"]
+                for labels, value in values:
+                    lines.append(f"{metric}{_prometheus_labels(labels)} {value:g}")
+
+        metric = f"{self.PREFIX}_last_run_timestamp_seconds"
+        lines += [
+            f"# HELP {metric} When the last run finished",
+            f"# TYPE {metric} gauge",
+            f"{metric} {time.time():.0f}",
+        ]
+        return "\n".join(lines) + "\n"
+
+    def report(self) -> Dict[str, Any]:
+        """The metrics as a JSON-serializable run report"""
+        stages = []
+        counters = []
+        with self._lock:
+            for (stage, labels), histogram in sorted(self.histograms.items()):
+                stages.append(
+                    {
+                        "stage": stage,
+                        **dict(labels),
+                        "calls": histogram.count,
+                        "seconds": round(histogram.sum, 6),
+                        "p50": histogram.quantile(0.5),
+                        "p95": histogram.quantile(0.95),
+                    }
+                )
+            for (name, labels), value in sorted(self.counters.items()):
+                counters.append({"name": name, **dict(labels), "value": value})
+        return {
+            "started": self.started,
+            "duration_seconds": round(time.time() - self.started, 3),
+            "stages": stages,
+            "counters": counters,
+        }
+
+    def write_textfile(self, path: Path):
+        """Write the Prometheus textfile, replacing it atomically"""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temporary = path.with_name(f".{path.name}.tmp")
+        temporary.write_text(self.to_prometheus())
+        os.replace(temporary, path)
+
+    def summary(self) -> List[str]:
+        """One line per stage for the run summary"""
+        lines = []
+        with self._lock:
+            for (stage, labels), histogram in sorted(self.histograms.items()):
+                name = " ".join([stage, *(value for _, value in labels)])
+                mean = histogram.sum / histogram.count
+                lines.append(
+                    f"{name}: {histogram.count} calls, {histogram.sum:.2f}s total, "
+                    f"{mean * 1000:.1f}ms average"
+                )
+        return lines
+
+
+def _prometheus_labels(labels: tuple) -> str:
+    if not labels:
+        return ""
+    escaped = (
+        (
+            name,
+            str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"),
+        )
+        for name, value in labels
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+# Shared by every component of the process, like the logger
+metrics = Metrics()
+
+
+class RunProfiler:
+    """cProfile the calling thread and every pipeline thread, then merge
+
+    Before Python 3.12 cProfile only sees the thread it was enabled in, so
+    each pipeline thread target is wrapped to profile itself. From 3.12 the
+    first profiler is interpreter-wide and refuses a second one; the other
+    threads then run unwrapped and are still recorded by it.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._profiles: List[cProfile.Profile] = []
+
+    def wrap(self, target: Callable[..., Any]) -> Callable[..., Any]:
+        @functools.wraps(target)
+        def profiled(*args, **kwargs):
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+            except ValueError:
+                return target(*args, **kwargs)
+            try:
+                return target(*args, **kwargs)
+            finally:
+                profile.disable()
+                with self._lock:
+                    self._profiles.append(profile)
+
+        return profiled
+
+    def dump(self, path: Path, top: int = 25) -> str:
+        """Save the merged profile to path and return its top functions"""
+        with self._lock:
+            profiles = list(self._profiles)
+        if not profiles:
+            return ""
+        stats = pstats.Stats(*profiles, stream=io.StringIO())
+        stats.dump_stats(path)
+        stats.sort_stats("cumulative").print_stats(top)
+        return stats.stream.getvalue()
+
+
+# ============================================================================
+# CONTENT COMPACTION
+# ============================================================================
+
+
+class _HTMLText(HTMLParser):
+    """Collects the visible text of an HTML document"""
+
+    SKIP = {"script", "style", "head", "title", "noscript", "template"}
+    BLOCKS = {
+        "br",
+        "p",
+        "div",
+        "tr",
+        "li",
+        "ul",
+        "ol",
+        "table",
+        "section",
+        "h1",
+        "h2",
+        "h3",
+        "h4",
+        "h5",
+        "h6",
+        "blockquote",
+        "hr",
+        "article",
+    }
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts: List[str] = []
+        self.skipping = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIP:
+            self.skipping += 1
+        elif tag in self.BLOCKS:
+            self.parts.append("\n")
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIP:
+            self.skipping = max(0, self.skipping - 1)
+        elif tag in self.BLOCKS:
+            self.parts.append("\n")
+
+    def handle_data(self, data):
+        if not self.skipping:
+            self.parts.append(data)
+
+
+def html_to_text(html: str) -> str:
+    """Visible text of an HTML body, one line per block element"""
+    parser = _HTMLText()
+    try:
+        # Truncated previews can end mid-tag
+        parser.feed(re.sub(r"<[^>]*$", "", html))
+        parser.close()
+    except Exception:
+        # Keep whatever was parsed from malformed markup
+        pass
+    return "".join(parser.parts)
+
+
+def looks_like_html(text: str) -> bool:
+    return bool(re.search(r"<(html|body|div|p|br|table|span|a)\b", text[:2000], re.I))
+
+
+class ContentCompactor:
+    """Shrinks email bodies to what helps categorization
+
+    Converts HTML to text, cuts quoted replies, signatures and legal
+    disclaimers, shortens URLs to their host and collapses whitespace, then
+    trims the result so the email's whole summary fits max_tokens. Token
+    counts are estimated locally from words and punctuation.
+    """
+
+    # Lines that start the quoted message in a reply or forward
+    QUOTE_HEADER = re.compile(
+        r"^\s*(on\b.{0,200}\bwrote:|am\b.{0,200}\bschrieb.{0,40}:"
+        r"|le\b.{0,200}\ba écrit\s*:|_{10,}"
+        r"|-{2,}\s*(original|forwarded) message\s*-{2,})",
+        re.IGNORECASE,
+    )
+    # Outlook-style quote headers: a From: line directly followed by Sent:
+    QUOTE_FROM = re.compile(r"^\s*(from|von|de)\s*:\s", re.IGNORECASE)
+    QUOTE_SENT = re.compile(r"^\s*(sent|date|gesendet|envoyé)\s*:", re.IGNORECASE)
+    # Lines that start a signature or a disclaimer footer
+    FOOTER = re.compile(
+        r"^\s*(--\s*$|sent from my \w+|get outlook for \w+"
+        r"|(confidentiality notice|disclaimer)\b"
+        r"|this (e-?mail|message)( and any (files|attachments).{0,40})?"
+        r" (is|are|contains?|may contain) (confidential|privileged|intended))",
+        re.IGNORECASE,
+    )
+    URL = re.compile(r"\b(?:https?://|www\.)([^\s/<>\"')\]]+)[^\s<>\"')\]]*", re.I)
+    TOKEN = re.compile(r"\w+|[^\w\s]")
+
+    def __init__(self, max_tokens: int = 256):
+        self.max_tokens = max_tokens
+
+    def compact(self, text: str) -> str:
+        """Compact an email body, without applying the token budget"""
+        if looks_like_html(text):
+            text = html_to_text(text)
+        lines = text.splitlines()
+        kept = []
+        for number, line in enumerate(lines):
+            quote = (
+                line.lstrip().startswith(">")
+                or self.QUOTE_HEADER.match(line)
+                or self.QUOTE_FROM.match(line)
+                and number + 1 < len(lines)
+                and self.QUOTE_SENT.match(lines[number + 1])
+            )
+            if quote:
+                if kept:
+                    break
+                continue
+            if self.FOOTER.match(line) and kept:
+                break
+            kept.append(line)
+        text = self.URL.sub(lambda m: f"<{m.group(1).lower()}>", "\n".join(kept))
+        # Zero-width and other invisible characters used as preheader padding
+        text = re.sub(r"[\u200b-\u200f\u034f\u00ad\ufeff]", "", text)
+        return " ".join(text.split())
+
+    @classmethod
+    def estimate_tokens(cls, text: str) -> int:
+        """Rough token count: one per word or symbol, more for long words"""
+        return sum(1 + len(m) // 8 for m in cls.TOKEN.findall(text))
+
+    @classmethod
+    def truncate(cls, text: str, max_tokens: int) -> str:
+        """Cut text after the last word that fits max_tokens"""
+        used = 0
+        for match in cls.TOKEN.finditer(text):
+            used += 1 + len(match.group()) // 8
+            # Leave room for the ellipsis
+            if used >= max_tokens:
+                return text[: match.start()].rstrip() + " …"
+        return text
+
+    def apply(self, email: Email):
+        """Replace an email's preview with its compacted, budgeted form"""
+        preview = self.compact(email.body_preview or "")
+        email.body_preview = ""
+        budget = self.max_tokens - self.estimate_tokens(email.to_summary())
+        email.body_preview = self.truncate(preview, max(budget, 0))
+
+
+# ============================================================================
+# HTTP
+# ============================================================================
+
+
+@dataclass
+class RetryPolicy:
+    """Exponential backoff with jitter for throttled or failing requests"""
+
+    max_retries: int = 3
+    backoff: float = 1.0
+    max_backoff: float = 60.0
+    retry_statuses: tuple = (429, 500, 502, 503, 504)
+
+    def delay(self, attempt: int, retry_after: Optional[str] = None) -> float:
+        """Seconds to wait before retry number attempt (starting at 0)
+
+        A Retry-After value, in seconds or as an HTTP date, takes precedence.
+        """
+        if retry_after:
+            try:
+                return min(self.max_backoff, max(0.0, float(retry_after)))
+            except ValueError:
+                try:
+                    when = parsedate_to_datetime(retry_after).timestamp()
+                    return min(self.max_backoff, max(0.0, when - time.time()))
+                except (TypeError, ValueError):
+                    pass
+        ceiling = min(self.max_backoff, self.backoff * 2**attempt)
+        return ceiling / 2 + random.uniform(0, ceiling / 2)
+
+
+class HTTPClient:
+    """Pooled keep-alive HTTP session with timeouts and retries
+
+    One instance is shared by all threads of its owner; requests.Session
+    draws connections from a thread-safe urllib3 pool of pool_size.
+    """
+
+    def __init__(
+        self,
+        pool_size: int = 10,
+        timeout: float = 30,
+        retry: Optional[RetryPolicy] = None,
+    ):
+        import requests
+
+        self.timeout = timeout
+        self.retry = retry or RetryPolicy()
+        self._connection_errors = (requests.ConnectionError, requests.Timeout)
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def request(self, method: str, url: str, **kwargs) -> "requests.Response":
+        """Send a request, retrying connection errors and retryable statuses
+
+        The last response is returned as-is once retries are exhausted.
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        attempt = 0
+        while True:
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except self._connection_errors as e:
+                if attempt >= self.retry.max_retries:
+                    raise
+                delay = self.retry.delay(attempt)
+                logger.warning(f"{method} {url} failed ({e}), retrying in {delay:.1f}s")
+                metrics.inc("http_retries", reason="connection")
+            else:
+                if (
+                    response.status_code not in self.retry.retry_statuses
+                    or attempt >= self.retry.max_retries
+                ):
+                    return response
+                delay = self.retry.delay(attempt, response.headers.get("Retry-After"))
+                logger.warning(
+                    f"{method} {url} returned {response.status_code}, "
+                    f"retrying in {delay:.1f}s"
+                )
+                metrics.inc("http_retries", reason=str(response.status_code))
+            time.sleep(delay)
+            attempt += 1
 
 
 # ============================================================================
@@ -85,87 +630,303 @@ class EmailCategory:
 # ============================================================================
 
 
+class TokenUsage:
+    """Token counts accumulated over a run, safe to update from workers
+
+    cached_input_tokens are prompt tokens served from the provider's prefix
+    cache and cache_write_tokens those written to it; both are part of
+    input_tokens.
+    """
+
+    FIELDS = (
+        "requests",
+        "input_tokens",
+        "cached_input_tokens",
+        "cache_write_tokens",
+        "output_tokens",
+    )
+
+    def __init__(self, backend: str = "model"):
+        self._lock = threading.Lock()
+        self.backend = backend
+        self.counts = dict.fromkeys(self.FIELDS, 0)
+
+    def add(self, **counts: Optional[int]):
+        with self._lock:
+            self.counts["requests"] += 1
+            for name, value in counts.items():
+                self.counts[name] += value or 0
+        metrics.inc("model_requests", backend=self.backend)
+        for name, value in counts.items():
+            if value:
+                kind = name.removesuffix("_tokens")
+                metrics.inc("model_tokens", value, backend=self.backend, type=kind)
+
+    def summary(self) -> str:
+        c = self.counts
+        cached = (
+            f"{c['cached_input_tokens'] / c['input_tokens']:.0%}"
+            if c["input_tokens"]
+            else "0%"
+        )
+        return (
+            f"{c['requests']} requests, {c['input_tokens']} input tokens "
+            f"({c['cached_input_tokens']} from prompt cache, {cached}; "
+            f"{c['cache_write_tokens']} written to it), "
+            f"{c['output_tokens']} output tokens"
+        )
+
+
 class AIModel(ABC):
     """Abstract base class for AI models"""
 
+    # Label for this backend's metrics
+    backend = "model"
+
+    def __init__(self):
+        self.usage = TokenUsage(self.backend)
+
+    @abstractmethod
+    def test_connection(self) -> bool:
+        """Test if the model is accessible"""
+        pass
+
     @abstractmethod
     def categorize_email(self, email: Email, prompt: str) -> EmailCategory:
         """Categorize an email based on the prompt"""
         pass
 
+    def categorize_batch(self, emails: List[Email], prompt: str) -> List[EmailCategory]:
+        """Categorize several emails, returning the results in input order
+
+        Models that can answer for several emails in one request override
+        this; the default categorizes them one at a time.
+        """
+        return [self.categorize_email(email, prompt) for email in emails]
+
+
+class PromptModel(AIModel):
+    """A model answering categorization prompts with JSON text
+
+    Requests are split into stable instructions (the categorization prompt
+    and response format, identical across calls) and per-request content
+    (the emails), so backends can keep the instructions in a prompt cache.
+    """
+
     @abstractmethod
-    def test_connection(self) -> bool:
-        """Test if the model is accessible"""
+    def _generate(self, instructions: str, content: str, max_tokens: int = 1024) -> str:
+        """Send instructions plus content and return the model's JSON text response"""
         pass
 
+    def categorize_email(self, email: Email, prompt: str) -> EmailCategory:
+        """Categorize an email based on the prompt"""
+        try:
+            with metrics.timer("prompt"):
+                content = f"Email to categorize:\n{email.to_summary()}"
+            with metrics.timer("model", backend=self.backend):
+                response = self._generate(
+                    f"{prompt}\n{SINGLE_RESPONSE_FORMAT}", content
+                )
+            ai_response = json.loads(response)
+            return EmailCategory(
+                action=EmailAction(ai_response["action"]),
+                reason=ai_response["reason"],
+                folder=ai_response.get("folder"),
+                confidence=_confidence(ai_response),
+            )
+        except Exception as e:
+            logger.error(f"{type(self).__name__} categorization failed: {e}")
+            metrics.inc("categorization_errors", backend=self.backend)
+            return EmailCategory.for_error(e)
 
-class OllamaModel(AIModel):
-    """Ollama local model implementation"""
+    def categorize_batch(self, emails: List[Email], prompt: str) -> List[EmailCategory]:
+        """Categorize several emails with a single model request
 
-    def __init__(
-        self, base_url: str = "http://localhost:11434", model: str = "qwen2.5:7b"
-    ):
-        self.base_url = base_url.rstrip("/")
-        self.model = model
+        Emails missing from the response, or with an invalid entry, fall back
+        to individual categorize_email calls. Results are in input order.
+        """
+        if len(emails) <= 1:
+            return [self.categorize_email(email, prompt) for email in emails]
 
-    def test_connection(self) -> bool:
+        decisions = {}
         try:
-            response = requests.get(f"{self.base_url}/api/tags", timeout=5)
-            return response.status_code == 200
+            with metrics.timer("prompt"):
+                content = _batch_content(emails)
+            with metrics.timer("model", backend=self.backend):
+                response = self._generate(
+                    f"{prompt}\n{BATCH_RESPONSE_FORMAT}",
+                    content,
+                    max_tokens=BATCH_TOKENS_PER_EMAIL * len(emails) + 256,
+                )
+            decisions = _parse_batch_response(response)
         except Exception as e:
-            logger.error(f"Ollama connection failed: {e}")
-            return False
+            logger.error(f"{type(self).__name__} batch categorization failed: {e}")
+
+        categories = []
+        for position, email in enumerate(emails, 1):
+            item = decisions.get(str(position))
+            try:
+                category = EmailCategory(
+                    action=EmailAction(item["action"]),
+                    reason=item["reason"],
+                    folder=item.get("folder"),
+                    confidence=_confidence(item),
+                )
+            except Exception:
+                if decisions:
+                    logger.warning(
+                        f"No valid batch decision for email {position}, "
+                        "categorizing individually"
+                    )
+                    metrics.inc("batch_fallbacks", backend=self.backend)
+                category = self.categorize_email(email, prompt)
+            categories.append(category)
+        return categories
 
-    def categorize_email(self, email: Email, prompt: str) -> EmailCategory:
-        """Categorize email using Ollama"""
-        full_prompt = f"""{prompt}
 
-Email to categorize:
-{email.to_summary()}
+# Output token allowance per email in a batch request
+BATCH_TOKENS_PER_EMAIL = 128
 
+SINGLE_RESPONSE_FORMAT = """
 Respond in JSON format:
-{{
+{
     "action": "keep_inbox|archive|delete|mark_read|move_folder",
     "reason": "brief explanation",
-    "folder": "folder name if action is move_folder, otherwise null"
-}}
+    "folder": "folder name if action is move_folder, otherwise null",
+    "confidence": "number from 0 to 1, how sure you are of the action"
+}
 """
 
-        try:
-            response = requests.post(
-                f"{self.base_url}/api/generate",
-                json={
-                    "model": self.model,
-                    "prompt": full_prompt,
-                    "stream": False,
-                    "format": "json",
-                },
-                timeout=30,
-            )
-            response.raise_for_status()
+BATCH_RESPONSE_FORMAT = """
+You will be given several emails, each starting with its id in brackets.
+Respond in JSON format with exactly one result per email:
+{
+    "results": [
+        {
+            "id": "id of the email",
+            "action": "keep_inbox|archive|delete|mark_read|move_folder",
+            "reason": "brief explanation",
+            "folder": "folder name if action is move_folder, otherwise null",
+            "confidence": "number from 0 to 1, how sure you are of the action"
+        }
+    ]
+}
+"""
 
-            result = response.json()
-            ai_response = json.loads(result["response"])
 
-            return EmailCategory(
-                action=EmailAction(ai_response["action"]),
-                reason=ai_response["reason"],
-                folder=ai_response.get("folder"),
-            )
+def _batch_content(emails: List[Email]) -> str:
+    """The emails of a batch request, each labelled with its position"""
+    blocks = "\n\n".join(
+        f"[{position}]\n{email.to_summary()}"
+        for position, email in enumerate(emails, 1)
+    )
+    return f"Emails to categorize:\n{blocks}"
+
+
+def _confidence(decision: Dict[str, Any]) -> Optional[float]:
+    """Read the model's confidence from a decision, clamped to [0, 1]"""
+    try:
+        return min(max(float(decision["confidence"]), 0.0), 1.0)
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def _parse_batch_response(text: str) -> Dict[str, Dict[str, Any]]:
+    """Parse a batch response into decisions keyed by email id"""
+    data = json.loads(text)
+    if isinstance(data, dict):
+        data = data.get("results", [])
+    return {
+        str(item["id"]).strip("[] "): item
+        for item in data
+        if isinstance(item, dict) and "id" in item
+    }
+
+
+class OllamaModel(PromptModel):
+    """Ollama local model implementation
+
+    The instructions go in the system field ahead of the emails and the model
+    is kept loaded for keep_alive, so Ollama can reuse the KV cache of the
+    shared prefix instead of evaluating it again on every request.
+    """
+
+    backend = "ollama"
+
+    def __init__(
+        self,
+        base_url: str = "http://localhost:11434",
+        model: str = "qwen2.5:7b",
+        http: Optional[HTTPClient] = None,
+        keep_alive: str = "30m",
+    ):
+        super().__init__()
+        self.base_url = base_url.rstrip("/")
+        self.model = model
+        self.http = http or HTTPClient()
+        self.keep_alive = keep_alive
+
+    def test_connection(self) -> bool:
+        try:
+            response = self.http.request("GET", f"{self.base_url}/api/tags", timeout=5)
+            return response.status_code == 200
         except Exception as e:
-            logger.error(f"Ollama categorization failed: {e}")
-            # Default to keeping in inbox on error
-            return EmailCategory(
-                action=EmailAction.KEEP_INBOX,
-                reason=f"Error during categorization: {str(e)}",
-            )
+            logger.error(f"Ollama connection failed: {e}")
+            return False
+
+    def _generate(self, instructions: str, content: str, max_tokens: int = 1024) -> str:
+        response = self.http.request(
+            "POST",
+            f"{self.base_url}/api/generate",
+            json={
+                "model": self.model,
+                "system": instructions,
+                "prompt": content,
+                "stream": False,
+                "format": "json",
+                "keep_alive": self.keep_alive,
+                "options": {"num_predict": max_tokens},
+            },
+            timeout=self.http.timeout + max_tokens // 10,
+        )
+        response.raise_for_status()
+        result = response.json()
+        # prompt_eval_count only counts tokens not already in the KV cache
+        self.usage.add(
+            input_tokens=result.get("prompt_eval_count"),
+            output_tokens=result.get("eval_count"),
+        )
+        return result["response"]
+
 
+class AnthropicModel(PromptModel):
+    """Anthropic Claude API implementation
 
-class AnthropicModel(AIModel):
-    """Anthropic Claude API implementation"""
+    The instructions are sent as a system block marked for prompt caching,
+    so repeated requests read them from the cache at a fraction of the
+    input price. Prompts shorter than the model's minimum cacheable length
+    (1024 tokens for most models) are not cached.
+    """
 
-    def __init__(self, api_key: str, model: str = "claude-3-5-sonnet-20241022"):
-        self.client = anthropic.Anthropic(api_key=api_key)
+    backend = "anthropic"
+
+    def __init__(
+        self,
+        api_key: str,
+        model: str = "claude-3-5-sonnet-20241022",
+        timeout: float = 60,
+        max_retries: int = 3,
+        base_url: Optional[str] = None,
+    ):
+        import anthropic
+
+        super().__init__()
+        self.client = anthropic.Anthropic(
+            api_key=api_key,
+            timeout=timeout,
+            max_retries=max_retries,
+            base_url=base_url,
+        )
         self.model = model
 
     def test_connection(self) -> bool:
@@ -181,48 +942,59 @@ class AnthropicModel(AIModel):
             logger.error(f"Anthropic connection failed: {e}")
             return False
 
-    def categorize_email(self, email: Email, prompt: str) -> EmailCategory:
-        """Categorize email using Claude"""
-        full_prompt = f"""{prompt}
-
-Email to categorize:
-{email.to_summary()}
-
-Respond in JSON format:
-{{
-    "action": "keep_inbox|archive|delete|mark_read|move_folder",
-    "reason": "brief explanation",
-    "folder": "folder name if action is move_folder, otherwise null"
-}}
-"""
-
-        try:
-            message = self.client.messages.create(
-                model=self.model,
-                max_tokens=1024,
-                messages=[{"role": "user", "content": full_prompt}],
-            )
-
-            ai_response = json.loads(message.content[0].text)
-
-            return EmailCategory(
-                action=EmailAction(ai_response["action"]),
-                reason=ai_response["reason"],
-                folder=ai_response.get("folder"),
-            )
-        except Exception as e:
-            logger.error(f"Anthropic categorization failed: {e}")
-            return EmailCategory(
-                action=EmailAction.KEEP_INBOX,
-                reason=f"Error during categorization: {str(e)}",
-            )
-
+    def _generate(self, instructions: str, content: str, max_tokens: int = 1024) -> str:
+        message = self.client.messages.create(
+            model=self.model,
+            max_tokens=max_tokens,
+            system=[
+                {
+                    "type": "text",
+                    "text": instructions,
+                    "cache_control": {"type": "ephemeral"},
+                }
+            ],
+            messages=[{"role": "user", "content": content}],
+        )
+        usage = message.usage
+        cache_read = getattr(usage, "cache_read_input_tokens", 0) or 0
+        cache_write = getattr(usage, "cache_creation_input_tokens", 0) or 0
+        self.usage.add(
+            # input_tokens excludes the cached and cache-writing parts
+            input_tokens=usage.input_tokens + cache_read + cache_write,
+            cached_input_tokens=cache_read,
+            cache_write_tokens=cache_write,
+            output_tokens=usage.output_tokens,
+        )
+        return message.content[0].text
+
+
+class OpenAIModel(PromptModel):
+    """OpenAI GPT implementation
+
+    The instructions go first, in the system message, so the identical
+    prefix of every request qualifies for OpenAI's automatic prompt caching
+    (prompts of 1024 tokens or more).
+    """
+
+    backend = "openai"
 
-class OpenAIModel(AIModel):
-    """OpenAI GPT implementation"""
-
-    def __init__(self, api_key: str, model: str = "gpt-4"):
-        self.client = openai.OpenAI(api_key=api_key)
+    def __init__(
+        self,
+        api_key: str,
+        model: str = "gpt-4",
+        timeout: float = 60,
+        max_retries: int = 3,
+        base_url: Optional[str] = None,
+    ):
+        import openai
+
+        super().__init__()
+        self.client = openai.OpenAI(
+            api_key=api_key,
+            timeout=timeout,
+            max_retries=max_retries,
+            base_url=base_url,
+        )
         self.model = model
 
     def test_connection(self) -> bool:
@@ -237,42 +1009,299 @@ class OpenAIModel(AIModel):
             logger.error(f"OpenAI connection failed: {e}")
             return False
 
+    def _generate(self, instructions: str, content: str, max_tokens: int = 1024) -> str:
+        response = self.client.chat.completions.create(
+            model=self.model,
+            messages=[
+                {"role": "system", "content": instructions},
+                {"role": "user", "content": content},
+            ],
+            response_format={"type": "json_object"},
+            max_tokens=max_tokens,
+        )
+        usage = response.usage
+        if usage is not None:
+            details = getattr(usage, "prompt_tokens_details", None)
+            self.usage.add(
+                input_tokens=usage.prompt_tokens,
+                cached_input_tokens=getattr(details, "cached_tokens", 0),
+                output_tokens=usage.completion_tokens,
+            )
+        return response.choices[0].message.content
+
+
+@dataclass
+class CascadeTier:
+    """One model in a cascade, with the confidence it must reach to answer"""
+
+    name: str
+    model: AIModel
+    min_confidence: float = 0.0
+    answered: int = 0
+    escalated: int = 0
+    calls: int = 0
+    seconds: float = 0.0
+
+    def summary(self) -> str:
+        latency = self.seconds / self.calls if self.calls else 0.0
+        return (
+            f"{self.name}: {self.answered} answered, {self.escalated} escalated, "
+            f"{self.calls} calls, {latency:.2f}s average latency; "
+            f"{self.model.usage.summary()}"
+        )
+
+
+class CascadeModel(AIModel):
+    """Ask cheap models first and escalate to the next tier when unsure
+
+    Each tier's answer is kept when its confidence reaches the tier's
+    min_confidence and its action is not in escalate_actions. Otherwise the
+    email is asked again of the next tier. The last tier always answers.
+    Answers without a confidence, including failed categorizations, are
+    escalated.
+    """
+
+    backend = "cascade"
+
+    def __init__(
+        self,
+        tiers: List[CascadeTier],
+        escalate_actions: Optional[List[EmailAction]] = None,
+    ):
+        if not tiers:
+            raise ValueError("A model cascade needs at least one tier")
+        super().__init__()
+        self.tiers = tiers
+        self.escalate_actions = set(escalate_actions or [])
+        self.model = ">".join(str(getattr(t.model, "model", t.name)) for t in tiers)
+        self._lock = threading.Lock()
+
+    def test_connection(self) -> bool:
+        return all(tier.model.test_connection() for tier in self.tiers)
+
     def categorize_email(self, email: Email, prompt: str) -> EmailCategory:
-        """Categorize email using GPT"""
-        full_prompt = f"""{prompt}
+        return self.categorize_batch([email], prompt)[0]
+
+    def categorize_batch(self, emails: List[Email], prompt: str) -> List[EmailCategory]:
+        categories: List[Optional[EmailCategory]] = [None] * len(emails)
+        pending = list(range(len(emails)))
+        for number, tier in enumerate(self.tiers):
+            if not pending:
+                break
+            start = time.monotonic()
+            answers = tier.model.categorize_batch([emails[i] for i in pending], prompt)
+            elapsed = time.monotonic() - start
+
+            last = number == len(self.tiers) - 1
+            unsure = []
+            for index, category in zip(pending, answers):
+                categories[index] = category
+                if not last and self._unsure(tier, category):
+                    unsure.append(index)
+            with self._lock:
+                tier.calls += 1
+                tier.seconds += elapsed
+                tier.answered += len(pending) - len(unsure)
+                tier.escalated += len(unsure)
+            pending = unsure
+        return categories
+
+    def _unsure(self, tier: CascadeTier, category: EmailCategory) -> bool:
+        if category.action in self.escalate_actions:
+            return True
+        return category.confidence is None or category.confidence < tier.min_confidence
 
-Email to categorize:
-{email.to_summary()}
+    def summary(self) -> List[str]:
+        """One line of counts, latency and token usage per tier"""
+        return [
+            f"Tier {number} {tier.summary()}"
+            for number, tier in enumerate(self.tiers, 1)
+        ]
 
-Respond in JSON format:
-{{
-    "action": "keep_inbox|archive|delete|mark_read|move_folder",
-    "reason": "brief explanation",
-    "folder": "folder name if action is move_folder, otherwise null"
-}}
-"""
 
+# ============================================================================
+# SYNC STATE
+# ============================================================================
+
+
+def _default_sync_state_path() -> Path:
+    """Default location of the incremental sync state file"""
+    state_home = Path(os.getenv("XDG_STATE_HOME") or Path.home() / ".local" / "state")
+    return state_home / "email-assistant" / "sync.json"
+
+
+class SyncStateStore:
+    """Persisted per-account, per-folder sync positions (JSON file)
+
+    Providers read a folder's state before fetching and store the new
+    position once the emails they returned have been processed. Without a
+    path, positions are only kept in memory.
+    """
+
+    def __init__(self, path: Optional[Path]):
+        self.path = path
+        self._lock = threading.Lock()
+        self._states: Dict[str, Dict[str, Any]] = {}
+        if path and path.exists():
+            try:
+                with open(path, "r") as f:
+                    self._states = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Ignoring unreadable sync state {path}: {e}")
+
+    def get(self, key: str) -> Dict[str, Any]:
+        """Get the stored state for a folder (empty if never synced)"""
+        with self._lock:
+            return dict(self._states.get(key, {}))
+
+    def set(self, key: str, state: Dict[str, Any]):
+        """Store the state for a folder"""
+        with self._lock:
+            self._states[key] = dict(state, updated=time.time())
+            self._save()
+
+    def reset(self, prefix: str = ""):
+        """Forget the state of every folder whose key starts with prefix"""
+        with self._lock:
+            self._states = {
+                key: state
+                for key, state in self._states.items()
+                if not key.startswith(prefix)
+            }
+            self._save()
+
+    def _save(self):
+        if self.path is None:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(self._states, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+
+# ============================================================================
+# TOKEN CACHE
+# ============================================================================
+
+
+def _default_token_cache_path(*identity: Optional[str]) -> Path:
+    """Default location of the MSAL token cache for one app and account"""
+    state_home = Path(os.getenv("XDG_STATE_HOME") or Path.home() / ".local" / "state")
+    digest = hashlib.sha256(":".join(i or "" for i in identity).encode()).hexdigest()
+    return state_home / "email-assistant" / f"msal-{digest[:16]}.bin"
+
+
+class TokenCache:
+    """MSAL token cache persisted encrypted to a file
+
+    Uses msal-extensions' platform encryption (DPAPI, Keychain, libsecret)
+    when it is installed and usable, otherwise Fernet with a key derived from
+    the configured secret by PBKDF2, salted with random bytes kept in a
+    .salt file next to the cache. Without either, tokens are kept in memory
+    only.
+    """
+
+    # PBKDF2-HMAC-SHA256 iterations, as OWASP recommends
+    KDF_ITERATIONS = 600000
+
+    def __init__(self, path: Path, key: Optional[str] = None):
+        from msal import SerializableTokenCache
+
+        self.path = path
+        self.salt_path = path.with_name(f"{path.name}.salt")
+        self._lock = threading.Lock()
+        self._fernet = None
+
+        path.parent.mkdir(parents=True, exist_ok=True)
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[{"role": "user", "content": full_prompt}],
-                response_format={"type": "json_object"},
-                max_tokens=1024,
-            )
+            from msal_extensions import PersistedTokenCache, build_encrypted_persistence
 
-            ai_response = json.loads(response.choices[0].message.content)
+            # Saves itself, with a file lock, whenever MSAL changes it
+            self.cache = PersistedTokenCache(build_encrypted_persistence(str(path)))
+            self.persisted = True
+            return
+        except ImportError:
+            pass
+        except Exception as e:
+            logger.debug(f"Platform token encryption unavailable: {e}")
+
+        self.cache = SerializableTokenCache()
+        self.persisted = False
+        if not key:
+            logger.warning(
+                "Office 365 tokens are not persisted: set "
+                "email.office365.token_cache.key (or O365_TOKEN_CACHE_KEY) "
+                "or install msal-extensions"
+            )
+            return
+        try:
+            from cryptography.fernet import Fernet, InvalidToken
+        except ImportError:
+            logger.warning(
+                "Office 365 tokens are not persisted: "
+                "email.office365.token_cache.key (O365_TOKEN_CACHE_KEY) needs "
+                "the cryptography package: pip install cryptography"
+            )
+            return
 
-            return EmailCategory(
-                action=EmailAction(ai_response["action"]),
-                reason=ai_response["reason"],
-                folder=ai_response.get("folder"),
+        salted = self.salt_path.exists()
+        self._salt = self.salt_path.read_bytes() if salted else os.urandom(16)
+        self._fernet = Fernet(self._derive_key(key, self._salt))
+        self.persisted = True
+        if path.exists():
+            # Caches written before the key was salted have no salt file and
+            # were encrypted with a bare SHA-256 of the key
+            fernet = (
+                self._fernet
+                if salted
+                else Fernet(urlsafe_b64encode(hashlib.sha256(key.encode()).digest()))
             )
-        except Exception as e:
-            logger.error(f"OpenAI categorization failed: {e}")
-            return EmailCategory(
-                action=EmailAction.KEEP_INBOX,
-                reason=f"Error during categorization: {str(e)}",
+            try:
+                self.cache.deserialize(fernet.decrypt(path.read_bytes()).decode())
+                # Re-encrypted with the salted key on the next save
+                self.cache.has_state_changed = not salted
+            except InvalidToken:
+                logger.warning(f"Ignoring token cache {path}: wrong key or corrupted")
+            except (OSError, ValueError) as e:
+                logger.warning(f"Ignoring unreadable token cache {path}: {e}")
+
+    def save(self):
+        """Write the cache back if MSAL changed it (Fernet mode only)"""
+        if self._fernet is None:
+            return
+        with self._lock:
+            if not self.cache.has_state_changed:
+                return
+            if not self.salt_path.exists():
+                self._write_private(self.salt_path, self._salt)
+            self._write_private(
+                self.path, self._fernet.encrypt(self.cache.serialize().encode())
             )
+            self.cache.has_state_changed = False
+
+    @classmethod
+    def _derive_key(cls, secret: str, salt: bytes) -> bytes:
+        """Fernet key for a secret and salt"""
+        from cryptography.hazmat.primitives import hashes
+        from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+
+        kdf = PBKDF2HMAC(
+            algorithm=hashes.SHA256(),
+            length=32,
+            salt=salt,
+            iterations=cls.KDF_ITERATIONS,
+        )
+        return urlsafe_b64encode(kdf.derive(secret.encode()))
+
+    @staticmethod
+    def _write_private(path: Path, data: bytes):
+        """Replace a file atomically with one only the owner can read"""
+        tmp_path = path.with_name(f".{path.name}.tmp")
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
 
 
 # ============================================================================
@@ -280,6 +1309,17 @@ Respond in JSON format:
 # ============================================================================
 
 
+@dataclass
+class ProviderAction:
+    """A provider operation on one email: move, mark_read or delete"""
+
+    email_id: str
+    operation: str
+    destination: Optional[str] = None
+    # Folder the email is in, when the provider needs to know
+    folder: Optional[str] = None
+
+
 class EmailProvider(ABC):
     """Abstract base class for email providers"""
 
@@ -288,6 +1328,25 @@ class EmailProvider(ABC):
         """Get emails from a folder"""
         pass
 
+    def iter_emails(
+        self, folder: str = "inbox", limit: int = 50, page_size: int = 100
+    ) -> Iterator[Email]:
+        """Yield emails from a folder, fetching page_size at a time
+
+        Providers override this to stream large folders in constant memory;
+        the default fetches everything with get_emails.
+        """
+        yield from self.get_emails(folder=folder, limit=limit)
+
+    @abstractmethod
+    def get_emails_by_id(self, folder: str, ids: List[str]) -> Dict[str, Email]:
+        """Fetch the current state of emails in a folder, keyed by id
+
+        Emails no longer in the folder are left out. Body previews may be
+        empty; this is for checking emails have not changed.
+        """
+        pass
+
     @abstractmethod
     def move_email(self, email_id: str, destination_folder: str) -> bool:
         """Move email to a folder"""
@@ -308,6 +1367,96 @@ class EmailProvider(ABC):
         """Test if provider is accessible"""
         pass
 
+    def apply_actions(self, actions: List[ProviderAction]) -> List[bool]:
+        """Apply many actions, returning whether each one succeeded
+
+        Providers override this to group actions into bulk requests; the
+        default applies them one at a time.
+        """
+        results = []
+        for action in actions:
+            if action.operation == "move":
+                results.append(self.move_email(action.email_id, action.destination))
+            elif action.operation == "mark_read":
+                results.append(self.mark_as_read(action.email_id))
+            elif action.operation == "delete":
+                results.append(self.delete_email(action.email_id))
+            else:
+                logger.warning(f"Unknown provider operation: {action.operation}")
+                results.append(False)
+        return results
+
+    def finish(self):
+        """Complete deferred work (such as expunging) at the end of a run"""
+        pass
+
+    # Set by providers that support incremental sync
+    sync_store: Optional[SyncStateStore] = None
+
+    def sync_key(self, folder: str) -> str:
+        """Key identifying this account's folder in the sync state store"""
+        return f"{type(self).__name__}:{folder}"
+
+    # Runs in which an email may go unprocessed before sync gives up on it
+    MAX_SYNC_ATTEMPTS = 3
+
+    def commit_sync(self, folder: str, processed: Set[str]):
+        """Persist the sync position of a folder past the fetched emails
+
+        Called once the emails fetched from folder have been handled, with
+        the ids of those handled successfully. The position moves past every
+        email that was fetched; those left unprocessed are kept in the
+        state's retry counts and fetched again by the next runs, up to
+        MAX_SYNC_ATTEMPTS times, so one email that always fails cannot hold
+        back the rest of the folder.
+        """
+        key = self.sync_key(folder)
+        pending = getattr(self, "_pending_sync", {}).pop(key, None)
+        if self.sync_store is None or pending is None:
+            return
+        state = self._sync_position(pending, processed)
+        if state is not None:
+            self.sync_store.set(key, state)
+
+    def _sync_position(
+        self, pending: Dict[str, Any], processed: Set[str]
+    ) -> Optional[Dict[str, Any]]:
+        """The state to store after a fetch, or None to keep the stored one
+
+        pending holds the new "state", the "ids" of the emails returned, the
+        stored retry "attempts" and the retried ids found "gone".
+        """
+        return dict(pending["state"], retry=self._retries(pending, processed))
+
+    def _retries(self, pending: Dict[str, Any], processed: Set[str]) -> Dict[str, int]:
+        """Failed attempts so far of each email to fetch again next run
+
+        Returned emails left unprocessed count one more attempt, and are
+        given up on at MAX_SYNC_ATTEMPTS. Retries that were not fetched this
+        run keep their count, unless they no longer exist.
+        """
+        attempts = pending["attempts"]
+        returned = set(pending["ids"])
+        retry = {
+            email_id: count
+            for email_id, count in attempts.items()
+            if email_id not in returned and email_id not in pending["gone"]
+        }
+        for email_id in pending["ids"]:
+            if email_id in processed:
+                continue
+            count = attempts.get(email_id, 0) + 1
+            if count >= self.MAX_SYNC_ATTEMPTS:
+                logger.warning(
+                    f"Giving up on email {email_id} after {count} failed attempts"
+                )
+                metrics.inc("sync_given_up")
+            else:
+                retry[email_id] = count
+        if retry:
+            logger.warning(f"{len(retry)} unprocessed emails will be fetched again")
+        return retry
+
 
 class Office365Provider(EmailProvider):
     """Microsoft Office 365 / Outlook email provider"""
@@ -318,58 +1467,156 @@ class Office365Provider(EmailProvider):
         client_secret: Optional[str] = None,
         tenant_id: str = "common",
         user_email: Optional[str] = None,
+        sync_store: Optional[SyncStateStore] = None,
+        graph_url: str = "https://graph.microsoft.com/v1.0",
+        http: Optional[HTTPClient] = None,
+        extra_headers: Optional[List[str]] = None,
+        preview_chars: Optional[int] = None,
+        token_cache: Optional[TokenCache] = None,
     ):
         self.client_id = client_id
         self.client_secret = client_secret
         self.tenant_id = tenant_id
         self.user_email = user_email
         self.access_token = None
+        self.graph_url = graph_url.rstrip("/")
+        self.http = http or HTTPClient()
+        self.extra_headers = [name.lower() for name in extra_headers or []]
+        self.preview_chars = preview_chars
+        self.sync_store = sync_store
+        self.token_cache = token_cache
+        self._pending_sync: Dict[str, Dict[str, Any]] = {}
+        # Graph ids of folders by the name or id they are requested with
+        self._folder_ids: Dict[str, str] = {}
+        self._app = None
+        self._token_expires: Optional[float] = None
+        self._auth_lock = threading.Lock()
         self._authenticate()
 
-    def _authenticate(self):
-        """Authenticate with Microsoft Graph API"""
-        authority = f"https://login.microsoftonline.com/{self.tenant_id}"
-        scopes = ["https://graph.microsoft.com/.default"]
+    # Refresh this long before the token expires instead of waiting for a 401
+    REFRESH_MARGIN = 300
+
+    def _authenticate(self, force_refresh: bool = False):
+        """Authenticate with Microsoft Graph API
+
+        Tokens are served from the cache while valid and refreshed silently
+        after that; the device code flow only runs when nothing is cached.
+        """
+        from msal import ConfidentialClientApplication, PublicClientApplication
+
+        if self._app is None:
+            authority = f"https://login.microsoftonline.com/{self.tenant_id}"
+            cache = self.token_cache.cache if self.token_cache else None
+            if self.client_secret:
+                self._app = ConfidentialClientApplication(
+                    self.client_id,
+                    authority=authority,
+                    client_credential=self.client_secret,
+                    token_cache=cache,
+                )
+            else:
+                self._app = PublicClientApplication(
+                    self.client_id, authority=authority, token_cache=cache
+                )
 
         if self.client_secret:
             # Service principal authentication
-            app = ConfidentialClientApplication(
-                self.client_id,
-                authority=authority,
-                client_credential=self.client_secret,
+            if force_refresh:
+                self._app.remove_tokens_for_client()
+            result = self._app.acquire_token_for_client(
+                scopes=["https://graph.microsoft.com/.default"]
             )
-            result = app.acquire_token_for_client(scopes=scopes)
         else:
-            # Device code flow for interactive auth
-            app = PublicClientApplication(self.client_id, authority=authority)
             scopes = ["Mail.ReadWrite", "Mail.Send"]
-
-            # Try to get token from cache first
-            accounts = app.get_accounts()
+            result = None
+            accounts = self._app.get_accounts(username=self.user_email)
             if accounts:
-                result = app.acquire_token_silent(scopes, account=accounts[0])
-            else:
-                flow = app.initiate_device_flow(scopes=scopes)
+                result = self._app.acquire_token_silent(
+                    scopes, account=accounts[0], force_refresh=force_refresh
+                )
+            if not result:
+                if self.access_token:
+                    raise Exception(
+                        "Office 365 token refresh failed, run --test to sign in again"
+                    )
+                # Device code flow for interactive auth
+                flow = self._app.initiate_device_flow(scopes=scopes)
                 print(flow["message"])
-                result = app.acquire_token_by_device_flow(flow)
+                result = self._app.acquire_token_by_device_flow(flow)
+
+        if self.token_cache:
+            self.token_cache.save()
 
         if "access_token" in result:
+            refreshed = self.access_token is not None
             self.access_token = result["access_token"]
-            logger.info("Successfully authenticated with Office 365")
+            self._token_expires = time.time() + int(result.get("expires_in", 3600))
+            source = result.get("token_source", "identity_provider")
+            if refreshed:
+                logger.info(f"Refreshed Office 365 access token ({source})")
+            else:
+                logger.info(f"Successfully authenticated with Office 365 ({source})")
         else:
             raise Exception(f"Authentication failed: {result.get('error_description')}")
 
-    def _make_request(self, method: str, endpoint: str, **kwargs) -> requests.Response:
-        """Make authenticated request to Graph API"""
-        url = f"https://graph.microsoft.com/v1.0{endpoint}"
-        headers = {
-            "Authorization": f"Bearer {self.access_token}",
-            "Content-Type": "application/json",
-        }
-        response = requests.request(method, url, headers=headers, **kwargs)
+    def _refresh_token(self, stale_token: Optional[str], reason: str):
+        """Replace stale_token, unless another thread already did
+
+        reason is "expiring" ahead of the expiry time or "rejected" after a
+        401; a rejected token is refreshed even if MSAL still considers it
+        valid.
+        """
+        with self._auth_lock:
+            if self.access_token == stale_token:
+                metrics.inc("token_refreshes", reason=reason)
+                self._authenticate(force_refresh=reason == "rejected")
+
+    def _make_request(
+        self, method: str, endpoint: str, **kwargs
+    ) -> "requests.Response":
+        """Make authenticated request to Graph API
+
+        endpoint is either a path below the API root or an absolute URL, such
+        as a nextLink or deltaLink returned by a previous request. A token
+        that expires or is revoked mid-run is refreshed and the request
+        replayed once.
+        """
+        if endpoint.startswith(("http://", "https://")):
+            url = endpoint
+        else:
+            url = f"{self.graph_url}{endpoint}"
+        extra_headers = kwargs.pop("headers", {})
+
+        token = self.access_token
+        if (
+            self._token_expires
+            and time.time() > self._token_expires - self.REFRESH_MARGIN
+        ):
+            self._refresh_token(token, "expiring")
+            token = self.access_token
+        response = self.http.request(
+            method, url, headers=self._headers(token, extra_headers), **kwargs
+        )
+        if response.status_code == 401:
+            logger.debug(f"{method} {url} returned 401, refreshing the token")
+            self._refresh_token(token, "rejected")
+            response = self.http.request(
+                method,
+                url,
+                headers=self._headers(self.access_token, extra_headers),
+                **kwargs,
+            )
         response.raise_for_status()
         return response
 
+    @staticmethod
+    def _headers(token: Optional[str], extra: Dict[str, str]) -> Dict[str, str]:
+        return {
+            "Authorization": f"Bearer {token}",
+            "Content-Type": "application/json",
+            **extra,
+        }
+
     def test_connection(self) -> bool:
         try:
             self._make_request("GET", "/me/mailFolders")
@@ -378,40 +1625,320 @@ class Office365Provider(EmailProvider):
             logger.error(f"Office 365 connection test failed: {e}")
             return False
 
+    MESSAGE_FIELDS = "id,subject,from,bodyPreview,receivedDateTime,isRead"
+
+    # Longest bodyPreview Graph returns
+    GRAPH_PREVIEW_CHARS = 255
+
+    def _wants_body(self) -> bool:
+        return bool(
+            self.preview_chars and self.preview_chars > self.GRAPH_PREVIEW_CHARS
+        )
+
+    def _select_fields(self) -> str:
+        """$select value, adding headers and the body when they are wanted"""
+        fields = self.MESSAGE_FIELDS
+        if self.extra_headers:
+            fields += ",internetMessageHeaders"
+        if self._wants_body():
+            fields += ",body"
+        return fields
+
+    def _prefer(self, page_size: Optional[int] = None) -> Dict[str, str]:
+        """Prefer header asking for text bodies and, optionally, a page size"""
+        preferences = []
+        if page_size:
+            preferences.append(f"odata.maxpagesize={page_size}")
+        if self._wants_body():
+            preferences.append('outlook.body-content-type="text"')
+        return {"Prefer": ", ".join(preferences)} if preferences else {}
+
+    def sync_key(self, folder: str) -> str:
+        return f"office365:{self.user_email or 'me'}:{folder}"
+
     def get_emails(self, folder: str = "inbox", limit: int = 50) -> List[Email]:
         """Get emails from Office 365"""
-        try:
-            response = self._make_request(
-                "GET",
-                f"/me/mailFolders/{folder}/messages",
-                params={
-                    "$top": limit,
-                    "$select": "id,subject,from,bodyPreview,receivedDateTime,isRead",
-                    "$orderby": "receivedDateTime DESC",
-                },
+        return list(self.iter_emails(folder=folder, limit=limit))
+
+    def iter_emails(
+        self, folder: str = "inbox", limit: int = 50, page_size: int = 100
+    ) -> Iterator[Email]:
+        """Yield emails from Office 365, following @odata.nextLink page by page
+
+        With a sync store, only messages created or changed since the last
+        committed deltaLink are returned, after the emails earlier runs left
+        unprocessed; the first run lists the folder through an initial delta
+        round. Errors are raised, so a failed fetch never commits a sync
+        position.
+        """
+        self._pending_sync.pop(self.sync_key(folder), None)
+        if self.sync_store is not None:
+            state = self.sync_store.get(self.sync_key(folder))
+            attempts = state.get("retry") or {}
+            retried = self.get_emails_by_id(folder, list(attempts)) if attempts else {}
+            yield from retried.values()
+            if state.get("delta_link"):
+                link, params = state["delta_link"], None
+            else:
+                link, params = self._delta_start(folder, limit)
+            yield from self._iter_delta(
+                folder, limit, link, page_size, params, attempts, retried
             )
+            return
 
-            data = response.json()
-            emails = []
-
+        count = 0
+        link = f"/me/mailFolders/{folder}/messages"
+        params = {
+            "$top": min(page_size, limit),
+            "$select": self._select_fields(),
+            "$orderby": "receivedDateTime DESC",
+        }
+        while link and count < limit:
+            with metrics.timer("fetch"):
+                data = self._make_request(
+                    "GET", link, params=params, headers=self._prefer()
+                ).json()
+            # nextLink already carries the query
+            params = None
+            for item in data.get("value", [])[: limit - count]:
+                with metrics.timer("parse"):
+                    email = self._parse_message(item, folder)
+                count += 1
+                yield email
+            link = data.get("@odata.nextLink")
+
+    def _parse_message(self, item: Dict[str, Any], folder: str) -> Email:
+        """Convert a Graph message resource to an Email"""
+        sender = item.get("from", {}).get("emailAddress", {})
+        headers = {
+            header["name"].lower(): header["value"]
+            for header in item.get("internetMessageHeaders") or []
+            if header["name"].lower() in self.extra_headers
+        }
+        body = item.get("body") or {}
+        if body.get("content"):
+            preview = body["content"]
+            if body.get("contentType", "").lower() == "html":
+                preview = html_to_text(preview)
+            preview = preview.strip()[: self.preview_chars]
+        else:
+            preview = item.get("bodyPreview", "")
+        return Email(
+            id=item["id"],
+            subject=item.get("subject") or "(no subject)",
+            sender=sender.get("name", "Unknown"),
+            sender_email=sender.get("address", "Unknown"),
+            body_preview=preview,
+            received_datetime=item.get("receivedDateTime", ""),
+            is_read=item.get("isRead", False),
+            folder=folder,
+            headers=headers,
+        )
+
+    def _delta_start(self, folder: str, limit: int) -> Tuple[str, Dict[str, str]]:
+        """The request starting a delta round over the newest limit emails
+
+        The initial round doubles as the listing, so mail arriving while it
+        is paged through is reported by the next round instead of falling
+        between a listing and a later baseline. It is filtered to the
+        receivedDateTime of the limit-th newest email, found with a one-item
+        listing; emails sharing that time may take it slightly over limit.
+        """
+        data = self._make_request(
+            "GET",
+            f"/me/mailFolders/{folder}/messages",
+            params={
+                "$top": 1,
+                "$skip": limit - 1,
+                "$select": "receivedDateTime",
+                "$orderby": "receivedDateTime DESC",
+            },
+        ).json()
+        params = {"$select": self._select_fields()}
+        if data.get("value"):
+            oldest = data["value"][0]["receivedDateTime"]
+            params["$filter"] = f"receivedDateTime ge {oldest}"
+        return f"/me/mailFolders/{folder}/messages/delta", params
+
+    def _iter_delta(
+        self,
+        folder: str,
+        limit: int,
+        link: str,
+        page_size: int,
+        params: Optional[Dict[str, str]] = None,
+        attempts: Optional[Dict[str, int]] = None,
+        retried: Optional[Dict[str, Email]] = None,
+    ) -> Iterator[Email]:
+        """Yield messages created or changed since a deltaLink
+
+        link is a stored deltaLink, or the start of an initial round with
+        its query in params. Pages are consumed whole; once limit is reached
+        the next page's link is kept as the cursor so the following run
+        resumes from there. retried holds the emails already yielded from
+        the stored retry attempts, which the round skips.
+        """
+        attempts, retried = attempts or {}, retried or {}
+        ids = list(retried)
+        count = 0
+        while link:
+            with metrics.timer("fetch"):
+                data = self._make_request(
+                    "GET",
+                    link,
+                    params=params,
+                    headers=self._prefer(page_size=min(page_size, limit)),
+                ).json()
+            # nextLink and deltaLink already carry the query
+            params = None
             for item in data.get("value", []):
-                emails.append(
-                    Email(
-                        id=item["id"],
-                        subject=item.get("subject", "(no subject)"),
-                        sender=item["from"]["emailAddress"]["name"],
-                        sender_email=item["from"]["emailAddress"]["address"],
-                        body_preview=item.get("bodyPreview", ""),
-                        received_datetime=item["receivedDateTime"],
-                        is_read=item.get("isRead", False),
-                        folder=folder,
+                if "@removed" not in item and item["id"] not in retried:
+                    with metrics.timer("parse"):
+                        email = self._parse_message(item, folder)
+                    ids.append(email.id)
+                    count += 1
+                    yield email
+            cursor = data.get("@odata.nextLink") or data.get("@odata.deltaLink")
+            link = data.get("@odata.nextLink") if count < limit else None
+        self._pending_sync[self.sync_key(folder)] = {
+            "state": {"delta_link": cursor},
+            "ids": ids,
+            "attempts": attempts,
+            "gone": set(attempts) - set(retried),
+        }
+        logger.info(f"Delta sync returned {count} new or changed emails")
+
+    # Maximum number of requests Graph accepts in one JSON batch
+    GRAPH_BATCH_LIMIT = 20
+
+    def apply_actions(self, actions: List[ProviderAction]) -> List[bool]:
+        """Apply actions through the Graph JSON $batch endpoint
+
+        Actions are sent GRAPH_BATCH_LIMIT at a time. Sub-requests answered
+        with 429 or 5xx are retried under the HTTP retry policy, waiting for
+        the longest Retry-After among them; any other failure is final.
+        """
+        results = [False] * len(actions)
+        pending = {}
+        for index, action in enumerate(actions):
+            request = self._batch_request(action)
+            if request is None:
+                logger.warning(f"Unknown provider operation: {action.operation}")
+                continue
+            pending[str(index)] = dict(request, id=str(index))
+
+        ids = list(pending)
+        for start in range(0, len(ids), self.GRAPH_BATCH_LIMIT):
+            batch = {i: pending[i] for i in ids[start : start + self.GRAPH_BATCH_LIMIT]}
+            for request_id in self._send_batch(batch):
+                results[int(request_id)] = True
+        return results
+
+    def get_emails_by_id(self, folder: str, ids: List[str]) -> Dict[str, Email]:
+        """Fetch emails by Graph id through $batch, GRAPH_BATCH_LIMIT at a time
+
+        Messages keep their id when moved, so each one's parentFolderId is
+        checked against the folder's.
+        """
+        folder_id = self._folder_id(folder)
+        fields = f"{self.MESSAGE_FIELDS},parentFolderId"
+        found = {}
+        for start in range(0, len(ids), self.GRAPH_BATCH_LIMIT):
+            batch = {
+                str(index): {
+                    "id": str(index),
+                    "method": "GET",
+                    "url": f"/me/messages/{ids[index]}?$select={fields}",
+                }
+                for index in range(start, min(start + self.GRAPH_BATCH_LIMIT, len(ids)))
+            }
+            for item in self._send_batch(batch).values():
+                if item.get("parentFolderId") != folder_id:
+                    continue
+                email = self._parse_message(item, folder)
+                found[email.id] = email
+        return found
+
+    def _folder_id(self, folder: str) -> str:
+        """Graph id of a folder given by id or well-known name like inbox"""
+        if folder not in self._folder_ids:
+            response = self._make_request(
+                "GET", f"/me/mailFolders/{folder}", params={"$select": "id"}
+            )
+            self._folder_ids[folder] = response.json()["id"]
+        return self._folder_ids[folder]
+
+    def _batch_request(self, action: ProviderAction) -> Optional[Dict[str, Any]]:
+        """Describe an action as a $batch sub-request"""
+        url = f"/me/messages/{action.email_id}"
+        if action.operation == "move":
+            body = {"destinationId": action.destination}
+            return {"method": "POST", "url": f"{url}/move", "body": body}
+        elif action.operation == "mark_read":
+            return {"method": "PATCH", "url": url, "body": {"isRead": True}}
+        elif action.operation == "delete":
+            return {"method": "DELETE", "url": url}
+        return None
+
+    def _send_batch(self, batch: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+        """Send one $batch request, retrying throttled sub-requests
+
+        Returns the response bodies of the sub-requests that succeeded, by id.
+        """
+        succeeded: Dict[str, Any] = {}
+        attempt = 0
+        while batch:
+            body = {
+                "requests": [
+                    (
+                        dict(request, headers={"Content-Type": "application/json"})
+                        if "body" in request
+                        else request
+                    )
+                    for request in batch.values()
+                ]
+            }
+            try:
+                response = self._make_request("POST", "/$batch", json=body)
+            except Exception as e:
+                logger.error(f"Graph batch request failed: {e}")
+                return succeeded
+
+            retry, delay = {}, 0.0
+            for sub in response.json().get("responses", []):
+                request = batch.get(sub.get("id"))
+                if request is None:
+                    continue
+                status = int(sub.get("status", 0))
+                if 200 <= status < 300:
+                    succeeded[sub["id"]] = sub.get("body")
+                elif (
+                    status == 429 or status >= 500
+                ) and attempt < self.http.retry.max_retries:
+                    retry[sub["id"]] = request
+                    headers = sub.get("headers") or {}
+                    delay = max(
+                        delay,
+                        self.http.retry.delay(attempt, headers.get("Retry-After")),
+                    )
+                elif status == 404 and request["method"] == "GET":
+                    logger.debug(f"{request['url']} no longer exists")
+                else:
+                    error = (sub.get("body") or {}).get("error", {})
+                    logger.error(
+                        f"Failed to {request['method']} {request['url']}: "
+                        f"{status} {error.get('message', '')}"
                     )
-                )
 
-            return emails
-        except Exception as e:
-            logger.error(f"Failed to get emails: {e}")
-            return []
+            batch = retry
+            if batch:
+                attempt += 1
+                logger.warning(
+                    f"Retrying {len(batch)} throttled Graph requests in {delay:.1f}s"
+                )
+                metrics.inc("http_retries", len(batch), reason="batch")
+                time.sleep(delay)
+        return succeeded
 
     def move_email(self, email_id: str, destination_folder: str) -> bool:
         """Move email to folder"""
@@ -447,11 +1974,464 @@ class Office365Provider(EmailProvider):
             return False
 
 
+# Atoms, quoted strings and parentheses in an IMAP response line. Section
+# specifiers like BODY[HEADER.FIELDS (FROM)]<0> are kept as a single atom.
+_IMAP_TOKEN = re.compile(
+    rb'\s*(?:(?P<open>\()|(?P<close>\))|"(?P<quoted>(?:[^"\\]|\\.)*)"'
+    rb"|(?P<atom>[^\s()\"\[]+(?:\[[^\]]*\](?:<\d+>)?)?))"
+)
+_IMAP_LITERAL = re.compile(rb"\{(\d+)\}$")
+
+
+def _parse_fetch_response(data: List[Any]) -> Iterator[Dict[str, Any]]:
+    """Parse imaplib FETCH data into one dict of items per message
+
+    imaplib returns each response as bytes, or as (prefix, literal) tuples
+    when it carries literals. Responses are parsed as they are consumed;
+    atoms and quoted strings become str, literals bytes, NIL None and
+    parenthesized lists Python lists. Item names are upper-cased, with any
+    partial fetch origin ("<0>") removed.
+    """
+    stack: List[list] = []
+    for element in data:
+        if element is None:
+            continue
+        if isinstance(element, tuple):
+            text, literal = element
+            text = _IMAP_LITERAL.sub(b"", text)
+        else:
+            text, literal = element, None
+
+        for match in _IMAP_TOKEN.finditer(text):
+            if match.group("open"):
+                stack.append([])
+            elif match.group("close"):
+                finished = stack.pop()
+                if stack:
+                    stack[-1].append(finished)
+                else:
+                    yield _fetch_items(finished)
+            elif match.group("quoted") is not None and stack:
+                stack[-1].append(
+                    re.sub(rb"\\(.)", rb"\1", match.group("quoted")).decode(
+                        errors="replace"
+                    )
+                )
+            elif match.group("atom") and stack:
+                atom = match.group("atom").decode(errors="replace")
+                stack[-1].append(None if atom.upper() == "NIL" else atom)
+        if literal is not None and stack:
+            stack[-1].append(literal)
+
+
+def _fetch_items(values: List[Any]) -> Dict[str, Any]:
+    """Pair up the name/value list of a FETCH response"""
+    items = {}
+    for name, value in zip(values[::2], values[1::2]):
+        if isinstance(name, str):
+            items[re.sub(r"<\d+>$", "", name.upper())] = value
+    return items
+
+
+def _uid_set(uids: List[int]) -> str:
+    """Compact UIDs into an IMAP sequence set such as 1:4,7,9:12"""
+    ranges = []
+    for uid in sorted(set(uids)):
+        if ranges and uid == ranges[-1][1] + 1:
+            ranges[-1][1] = uid
+        else:
+            ranges.append([uid, uid])
+    return ",".join(
+        str(start) if start == end else f"{start}:{end}" for start, end in ranges
+    )
+
+
+def _expand_uid_set(uid_set: str) -> Iterator[int]:
+    """Expand a compact sequence set produced by _uid_set"""
+    for part in uid_set.split(","):
+        start, _, end = part.partition(":")
+        yield from range(int(start), int(end or start) + 1)
+
+
+def _find_text_part(structure: List[Any], section: str = "") -> Optional[tuple]:
+    """Find the body part to preview in a parsed BODYSTRUCTURE
+
+    Returns (section, transfer encoding, charset, subtype) for the first
+    text/plain part that is not an attachment, falling back to the first
+    other text part, like _message_preview.
+    """
+    candidates = []
+
+    def walk(node: List[Any], path: str):
+        if node and isinstance(node[0], list):
+            # Multipart: child parts come first, then the subtype
+            for number, child in enumerate(
+                takewhile(lambda n: isinstance(n, list), node), 1
+            ):
+                walk(child, f"{path}.{number}" if path else str(number))
+            return
+        if len(node) < 6 or not isinstance(node[0], str):
+            return
+        if node[0].upper() != "TEXT":
+            return
+        # Extension data of a text part: MD5, then the disposition
+        disposition = node[9] if len(node) > 9 else None
+        if (
+            isinstance(disposition, list)
+            and disposition
+            and str(disposition[0]).upper() == "ATTACHMENT"
+        ):
+            return
+        params = node[2] if isinstance(node[2], list) else []
+        charset = next(
+            (
+                value
+                for key, value in zip(params[::2], params[1::2])
+                if isinstance(key, str) and key.upper() == "CHARSET"
+            ),
+            None,
+        )
+        subtype = str(node[1]).upper()
+        candidates.append(
+            (subtype, (path or "1", (node[5] or "7BIT").upper(), charset, subtype))
+        )
+
+    walk(structure, section)
+    for subtype, part in candidates:
+        if subtype == "PLAIN":
+            return part
+    return candidates[0][1] if candidates else None
+
+
+def _decode_body(data: bytes, encoding: str, charset: Optional[str]) -> str:
+    """Decode a possibly truncated body part"""
+    if encoding == "BASE64":
+        data = re.sub(rb"[^A-Za-z0-9+/=]", b"", data)
+        data = b64decode(data[: len(data) - len(data) % 4])
+    elif encoding == "QUOTED-PRINTABLE":
+        data = quopri.decodestring(data)
+    try:
+        return data.decode(charset or "utf-8", errors="ignore")
+    except LookupError:
+        return data.decode("utf-8", errors="ignore")
+
+
+def _preview_text(
+    data: bytes,
+    encoding: str,
+    charset: Optional[str],
+    html: bool,
+    preview_chars: int,
+) -> str:
+    """Body preview from the start of a text part, with LF line endings
+
+    Shared by the in-process and parser-process fetch paths so both give
+    the same preview for the same message.
+    """
+    text = _decode_body(data, encoding, charset)
+    if html:
+        text = " ".join(html_to_text(text).split())
+    text = text.replace("\r\n", "\n").replace("\r", "\n")
+    return text[:preview_chars]
+
+
+def _imap_email(
+    uid: int,
+    item: Dict[str, Any],
+    headers: Any,
+    body_preview: str,
+    folder: str,
+    extra_headers: List[str],
+) -> Email:
+    """Build an Email from parsed FETCH items and the message's headers"""
+    # Decode subject
+    subject = headers["subject"]
+    if subject:
+        decoded = decode_header(subject)[0]
+        if isinstance(decoded[0], bytes):
+            subject = decoded[0].decode(decoded[1] or "utf-8", errors="replace")
+        else:
+            subject = decoded[0]
+    else:
+        subject = "(no subject)"
+
+    from_header = str(headers.get("From", "Unknown"))
+    name, address = parseaddr(from_header)
+    if name:
+        name = str(make_header(decode_header(name)))
+
+    return Email(
+        id=str(uid),
+        subject=subject,
+        sender=name or from_header,
+        sender_email=address or from_header,
+        body_preview=body_preview,
+        received_datetime=headers.get("Date", ""),
+        is_read="\\Seen" in (item.get("FLAGS") or []),
+        folder=folder,
+        size=int(item["RFC822.SIZE"]) if item.get("RFC822.SIZE") else None,
+        headers={
+            name: str(headers[name])
+            for name in extra_headers
+            if headers[name] is not None
+        },
+    )
+
+
+def _message_preview(message: Any, preview_chars: int) -> str:
+    """Preview text of a parsed, possibly truncated, message
+
+    Uses the first text/plain part that is not an attachment, falling back
+    to the first other text part; HTML is converted to text.
+    """
+    parts = [
+        part
+        for part in message.walk()
+        if part.get_content_maintype() == "text"
+        and not part.get_content_disposition() == "attachment"
+    ]
+    part = next((p for p in parts if p.get_content_subtype() == "plain"), None)
+    part = part or (parts[0] if parts else None)
+    if part is None or not isinstance(part.get_payload(), str):
+        return ""
+    return _preview_text(
+        part.get_payload().encode("ascii", errors="surrogateescape"),
+        str(part.get("Content-Transfer-Encoding", "7BIT")).strip().upper(),
+        part.get_content_charset(),
+        part.get_content_subtype() == "html",
+        preview_chars,
+    )
+
+
+def parse_imap_messages(
+    data: List[Any], folder: str, extra_headers: List[str], preview_chars: int
+) -> Tuple[List[Email], float]:
+    """Build Emails from a FETCH of flags, size and the start of each message
+
+    Returns the emails and the seconds spent parsing. A module-level
+    function so that IMAPProvider can run it in worker processes.
+    """
+    start = time.perf_counter()
+    emails = []
+    for item in _parse_fetch_response(data):
+        if "UID" not in item:
+            continue
+        raw = next((v for k, v in item.items() if k.startswith("BODY[")), None)
+        message = message_from_bytes(raw if isinstance(raw, bytes) else b"")
+        emails.append(
+            _imap_email(
+                int(item["UID"]),
+                item,
+                message,
+                _message_preview(message, preview_chars),
+                folder,
+                extra_headers,
+            )
+        )
+    return emails, time.perf_counter() - start
+
+
+def _imap_readline(imap, timeout: float) -> Optional[bytes]:
+    """Read the next response line of an imaplib connection, with a timeout
+
+    Returns the line without CRLF, or None if none arrives within timeout.
+    Lines are read through imap.readline(), so nothing bypasses imaplib's
+    buffered reader. Bytes already in that buffer (or decrypted by TLS) are
+    invisible to select(), so the buffer is peeked first, with the socket
+    briefly non-blocking; only when it is empty does select() wait.
+    """
+    import ssl
+
+    sock = imap.socket()
+    previous = sock.gettimeout()
+    sock.setblocking(False)
+    try:
+        buffered = bool(imap.file.peek(1))
+    except (BlockingIOError, ssl.SSLWantReadError):
+        buffered = False
+    finally:
+        sock.settimeout(previous)
+    if not buffered and not select.select([sock], [], [], max(0.0, timeout))[0]:
+        return None
+    line = imap.readline()
+    if not line:
+        raise ConnectionError("IMAP server closed the connection")
+    return line.rstrip(b"\r\n")
+
+
+class IMAPSession:
+    """One authenticated IMAP connection and the folder it has selected"""
+
+    def __init__(self, connect: Callable[[], Any]):
+        self._connect = connect
+        self.imap = connect()
+        self.selected: Optional[str] = None
+        self.last_used = time.monotonic()
+        # IMAPConnectionPool.close() calls since the pool opened the session
+        self.generation = 0
+
+    def select(self, folder: str, force: bool = False):
+        """Select a folder read-write, unless it already is
+
+        force selects again, refreshing UIDVALIDITY and HIGHESTMODSEQ.
+        """
+        if folder == self.selected and not force:
+            return
+        self.selected = None
+        status, data = self.imap.select(folder)
+        if status != "OK":
+            raise Exception(f"Cannot select {folder}: {data}")
+        # The message count SELECT reports is not a change to the folder;
+        # only EXISTS announced later should wake IMAPProvider.idle()
+        self.imap.untagged_responses.pop("EXISTS", None)
+        self.imap.untagged_responses.pop("EXPUNGE", None)
+        self.selected = folder
+
+    def healthy(self) -> bool:
+        """Check the connection with a NOOP"""
+        try:
+            status, _ = self.imap.noop()
+            return status == "OK"
+        except Exception:
+            return False
+
+    def reconnect(self):
+        """Log in again on a new connection and re-select the previous folder"""
+        folder = self.selected
+        self.close()
+        self.imap = self._connect()
+        self.selected = None
+        if folder:
+            self.select(folder)
+
+    def close(self):
+        try:
+            self.imap.shutdown()
+        except Exception:
+            pass
+
+
+class IMAPConnectionPool:
+    """A bounded pool of IMAP sessions shared by the pipeline stages
+
+    Sessions are handed out one caller at a time, preferring one that
+    already has the requested folder selected so folders do not need to be
+    re-selected. New connections are opened on demand up to size. A session
+    unused for health_check_after seconds is checked with NOOP before
+    reuse and replaced if the server has dropped it.
+    """
+
+    def __init__(
+        self, connect: Callable[[], Any], size: int = 2, health_check_after: float = 60
+    ):
+        self._connect = connect
+        self.size = max(1, size)
+        self.health_check_after = health_check_after
+        self._cond = threading.Condition()
+        self._idle: List[IMAPSession] = []
+        self._open = 0
+        self._generation = 0
+
+    @contextmanager
+    def session(self, folder: Optional[str] = None) -> Iterator[IMAPSession]:
+        session = self._acquire(folder)
+        try:
+            yield session
+        finally:
+            session.last_used = time.monotonic()
+            with self._cond:
+                stale = session.generation != self._generation
+                if stale:
+                    self._open -= 1
+                else:
+                    self._idle.append(session)
+                self._cond.notify()
+            if stale:
+                session.close()
+
+    def _acquire(self, folder: Optional[str]) -> IMAPSession:
+        with self._cond:
+            while not self._idle and self._open >= self.size:
+                self._cond.wait()
+            if self._idle:
+                session = next(
+                    (s for s in self._idle if s.selected == folder), self._idle[-1]
+                )
+                self._idle.remove(session)
+            else:
+                self._open += 1
+                session = None
+            generation = self._generation
+
+        if session is None:
+            try:
+                session = IMAPSession(self._connect)
+                session.generation = generation
+                return session
+            except Exception:
+                with self._cond:
+                    self._open -= 1
+                    self._cond.notify()
+                raise
+
+        if time.monotonic() - session.last_used > self.health_check_after:
+            if not session.healthy():
+                logger.info("Idle IMAP connection went stale, reconnecting")
+                try:
+                    session.reconnect()
+                except Exception:
+                    with self._cond:
+                        self._open -= 1
+                        self._cond.notify()
+                    raise
+        return session
+
+    def close(self):
+        """Log out of every idle session; busy ones close when released
+
+        The pool stays usable: later callers get new connections.
+        """
+        with self._cond:
+            sessions, self._idle = self._idle, []
+            self._open -= len(sessions)
+            self._generation += 1
+            self._cond.notify_all()
+        for session in sessions:
+            session.close()
+
+
 class IMAPProvider(EmailProvider):
-    """Generic IMAP email provider (Gmail, Proton, etc.)"""
+    """Generic IMAP email provider (Gmail, Proton, etc.)
+
+    Commands run on a pool of up to `connections` sessions, so fetching one
+    folder, fetching another and applying actions can overlap. A command
+    that fails because the connection dropped is retried once on a fresh
+    connection with the same folder selected.
+
+    With parse_workers set (backlog mode), each window is fetched as the
+    first peek_bytes of every raw message and parsed in that many worker
+    processes while the next window downloads.
+    """
+
+    # Untagged responses that mean a watched folder has changed
+    _IDLE_CHANGE = re.compile(rb"^\* \d+ (EXISTS|EXPUNGE)\b", re.IGNORECASE)
+    # IDLE is the only command in flight while it runs, and imaplib's own
+    # tags never take this form
+    _IDLE_TAG = b"idle"
 
     def __init__(
-        self, host: str, port: int, username: str, password: str, use_ssl: bool = True
+        self,
+        host: str,
+        port: int,
+        username: str,
+        password: str,
+        use_ssl: bool = True,
+        sync_store: Optional[SyncStateStore] = None,
+        extra_headers: Optional[List[str]] = None,
+        preview_chars: Optional[int] = None,
+        connections: int = 2,
+        parse_workers: int = 0,
+        peek_bytes: int = 16384,
     ):
         import email
         import imaplib
@@ -462,121 +2442,577 @@ class IMAPProvider(EmailProvider):
         self.username = username
         self.password = password
         self.use_ssl = use_ssl
-        self.imap = None
+        self.imaplib = imaplib
         self.email_module = email
         self.decode_header = decode_header
-        self._connect()
+        self.extra_headers = [name.lower() for name in extra_headers or []]
+        self.preview_chars = preview_chars or self.PREVIEW_CHARS
+        self.parse_workers = parse_workers
+        self.peek_bytes = peek_bytes
+        self.sync_store = sync_store
+        self._pending_sync: Dict[str, Dict[str, Any]] = {}
+        self.condstore = False
+        # UIDs flagged \\Deleted per folder, expunged once in finish()
+        self._expunge_pending: Dict[str, set] = {}
+        # UIDs whose flags this run changed per folder, see _highestmodseq
+        self._flagged: Dict[str, set] = {}
+        self._expunge_lock = threading.Lock()
+        self.pool = IMAPConnectionPool(self._connect, size=connections)
+        # Log in once up front so bad credentials fail immediately
+        with self.pool.session():
+            pass
 
     def _connect(self):
-        """Connect to IMAP server"""
-        import imaplib
+        """Open and authenticate one IMAP connection"""
+        imaplib = self.imaplib
 
         try:
             if self.use_ssl:
-                self.imap = imaplib.IMAP4_SSL(self.host, self.port)
+                imap = imaplib.IMAP4_SSL(self.host, self.port)
             else:
-                self.imap = imaplib.IMAP4(self.host, self.port)
-
-            self.imap.login(self.username, self.password)
+                imap = imaplib.IMAP4(self.host, self.port)
+
+            imap.login(self.username, self.password)
+            self.capabilities = set(imap.capabilities)
+            self.condstore = False
+            if self.sync_store is not None and {"ENABLE", "CONDSTORE"} <= set(
+                self.capabilities
+            ):
+                # Makes SELECT report HIGHESTMODSEQ and enables MODSEQ searches;
+                # without it sync falls back to UIDs alone
+                try:
+                    imap.enable("CONDSTORE")
+                    self.condstore = True
+                except imaplib.IMAP4.error as e:
+                    logger.warning(f"Cannot enable CONDSTORE, syncing by UID: {e}")
             logger.info(f"Successfully connected to IMAP server {self.host}")
+            return imap
         except Exception as e:
             raise Exception(f"IMAP connection failed: {e}")
 
+    def _run(
+        self,
+        folder: Optional[str],
+        command: Callable[[Any], Any],
+        force_select: bool = False,
+    ) -> Any:
+        """Run command(imap) on a pooled session with folder selected
+
+        If the connection turns out to be dead, it is re-established with
+        the folder selected again and the command is retried once.
+        """
+        with self.pool.session(folder) as session:
+            for attempt in range(2):
+                try:
+                    if folder:
+                        session.select(folder, force=force_select)
+                    return command(session.imap)
+                except (self.imaplib.IMAP4.abort, OSError) as e:
+                    if attempt:
+                        raise
+                    logger.warning(f"IMAP connection lost ({e}), reconnecting")
+                    metrics.inc("imap_reconnects")
+                    session.reconnect()
+
+    def reconnect(self):
+        """Drop all pooled connections and check a new one can log in"""
+        self.pool.close()
+        with self.pool.session():
+            pass
+
+    def idle(
+        self,
+        folder: str,
+        timeout: float,
+        stop: Optional[threading.Event] = None,
+        tick: float = 1.0,
+    ) -> bool:
+        """Wait in IMAP IDLE (RFC 2177) until the folder changes
+
+        Returns True as soon as the server reports new or expunged messages,
+        including any it reported during earlier commands, and False once
+        timeout passes or stop is set. Servers without IDLE are polled: the
+        wait always ends after timeout with True. Connection failures raise,
+        so the caller can reconnect.
+
+        imaplib only gained IDLE in Python 3.14 (IMAP4.idle()), which can
+        replace this once older versions are dropped. Until then IDLE and
+        DONE go out through IMAP4.send() and the responses are read with
+        _imap_readline().
+        """
+        if "IDLE" not in self.capabilities:
+            if stop:
+                stop.wait(timeout)
+            else:
+                time.sleep(timeout)
+            return not (stop and stop.is_set())
+
+        with self.pool.session(folder) as session:
+            session.select(folder)
+            imap = session.imap
+            # imaplib queues changes announced alongside earlier responses
+            queued = [
+                imap.untagged_responses.pop(n, None) for n in ("EXISTS", "EXPUNGE")
+            ]
+            if any(queued):
+                return True
+
+            tag = self._IDLE_TAG
+            imap.send(tag + b" IDLE\r\n")
+            changed = False
+            while True:
+                line = _imap_readline(imap, timeout=30)
+                if line is None or line.startswith(tag + b" "):
+                    raise Exception(f"IDLE rejected by server: {line!r}")
+                if line.startswith(b"+"):
+                    break
+                changed = changed or bool(self._IDLE_CHANGE.match(line))
+
+            deadline = time.monotonic() + timeout
+            while not changed and not (stop and stop.is_set()):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                line = _imap_readline(imap, timeout=min(tick, remaining))
+                if line is None:
+                    continue
+                if line.upper().startswith(b"* BYE"):
+                    raise ConnectionError(f"IMAP server ended the session: {line!r}")
+                if self._IDLE_CHANGE.match(line):
+                    changed = True
+
+            imap.send(b"DONE\r\n")
+            while True:
+                line = _imap_readline(imap, timeout=30)
+                if line is None:
+                    raise ConnectionError("No response to IDLE DONE")
+                if line.startswith(tag + b" "):
+                    if not line[len(tag) + 1 :].upper().startswith(b"OK"):
+                        raise Exception(f"IDLE failed: {line!r}")
+                    return changed
+                if self._IDLE_CHANGE.match(line):
+                    changed = True
+
     def test_connection(self) -> bool:
         try:
-            status, _ = self.imap.list()
+            status, _ = self._run(None, lambda imap: imap.list())
             return status == "OK"
         except Exception as e:
             logger.error(f"IMAP connection test failed: {e}")
             return False
 
-    def get_emails(self, folder: str = "INBOX", limit: int = 50) -> List[Email]:
-        """Get emails from IMAP"""
+    def sync_key(self, folder: str) -> str:
+        return f"imap:{self.username}@{self.host}:{folder}"
+
+    def _select_uids(self, imap, folder: str, limit: int) -> List[int]:
+        """Return the UIDs of the emails to fetch from the selected folder
+
+        Without a sync store this is the most recent limit emails. With one,
+        it is the oldest limit emails that are new (UID above the last seen
+        UID), changed (MODSEQ above the stored HIGHESTMODSEQ, when the
+        server supports CONDSTORE) or left unprocessed by an earlier run. A
+        UIDVALIDITY change invalidates the stored UIDs and falls back to a
+        full resync.
+        """
+        _, [uidvalidity] = imap.response("UIDVALIDITY")
+        _, [highestmodseq] = imap.response("HIGHESTMODSEQ")
+
+        key = self.sync_key(folder)
+        state = self.sync_store.get(key) if self.sync_store is not None else {}
+        uidvalidity = int(uidvalidity)
+        highestmodseq = int(highestmodseq) if highestmodseq and self.condstore else None
+
+        if state and state.get("uidvalidity") != uidvalidity:
+            logger.warning(f"UIDVALIDITY of {folder} changed, resyncing from scratch")
+            state = {}
+        attempts = state.get("retry") or {}
+
+        if not state:
+            _, data = imap.uid("SEARCH", None, "ALL")
+            all_uids = [int(uid) for uid in data[0].split()]
+            selected = all_uids[-limit:]
+            # Older emails than the first limit are never fetched
+            last_uid = selected[0] - 1 if selected else max(all_uids, default=0)
+            complete = True
+        else:
+            last_uid = state["last_uid"]
+            _, data = imap.uid("SEARCH", None, f"UID {last_uid + 1}:*")
+            # "n:*" always matches the highest UID, even when it is below n
+            candidates = {int(uid) for uid in data[0].split() if int(uid) > last_uid}
+            changed: Set[int] = set()
+            if highestmodseq and state.get("highestmodseq"):
+                _, data = imap.uid(
+                    "SEARCH", None, f"MODSEQ {state['highestmodseq'] + 1}"
+                )
+                # Changed new emails are fetched as new ones anyway
+                changed = {int(uid) for uid in data[0].split() if int(uid) <= last_uid}
+            candidates.update(changed)
+            candidates.update(int(uid) for uid in attempts)
+            selected = sorted(candidates)[:limit]
+            # New emails sort after the changed ones, which may all fit
+            complete = changed <= set(selected)
+
+        if self.sync_store is not None:
+            self._pending_sync[key] = {
+                "folder": folder,
+                "uidvalidity": uidvalidity,
+                "last_uid": last_uid,
+                "uids": selected,
+                # Filled in as windows are fetched, see _fetched
+                "ids": [],
+                "gone": set(),
+                "attempts": attempts,
+                # Only advance past changed emails once all of them are fetched
+                "highestmodseq": highestmodseq if complete else None,
+                "previous_highestmodseq": state.get("highestmodseq"),
+            }
+        return selected
+
+    def _sync_position(
+        self, pending: Dict[str, Any], processed: Set[str]
+    ) -> Optional[Dict[str, Any]]:
+        """Advance last_uid over the new emails fetched, in UID order
+
+        Emails fetched but left unprocessed go into the retry counts. A
+        fetch that failed part way leaves last_uid before the first email it
+        did not return, and HIGHESTMODSEQ where it was.
+        """
+        fetched = set(pending["ids"]) | pending["gone"]
+        last_uid = pending["last_uid"]
+        for uid in pending["uids"]:
+            if uid <= pending["last_uid"]:
+                continue
+            if str(uid) not in fetched:
+                break
+            last_uid = uid
+        highestmodseq = pending["previous_highestmodseq"]
+        if pending["highestmodseq"] and all(
+            str(uid) in fetched for uid in pending["uids"]
+        ):
+            highestmodseq = self._highestmodseq(pending)
+        return {
+            "uidvalidity": pending["uidvalidity"],
+            "last_uid": last_uid,
+            "highestmodseq": highestmodseq,
+            "retry": self._retries(pending, processed),
+        }
+
+    def _highestmodseq(self, pending: Dict[str, Any]) -> int:
+        """HIGHESTMODSEQ to store after a run, past the run's own flag changes
+
+        Flagging an email raises its MODSEQ, so storing the value read when
+        the folder was selected would make the next run fetch everything
+        this run marked as changed. When every change since then is one of
+        this run's, the folder's current HIGHESTMODSEQ is stored instead.
+        """
+        folder, selected = pending["folder"], pending["highestmodseq"]
+        with self._expunge_lock:
+            flagged = self._flagged.pop(folder, set())
+        if not flagged:
+            return selected
+
+        def changes(imap):
+            _, [current] = imap.response("HIGHESTMODSEQ")
+            _, data = imap.uid("SEARCH", None, f"MODSEQ {selected + 1}")
+            return int(current), {int(uid) for uid in data[0].split()}
+
         try:
-            self.imap.select(folder)
-            _, message_numbers = self.imap.search(None, "ALL")
-
-            # Get most recent emails
-            msg_ids = message_numbers[0].split()[-limit:]
-            emails = []
-
-            for msg_id in msg_ids:
-                _, msg_data = self.imap.fetch(msg_id, "(RFC822)")
-                email_body = msg_data[0][1]
-                email_message = self.email_module.message_from_bytes(email_body)
-
-                # Decode subject
-                subject = email_message["subject"]
-                if subject:
-                    decoded = self.decode_header(subject)[0]
-                    if isinstance(decoded[0], bytes):
-                        subject = decoded[0].decode(decoded[1] or "utf-8")
-                    else:
-                        subject = decoded[0]
-                else:
-                    subject = "(no subject)"
-
-                # Get body preview
-                body_preview = ""
-                if email_message.is_multipart():
-                    for part in email_message.walk():
-                        if part.get_content_type() == "text/plain":
-                            body_preview = part.get_payload(decode=True).decode(
-                                "utf-8", errors="ignore"
-                            )[:200]
-                            break
-                else:
-                    body_preview = email_message.get_payload(decode=True).decode(
-                        "utf-8", errors="ignore"
-                    )[:200]
-
-                emails.append(
-                    Email(
-                        id=msg_id.decode(),
-                        subject=subject,
-                        sender=email_message.get("From", "Unknown"),
-                        sender_email=email_message.get("From", "Unknown"),
-                        body_preview=body_preview,
-                        received_datetime=email_message.get("Date", ""),
-                        is_read=False,  # IMAP doesn't easily expose this
-                        folder=folder,
+            current, changed = self._run(folder, changes, force_select=True)
+        except Exception as e:
+            logger.warning(f"Cannot read the HIGHESTMODSEQ of {folder} again: {e}")
+            return selected
+        return current if changed <= flagged else selected
+
+    def _fetched(
+        self, folder: str, uids: List[int], emails: List[Email]
+    ) -> List[Email]:
+        """Pass on a fetched window, noting the UIDs returned and those gone"""
+        pending = self._pending_sync.get(self.sync_key(folder))
+        if pending is not None:
+            found = {int(email.id) for email in emails}
+            pending["ids"].extend(email.id for email in emails)
+            pending["gone"].update(str(uid) for uid in uids if uid not in found)
+        return emails
+
+    # Headers requested alongside each message's structure and flags
+    HEADER_FIELDS = "SUBJECT FROM DATE"
+    # Characters of body text kept as the preview, unless set per instance
+    PREVIEW_CHARS = 200
+
+    def get_emails(self, folder: str = "INBOX", limit: int = 50) -> List[Email]:
+        """Get emails from IMAP, identified by UID"""
+        return list(self.iter_emails(folder=folder, limit=limit))
+
+    def iter_emails(
+        self, folder: str = "INBOX", limit: int = 50, page_size: int = 100
+    ) -> Iterator[Email]:
+        """Yield emails from IMAP in windows of page_size UIDs
+
+        For each window, headers, flags, size and body structure come back
+        from a single FETCH; a second FETCH per distinct text part section
+        then pulls just the first few hundred bytes of each body. BODY.PEEK
+        is used throughout so fetching never sets \\Seen. Errors are raised,
+        so a failed fetch never commits a sync position past it.
+        """
+        self._pending_sync.pop(self.sync_key(folder), None)
+        # Selecting again refreshes UIDVALIDITY and HIGHESTMODSEQ
+        uids = self._run(
+            folder,
+            lambda imap: self._select_uids(imap, folder, limit),
+            force_select=True,
+        )
+        if self.parse_workers > 0:
+            yield from self._iter_backlog(folder, uids, page_size)
+            return
+        for start in range(0, len(uids), page_size):
+            window = uids[start : start + page_size]
+            yield from self._fetched(folder, window, self._fetch_window(folder, window))
+
+    def _iter_backlog(
+        self, folder: str, uids: List[int], page_size: int
+    ) -> Iterator[Email]:
+        """Yield emails whose raw starts are parsed in worker processes
+
+        One FETCH per window returns flags, size and the first peek_bytes of
+        each message, and the response is handed to the process pool as is.
+        Up to twice parse_workers windows are parsed while more download;
+        results come back in UID order.
+
+        Workers are not forked from this process, whose other threads may
+        hold locks at the time, but started by a fork server (or spawned
+        where there is none) and import this module to unpickle the calls.
+        """
+        import multiprocessing
+        from concurrent.futures import Future, ProcessPoolExecutor
+
+        items = f"(UID FLAGS RFC822.SIZE BODY.PEEK[]<0.{self.peek_bytes}>)"
+        pending: deque = deque()
+
+        def collect(window: List[int], future: "Future") -> List[Email]:
+            emails, seconds = future.result()
+            metrics.observe("parse", seconds)
+            emails.sort(key=lambda email: int(email.id))
+            return self._fetched(folder, window, emails)
+
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context(
+            "forkserver" if "forkserver" in methods else "spawn"
+        )
+        with ProcessPoolExecutor(
+            max_workers=self.parse_workers, mp_context=context
+        ) as pool:
+            for start in range(0, len(uids), page_size):
+                window = uids[start : start + page_size]
+                uid_set = _uid_set(window)
+                with metrics.timer("fetch"):
+                    _, data = self._run(
+                        folder, lambda imap: imap.uid("FETCH", uid_set, items)
                     )
+                future = pool.submit(
+                    parse_imap_messages,
+                    data,
+                    folder,
+                    self.extra_headers,
+                    self.preview_chars,
                 )
+                pending.append((window, future))
+                while len(pending) >= 2 * self.parse_workers:
+                    yield from collect(*pending.popleft())
+            while pending:
+                yield from collect(*pending.popleft())
+
+    def get_emails_by_id(self, folder: str, ids: List[str]) -> Dict[str, Email]:
+        """Fetch emails by UID, without their body previews"""
+        emails = self._fetch_window(folder, [int(i) for i in ids], previews=False)
+        return {email.id: email for email in emails}
+
+    def _fetch_window(
+        self, folder: str, uids: List[int], previews: bool = True
+    ) -> List[Email]:
+        """Fetch one window of emails by UID, with body previews unless disabled"""
+
+        def fetch(imap):
+            with metrics.timer("fetch"):
+                _, data = imap.uid(
+                    "FETCH",
+                    _uid_set(uids),
+                    f"(UID FLAGS RFC822.SIZE BODYSTRUCTURE "
+                    f"BODY.PEEK[HEADER.FIELDS ({self._header_fields()})])",
+                )
+            messages = {}
+            with metrics.timer("parse"):
+                for item in _parse_fetch_response(data):
+                    if "UID" not in item:
+                        continue
+                    text_part = _find_text_part(item.get("BODYSTRUCTURE") or [])
+                    messages[int(item["UID"])] = (item, text_part)
+
+            if not previews:
+                return messages, {}
+            return messages, self._fetch_previews(
+                imap, {uid: part for uid, (_, part) in messages.items() if part}
+            )
 
-            return emails
-        except Exception as e:
-            logger.error(f"Failed to get emails: {e}")
-            return []
+        messages, texts = self._run(folder, fetch)
+
+        with metrics.timer("parse"):
+            return [
+                self._build_email(uid, messages[uid][0], texts.get(uid, ""), folder)
+                for uid in uids
+                if uid in messages
+            ]
+
+    def _header_fields(self) -> str:
+        """Header names for the HEADER.FIELDS fetch"""
+        extra = [name.upper() for name in self.extra_headers]
+        return " ".join(dict.fromkeys(self.HEADER_FIELDS.split() + extra))
+
+    def _fetch_previews(self, imap, text_parts: Dict[int, tuple]) -> Dict[int, str]:
+        """Fetch and decode the start of each email's text part
+
+        text_parts maps UID to (section, transfer encoding, charset, subtype).
+        Emails sharing a section are fetched together with a partial
+        BODY.PEEK. HTML parts are converted to text.
+        """
+        by_section: Dict[tuple, List[int]] = {}
+        for uid, (section, _, _, subtype) in text_parts.items():
+            by_section.setdefault((section, subtype == "HTML"), []).append(uid)
+
+        previews = {}
+        for (section, html), uids in by_section.items():
+            # Transfer encodings expand text and markup more so, so fetch
+            # several bytes per character of preview
+            octets = self.preview_chars * (16 if html else 4)
+            with metrics.timer("fetch"):
+                _, data = imap.uid(
+                    "FETCH", _uid_set(uids), f"(UID BODY.PEEK[{section}]<0.{octets}>)"
+                )
+            with metrics.timer("parse"):
+                for item in _parse_fetch_response(data):
+                    body = next(
+                        (v for k, v in item.items() if k.startswith("BODY[")), None
+                    )
+                    if "UID" not in item or not isinstance(body, bytes):
+                        continue
+                    uid = int(item["UID"])
+                    _, encoding, charset, _ = text_parts[uid]
+                    previews[uid] = _preview_text(
+                        body, encoding, charset, html, self.preview_chars
+                    )
+        return previews
+
+    def _build_email(
+        self, uid: int, item: Dict[str, Any], body_preview: str, folder: str
+    ) -> Email:
+        """Build an Email from parsed FETCH data"""
+        header_bytes = next(
+            (v for k, v in item.items() if k.startswith("BODY[HEADER")), b""
+        )
+        headers = self.email_module.message_from_bytes(header_bytes or b"")
+        return _imap_email(uid, item, headers, body_preview, folder, self.extra_headers)
+
+    def apply_actions(self, actions: List[ProviderAction]) -> List[bool]:
+        """Apply actions in bulk, one UID command per folder and target
+
+        Moves use UID MOVE (RFC 6851) when the server supports it and
+        otherwise UID COPY plus \\Deleted. Deletions and copied messages are
+        expunged once, in finish(), so UIDs stay valid for the whole run.
+        Actions without a folder apply to INBOX.
+        """
+        groups: Dict[tuple, List[int]] = {}
+        for index, action in enumerate(actions):
+            key = (action.folder or "INBOX", action.operation, action.destination)
+            groups.setdefault(key, []).append(index)
+
+        results = [False] * len(actions)
+        for (folder, operation, destination), indexes in groups.items():
+            uid_set = _uid_set([int(actions[i].email_id) for i in indexes])
+            try:
+                ok = self._run(
+                    folder,
+                    lambda imap: self._apply_group(
+                        imap, folder, operation, destination, uid_set
+                    ),
+                )
+            except Exception as e:
+                logger.error(f"Failed to {operation} emails {uid_set}: {e}")
+                ok = False
+            for i in indexes:
+                results[i] = ok
+        return results
+
+    def _apply_group(
+        self,
+        imap,
+        folder: str,
+        operation: str,
+        destination: Optional[str],
+        uid_set: str,
+    ) -> bool:
+        """Apply one operation to a UID set in the selected folder"""
+        if operation == "move" and "MOVE" in self.capabilities:
+            status, _ = imap.uid("MOVE", uid_set, destination)
+            return status == "OK"
+        if operation == "move":
+            status, _ = imap.uid("COPY", uid_set, destination)
+            if status != "OK":
+                return False
+            operation = "delete"
+        if operation == "mark_read":
+            status, _ = imap.uid("STORE", uid_set, "+FLAGS.SILENT", "(\\Seen)")
+            if status == "OK":
+                self._note_flagged(folder, uid_set)
+            return status == "OK"
+        if operation == "delete":
+            status, _ = imap.uid("STORE", uid_set, "+FLAGS.SILENT", "(\\Deleted)")
+            if status == "OK":
+                self._note_flagged(folder, uid_set)
+                with self._expunge_lock:
+                    self._expunge_pending.setdefault(folder, set()).update(
+                        int(uid) for uid in _expand_uid_set(uid_set)
+                    )
+            return status == "OK"
+        logger.warning(f"Unknown provider operation: {operation}")
+        return False
+
+    def _note_flagged(self, folder: str, uid_set: str):
+        """Remember UIDs whose flags this run changed, for _highestmodseq"""
+        if self.condstore and self.sync_store is not None:
+            with self._expunge_lock:
+                self._flagged.setdefault(folder, set()).update(
+                    int(uid) for uid in _expand_uid_set(uid_set)
+                )
+
+    def finish(self):
+        """Expunge messages deleted or copied away during the run
+
+        Uses UID EXPUNGE (UIDPLUS) so only this run's messages are removed.
+        """
+        with self._expunge_lock:
+            pending, self._expunge_pending = self._expunge_pending, {}
+        for folder, uids in pending.items():
+            try:
+                if "UIDPLUS" in self.capabilities:
+                    uid_set = _uid_set(list(uids))
+                    self._run(folder, lambda imap: imap.uid("EXPUNGE", uid_set))
+                else:
+                    self._run(folder, lambda imap: imap.expunge())
+            except Exception as e:
+                logger.error(f"Failed to expunge {folder}: {e}")
 
     def move_email(self, email_id: str, destination_folder: str) -> bool:
-        """Move email to folder"""
-        try:
-            self.imap.copy(email_id, destination_folder)
-            self.imap.store(email_id, "+FLAGS", "\\Deleted")
-            self.imap.expunge()
-            return True
-        except Exception as e:
-            logger.error(f"Failed to move email: {e}")
-            return False
+        """Move email to folder (expunged in finish())"""
+        return self.apply_actions(
+            [ProviderAction(email_id, "move", destination_folder)]
+        )[0]
 
     def mark_as_read(self, email_id: str) -> bool:
         """Mark email as read"""
-        try:
-            self.imap.store(email_id, "+FLAGS", "\\Seen")
-            return True
-        except Exception as e:
-            logger.error(f"Failed to mark as read: {e}")
-            return False
+        return self.apply_actions([ProviderAction(email_id, "mark_read")])[0]
 
     def delete_email(self, email_id: str) -> bool:
-        """Delete email"""
-        try:
-            self.imap.store(email_id, "+FLAGS", "\\Deleted")
-            self.imap.expunge()
-            return True
-        except Exception as e:
-            logger.error(f"Failed to delete email: {e}")
-            return False
+        """Delete email (expunged in finish())"""
+        return self.apply_actions([ProviderAction(email_id, "delete")])[0]
 
 
 # ============================================================================
@@ -587,11 +3023,51 @@ class IMAPProvider(EmailProvider):
 class Config:
     """Configuration management with support for files, env vars, and Docker secrets"""
 
+    # Environment variables overriding config keys
+    ENV_VARS = {
+        "EMAIL_PROVIDER": "email.provider",
+        "EMAIL_HOST": "email.imap.host",
+        "EMAIL_PORT": "email.imap.port",
+        "EMAIL_USERNAME": "email.username",
+        "EMAIL_PASSWORD": "email.password",
+        "O365_CLIENT_ID": "email.office365.client_id",
+        "O365_CLIENT_SECRET": "email.office365.client_secret",
+        "O365_TENANT_ID": "email.office365.tenant_id",
+        "O365_TOKEN_CACHE_KEY": "email.office365.token_cache.key",
+        "AI_MODEL": "ai.model",
+        "OLLAMA_URL": "ai.ollama.url",
+        "OLLAMA_MODEL": "ai.ollama.model",
+        "ANTHROPIC_API_KEY": "ai.anthropic.api_key",
+        "OPENAI_API_KEY": "ai.openai.api_key",
+    }
+
+    # Files in /run/secrets overriding config keys
+    DOCKER_SECRETS = {
+        "email_password": "email.password",
+        "o365_client_secret": "email.office365.client_secret",
+        "o365_token_cache_key": "email.office365.token_cache.key",
+        "anthropic_api_key": "ai.anthropic.api_key",
+        "openai_api_key": "ai.openai.api_key",
+    }
+
+    # Keys each entry of accounts: can take from its own env var or secret
+    ACCOUNT_SECRETS = (
+        "email.password",
+        "email.office365.client_secret",
+        "email.office365.token_cache.key",
+    )
+
     def __init__(self, config_file: Optional[Path] = None):
         self.config = {}
 
         # Load from config file if provided
         if config_file and config_file.exists():
+            try:
+                import yaml
+            except ImportError:
+                raise ValueError(
+                    "Reading a config file needs PyYAML: pip install pyyaml"
+                )
             with open(config_file, "r") as f:
                 self.config = yaml.safe_load(f) or {}
             logger.info(f"Loaded config from {config_file}")
@@ -602,43 +3078,54 @@ class Config:
         # Try to load Docker secrets
         self._load_docker_secrets()
 
-    def _load_env_vars(self):
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Config":
+        """Wrap already loaded settings, without env vars or secrets"""
+        config = cls.__new__(cls)
+        config.config = data
+        return config
+
+    @classmethod
+    def for_account(cls, name: str, entry: Dict[str, Any]) -> "Config":
+        """Settings of one accounts: entry, as an email: section
+
+        The account's secrets are read like the global ones, from env vars
+        suffixed with the account name (EMAIL_PASSWORD_WORK for "work") or
+        Docker secrets prefixed with it (work_email_password). Non
+        alphanumeric characters in the name become underscores.
+        """
+        config = cls.from_dict({"email": copy.deepcopy(entry)})
+        slug = re.sub(r"[^a-z0-9]+", "_", name.lower()).strip("_")
+        config._load_env_vars(
+            {
+                f"{var}_{slug.upper()}": key
+                for var, key in cls.ENV_VARS.items()
+                if key in cls.ACCOUNT_SECRETS
+            }
+        )
+        config._load_docker_secrets(
+            {
+                f"{slug}_{secret}": key
+                for secret, key in cls.DOCKER_SECRETS.items()
+                if key in cls.ACCOUNT_SECRETS
+            }
+        )
+        return config
+
+    def _load_env_vars(self, env_mapping: Optional[Dict[str, str]] = None):
         """Load configuration from environment variables"""
-        env_mapping = {
-            "EMAIL_PROVIDER": "email.provider",
-            "EMAIL_HOST": "email.imap.host",
-            "EMAIL_PORT": "email.imap.port",
-            "EMAIL_USERNAME": "email.username",
-            "EMAIL_PASSWORD": "email.password",
-            "O365_CLIENT_ID": "email.office365.client_id",
-            "O365_CLIENT_SECRET": "email.office365.client_secret",
-            "O365_TENANT_ID": "email.office365.tenant_id",
-            "AI_MODEL": "ai.model",
-            "OLLAMA_URL": "ai.ollama.url",
-            "OLLAMA_MODEL": "ai.ollama.model",
-            "ANTHROPIC_API_KEY": "ai.anthropic.api_key",
-            "OPENAI_API_KEY": "ai.openai.api_key",
-        }
-
-        for env_key, config_key in env_mapping.items():
+        for env_key, config_key in (env_mapping or self.ENV_VARS).items():
             value = os.getenv(env_key)
             if value:
                 self._set_nested(config_key, value)
 
-    def _load_docker_secrets(self):
+    def _load_docker_secrets(self, secret_mapping: Optional[Dict[str, str]] = None):
         """Load secrets from Docker Swarm secrets directory"""
         secrets_dir = Path("/run/secrets")
         if not secrets_dir.exists():
             return
 
-        secret_mapping = {
-            "email_password": "email.password",
-            "o365_client_secret": "email.office365.client_secret",
-            "anthropic_api_key": "ai.anthropic.api_key",
-            "openai_api_key": "ai.openai.api_key",
-        }
-
-        for secret_file, config_key in secret_mapping.items():
+        for secret_file, config_key in (secret_mapping or self.DOCKER_SECRETS).items():
             secret_path = secrets_dir / secret_file
             if secret_path.exists():
                 with open(secret_path, "r") as f:
@@ -666,137 +3153,2064 @@ class Config:
         return value if value is not None else default
 
 
+# ============================================================================
+# CATEGORIZATION CACHE
+# ============================================================================
+
+
+def _default_cache_path() -> Path:
+    """Default location of the categorization cache database"""
+    cache_home = Path(os.getenv("XDG_CACHE_HOME") or Path.home() / ".cache")
+    return cache_home / "email-assistant" / "categories.sqlite3"
+
+
+class CategorizationCache:
+    """Persistent SQLite cache of categorizations keyed by email content
+
+    Keys combine a hash of Email.to_summary() with a namespace derived from
+    the prompt and model name, so changing either misses every old entry;
+    those entries then age out through TTL and LRU eviction.
+    """
+
+    def __init__(
+        self, path: Path, ttl_seconds: float = 30 * 86400, max_entries: int = 50000
+    ):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(str(path), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS categories (
+                key TEXT PRIMARY KEY,
+                action TEXT NOT NULL,
+                reason TEXT NOT NULL,
+                folder TEXT,
+                confidence REAL,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL,
+                hit_count INTEGER NOT NULL DEFAULT 0
+            )
+            """)
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS categories_last_used ON categories (last_used)"
+        )
+        self._db.commit()
+        self.prune()
+
+    @staticmethod
+    def namespace(prompt: str, model_name: str) -> str:
+        """Hash of everything besides the email that affects a decision"""
+        return hashlib.sha256(f"{model_name}\0{prompt}".encode()).hexdigest()[:16]
+
+    @staticmethod
+    def key(email: Email, namespace: str) -> str:
+        """Cache key for an email under a prompt/model namespace"""
+        digest = hashlib.sha256(email.to_summary().encode()).hexdigest()[:32]
+        return f"{namespace}:{digest}"
+
+    def get_many(self, keys: List[str]) -> Dict[str, EmailCategory]:
+        """Look up cached categories, refreshing the LRU position of hits"""
+        if not keys:
+            return {}
+        now = time.time()
+        placeholders = ",".join("?" * len(keys))
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT key, action, reason, folder, confidence FROM categories "
+                f"WHERE key IN ({placeholders}) AND created_at >= ?",
+                (*keys, now - self.ttl_seconds),
+            ).fetchall()
+            found = {}
+            for key, action, reason, folder, confidence in rows:
+                try:
+                    found[key] = EmailCategory(
+                        action=EmailAction(action),
+                        reason=reason,
+                        folder=folder,
+                        confidence=confidence,
+                    )
+                except ValueError:
+                    continue
+            if found:
+                self._db.executemany(
+                    "UPDATE categories SET last_used = ?, hit_count = hit_count + 1 "
+                    "WHERE key = ?",
+                    [(now, key) for key in found],
+                )
+                self._db.commit()
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        metrics.inc("cache_lookups", len(found), result="hit")
+        metrics.inc("cache_lookups", len(keys) - len(found), result="miss")
+        return found
+
+    def put_many(self, items: List[tuple]):
+        """Store (key, EmailCategory) pairs, evicting least recently used entries"""
+        if not items:
+            return
+        now = time.time()
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO categories "
+                "(key, action, reason, folder, confidence, created_at, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        key,
+                        category.action.value,
+                        category.reason,
+                        category.folder,
+                        category.confidence,
+                        now,
+                        now,
+                    )
+                    for key, category in items
+                ],
+            )
+            self._evict()
+            self._db.commit()
+
+    def prune(self):
+        """Drop expired entries and enforce the size limit"""
+        with self._lock:
+            self._db.execute(
+                "DELETE FROM categories WHERE created_at < ?",
+                (time.time() - self.ttl_seconds,),
+            )
+            self._evict()
+            self._db.commit()
+
+    def _evict(self):
+        (count,) = self._db.execute("SELECT COUNT(*) FROM categories").fetchone()
+        if count > self.max_entries:
+            self._db.execute(
+                "DELETE FROM categories WHERE key IN ("
+                "SELECT key FROM categories ORDER BY last_used LIMIT ?)",
+                (count - self.max_entries,),
+            )
+
+    def stats(self) -> Dict[str, Any]:
+        """Summary of the cache contents and this session's hit rate"""
+        with self._lock:
+            entries, total_hits, oldest = self._db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(hit_count), 0), MIN(created_at) "
+                "FROM categories"
+            ).fetchone()
+        return {
+            "path": str(self.path),
+            "entries": entries,
+            "size_bytes": self.path.stat().st_size if self.path.exists() else 0,
+            "lifetime_hits": total_hits,
+            "oldest_age_days": (
+                round((time.time() - oldest) / 86400, 1) if oldest else None
+            ),
+            "session_hits": self.hits,
+            "session_misses": self.misses,
+        }
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+# ============================================================================
+# LOCAL CLASSIFIER
+# ============================================================================
+
+
+def _default_history_path() -> Path:
+    """Default location of the decision history used for training"""
+    state_home = Path(os.getenv("XDG_STATE_HOME") or Path.home() / ".local" / "state")
+    return state_home / "email-assistant" / "history.jsonl"
+
+
+def _default_classifier_path() -> Path:
+    """Default location of the trained local classifier"""
+    state_home = Path(os.getenv("XDG_STATE_HOME") or Path.home() / ".local" / "state")
+    return state_home / "email-assistant" / "classifier.npz"
+
+
+def _label(category: EmailCategory) -> str:
+    """Training label for a decision; move_folder labels include the folder"""
+    if category.action == EmailAction.MOVE_FOLDER:
+        return f"{category.action.value}:{category.folder}"
+    return category.action.value
+
+
+class DecisionHistory:
+    """Append-only JSONL log of model decisions, the classifier's training data
+
+    Keeps the latest max_records decisions: once the file holds a quarter
+    more than that, the oldest lines are dropped in one atomic rewrite.
+    """
+
+    def __init__(self, path: Path, max_records: int = 100000):
+        self.path = Path(path)
+        self.max_records = max_records
+        # Lines in the file, counted on first append
+        self._lines: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def append(self, emails: List[Email], categories: List[EmailCategory]):
+        now = time.time()
+        lines = "".join(
+            json.dumps(
+                {
+                    "time": now,
+                    "subject": email.subject,
+                    "sender_email": email.sender_email,
+                    "body_preview": email.body_preview,
+                    "label": _label(category),
+                }
+            )
+            + "\n"
+            for email, category in zip(emails, categories)
+        )
+        if not lines:
+            return
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            if self._lines is None:
+                self._lines = self._count_lines()
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(lines)
+            self._lines += lines.count("\n")
+            if self.max_records and self._lines > self.max_records * 5 // 4:
+                self._trim()
+
+    def _count_lines(self) -> int:
+        if not self.path.exists():
+            return 0
+        with open(self.path, "rb") as f:
+            return sum(
+                chunk.count(b"\n") for chunk in iter(lambda: f.read(1 << 20), b"")
+            )
+
+    def _trim(self):
+        """Keep the newest max_records lines, replacing the file atomically"""
+        with open(self.path, encoding="utf-8") as f:
+            kept = deque(f, maxlen=self.max_records)
+        temporary = self.path.with_name(f".{self.path.name}.tmp")
+        with open(temporary, "w", encoding="utf-8") as f:
+            f.writelines(kept)
+        os.replace(temporary, self.path)
+        self._lines = len(kept)
+
+    def load(self) -> List[Dict[str, Any]]:
+        """Read all decisions, keeping only the latest for repeated emails"""
+        if not self.path.exists():
+            return []
+        latest = {}
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                key = (
+                    record.get("sender_email"),
+                    record.get("subject"),
+                    record.get("body_preview"),
+                )
+                latest.pop(key, None)
+                latest[key] = record
+        return list(latest.values())
+
+
+class LocalClassifier:
+    """Softmax regression over hashed TF-IDF features, in NumPy
+
+    Tokens from the subject, sender address and domain, and body preview are
+    hashed into n_features buckets. Training runs full-batch AdaGrad on the
+    sparse feature matrix; prediction touches only the columns of one email's
+    tokens, so it takes microseconds. Saved as a compressed .npz file.
+    """
+
+    _WORD = re.compile(r"[^\W_]{2,}")
+
+    def __init__(
+        self,
+        labels: List[str],
+        weights: "np.ndarray",
+        bias: "np.ndarray",
+        idf: "np.ndarray",
+    ):
+        self.labels = labels
+        self.weights = weights
+        self.bias = bias
+        self.idf = idf
+        self.n_features = len(idf)
+        self.hits = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def tokens(cls, subject: str, sender_email: str, body_preview: str) -> List[str]:
+        sender = (sender_email or "").lower()
+        tokens = [f"f:{sender}"]
+        domain = sender.rpartition("@")[2]
+        while "." in domain:
+            tokens.append(f"d:{domain}")
+            domain = domain.partition(".")[2]
+        tokens += [f"s:{w}" for w in cls._WORD.findall((subject or "").lower())]
+        tokens += [f"b:{w}" for w in cls._WORD.findall((body_preview or "").lower())]
+        return tokens
+
+    @staticmethod
+    def _hashed(
+        tokens: List[str], n_features: int
+    ) -> Tuple["np.ndarray", "np.ndarray"]:
+        """Bucket indexes and log-scaled term frequencies of a token list"""
+        buckets = np.fromiter(
+            (zlib.crc32(t.encode()) for t in tokens), dtype=np.int64, count=len(tokens)
+        )
+        indices, counts = np.unique(buckets % n_features, return_counts=True)
+        return indices, 1.0 + np.log(counts)
+
+    @classmethod
+    def _matrix(cls, records: List[Dict[str, Any]], n_features: int) -> tuple:
+        """Hashed term frequencies of records as CSR arrays"""
+        indptr = [0]
+        indices, data = [], []
+        for record in records:
+            idx, tf = cls._hashed(
+                cls.tokens(
+                    record.get("subject"),
+                    record.get("sender_email"),
+                    record.get("body_preview"),
+                ),
+                n_features,
+            )
+            indices.append(idx)
+            data.append(tf)
+            indptr.append(indptr[-1] + len(idx))
+        return (
+            np.asarray(indptr),
+            np.concatenate(indices) if indices else np.zeros(0, dtype=np.int64),
+            np.concatenate(data) if data else np.zeros(0),
+        )
+
+    @staticmethod
+    def _normalize(indptr, data) -> "np.ndarray":
+        """L2-normalize each row of CSR data"""
+        rows = np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+        norms = np.sqrt(np.bincount(rows, weights=data**2, minlength=len(indptr) - 1))
+        return data / np.maximum(norms, 1e-12)[rows]
+
+    @classmethod
+    def train(
+        cls,
+        records: List[Dict[str, Any]],
+        n_features: int = 2**16,
+        epochs: int = 100,
+        learning_rate: float = 0.5,
+        l2: float = 1e-4,
+    ) -> "LocalClassifier":
+        """Fit a classifier to decision history records"""
+        labels = sorted({record["label"] for record in records})
+        if len(labels) < 2:
+            raise ValueError("Need decisions with at least two different actions")
+        y = np.array([labels.index(record["label"]) for record in records])
+        indptr, indices, tf = cls._matrix(records, n_features)
+        n, classes = len(records), len(labels)
+        rows = np.repeat(np.arange(n), np.diff(indptr))
+
+        df = np.bincount(indices, minlength=n_features)
+        idf = np.log((1.0 + n) / (1.0 + df)) + 1.0
+        data = cls._normalize(indptr, tf * idf[indices])
+
+        weights = np.zeros((classes, n_features))
+        bias = np.zeros(classes)
+        onehot = np.eye(classes)[y]
+        grad_sq_w = np.full_like(weights, 1e-8)
+        grad_sq_b = np.full_like(bias, 1e-8)
+        for _ in range(epochs):
+            logits = np.stack(
+                [
+                    np.bincount(rows, weights=data * weights[c, indices], minlength=n)
+                    for c in range(classes)
+                ],
+                axis=1,
+            )
+            logits += bias
+            probs = np.exp(logits - logits.max(axis=1, keepdims=True))
+            probs /= probs.sum(axis=1, keepdims=True)
+            error = (probs - onehot) / n
+            grad_w = np.stack(
+                [
+                    np.bincount(
+                        indices, weights=data * error[rows, c], minlength=n_features
+                    )
+                    for c in range(classes)
+                ]
+            )
+            grad_w += l2 * weights
+            grad_b = error.sum(axis=0)
+            grad_sq_w += grad_w**2
+            grad_sq_b += grad_b**2
+            weights -= learning_rate * grad_w / np.sqrt(grad_sq_w)
+            bias -= learning_rate * grad_b / np.sqrt(grad_sq_b)
+
+        return cls(labels, weights.astype(np.float32), bias, idf.astype(np.float32))
+
+    def predict_proba(
+        self, subject: str, sender_email: str, body_preview: str
+    ) -> Tuple[str, float]:
+        """Most likely label and its probability"""
+        indices, tf = self._hashed(
+            self.tokens(subject, sender_email, body_preview), self.n_features
+        )
+        values = tf * self.idf[indices]
+        values /= max(float(np.sqrt(values @ values)), 1e-12)
+        logits = self.weights[:, indices] @ values + self.bias
+        probs = np.exp(logits - logits.max())
+        best = int(probs.argmax())
+        return self.labels[best], float(probs[best] / probs.sum())
+
+    def classify(self, email: Email, threshold: float) -> Optional[EmailCategory]:
+        """Categorize an email if the classifier is at least threshold sure"""
+        label, confidence = self.predict_proba(
+            email.subject, email.sender_email, email.body_preview
+        )
+        if confidence < threshold:
+            return None
+        action, _, folder = label.partition(":")
+        with self._lock:
+            self.hits += 1
+        return EmailCategory(
+            action=EmailAction(action),
+            reason=f"Local classifier ({confidence:.0%} confident)",
+            folder=folder or None,
+            confidence=confidence,
+            source="local",
+        )
+
+    def evaluate(
+        self, records: List[Dict[str, Any]], thresholds: List[float]
+    ) -> List[Dict[str, Any]]:
+        """Coverage and accuracy of confident predictions at each threshold"""
+        predictions = [
+            self.predict_proba(
+                r.get("subject"), r.get("sender_email"), r.get("body_preview")
+            )
+            for r in records
+        ]
+        report = []
+        for threshold in thresholds:
+            answered = [
+                label == record["label"]
+                for (label, confidence), record in zip(predictions, records)
+                if confidence >= threshold
+            ]
+            report.append(
+                {
+                    "threshold": threshold,
+                    "coverage": len(answered) / len(records) if records else 0.0,
+                    "accuracy": sum(answered) / len(answered) if answered else None,
+                }
+            )
+        return report
+
+    def save(self, path: Path):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "wb") as f:
+            np.savez_compressed(
+                f,
+                labels=np.array(self.labels),
+                weights=self.weights,
+                bias=self.bias,
+                idf=self.idf,
+            )
+
+    @classmethod
+    def load(cls, path: Path) -> "LocalClassifier":
+        with np.load(path) as data:
+            return cls(
+                [str(label) for label in data["labels"]],
+                data["weights"],
+                data["bias"],
+                data["idf"],
+            )
+
+
+# ============================================================================
+# RULES ENGINE
+# ============================================================================
+
+
+@dataclass
+class Rule:
+    """A deterministic categorization rule from the rules: config section"""
+
+    name: str
+    category: EmailCategory
+    senders: List[str] = field(default_factory=list)
+    domains: List[str] = field(default_factory=list)
+    subject: Optional[re.Pattern] = None
+    folders: List[str] = field(default_factory=list)
+    headers: Dict[str, re.Pattern] = field(default_factory=dict)
+
+    def matches_rest(self, email: Email) -> bool:
+        """Check every condition except sender/domain"""
+        if self.subject and not self.subject.search(email.subject or ""):
+            return False
+        if self.folders and (email.folder or "").lower() not in self.folders:
+            return False
+        for name, pattern in self.headers.items():
+            value = email.headers.get(name)
+            if value is None or not pattern.search(value):
+                return False
+        return True
+
+
+class RulesEngine:
+    """Matches emails against rules compiled once at startup
+
+    Sender addresses and domains are hashed into lookup tables, and the
+    subject patterns of all rules are combined into one regex that
+    rejects most emails with a single scan. Rules apply in config order;
+    the first one whose conditions all hold wins. Within a rule, listed
+    senders and domains are alternatives, and every other condition must
+    also match.
+    """
+
+    def __init__(self, rules: List[Rule]):
+        self.rules = rules
+        self.hits = 0
+        self._lock = threading.Lock()
+        self._by_sender: Dict[str, List[int]] = {}
+        self._by_domain: Dict[str, List[int]] = {}
+        self._unkeyed: List[int] = []
+        for index, rule in enumerate(rules):
+            for sender in rule.senders:
+                self._by_sender.setdefault(sender, []).append(index)
+            for domain in rule.domains:
+                self._by_domain.setdefault(domain, []).append(index)
+            if not rule.senders and not rule.domains:
+                self._unkeyed.append(index)
+
+        subjects = [rule.subject.pattern for rule in rules if rule.subject]
+        try:
+            self._any_subject = (
+                re.compile("|".join(f"(?:{p})" for p in subjects), re.IGNORECASE)
+                # Numbered backreferences would point at another rule's group
+                if subjects and not any(re.search(r"\\[1-9]", p) for p in subjects)
+                else None
+            )
+        except re.error:
+            # Patterns with global inline flags cannot be combined
+            self._any_subject = None
+
+    @classmethod
+    def from_config(cls, entries: List[Dict[str, Any]]) -> "RulesEngine":
+        """Compile the rules: section of the config"""
+        rules = []
+        for number, entry in enumerate(entries or [], 1):
+            name = entry.get("name", f"rule {number}")
+            match = entry.get("match") or {}
+            try:
+                action = EmailAction(entry["action"])
+                rule = Rule(
+                    name=name,
+                    category=EmailCategory(
+                        action=action,
+                        reason=entry.get("reason") or f"Matched rule '{name}'",
+                        folder=entry.get("folder"),
+                        confidence=1.0,
+                        source="rule",
+                    ),
+                    senders=[s.lower() for s in _as_list(match.get("sender"))],
+                    domains=[
+                        d.lower().lstrip("@") for d in _as_list(match.get("domain"))
+                    ],
+                    subject=(
+                        re.compile(match["subject"], re.IGNORECASE)
+                        if match.get("subject")
+                        else None
+                    ),
+                    folders=[f.lower() for f in _as_list(match.get("folder"))],
+                    headers={
+                        str(header).lower(): re.compile(str(pattern), re.IGNORECASE)
+                        for header, pattern in (match.get("headers") or {}).items()
+                    },
+                )
+            except (KeyError, ValueError, re.error) as e:
+                raise ValueError(f"Invalid rule '{name}': {e}")
+            if action == EmailAction.MOVE_FOLDER and not rule.category.folder:
+                raise ValueError(f"Invalid rule '{name}': move_folder needs a folder")
+            rules.append(rule)
+        return cls(rules)
+
+    @property
+    def header_names(self) -> List[str]:
+        """Headers that rules match on, for providers to fetch"""
+        return sorted({name for rule in self.rules for name in rule.headers})
+
+    def match(self, email: Email) -> Optional[EmailCategory]:
+        """Return the category of the first matching rule, if any"""
+        if not self.rules:
+            return None
+
+        address = (email.sender_email or "").lower()
+        candidates = set(self._unkeyed)
+        candidates.update(self._by_sender.get(address, ()))
+        domain = address.rpartition("@")[2]
+        while domain:
+            candidates.update(self._by_domain.get(domain, ()))
+            domain = domain.partition(".")[2]
+
+        subject_possible = True
+        if self._any_subject is not None:
+            subject_possible = bool(self._any_subject.search(email.subject or ""))
+
+        for index in sorted(candidates):
+            rule = self.rules[index]
+            if rule.subject and not subject_possible:
+                continue
+            if rule.matches_rest(email):
+                with self._lock:
+                    self.hits += 1
+                return rule.category
+        return None
+
+
+def _as_list(value: Any) -> List[str]:
+    """Accept a single value or a list of values in rule conditions"""
+    if value is None:
+        return []
+    return [str(v) for v in value] if isinstance(value, list) else [str(value)]
+
+
+# ============================================================================
+# CLUSTERING
+# ============================================================================
+
+_SUBJECT_PREFIX = re.compile(r"^(\s*(re|fwd?|aw|wg)\s*(\[\d+\])?\s*:)+", re.IGNORECASE)
+_SUBJECT_DATE = re.compile(
+    r"\b\d{1,4}[-/.]\d{1,2}[-/.]\d{1,4}\b"
+    r"|\b(jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[a-z]*\.?"
+    r"\s+\d{1,2}(st|nd|rd|th)?\b(,?\s+\d{4})?",
+    re.IGNORECASE,
+)
+_SUBJECT_DIGITS = re.compile(r"\d+")
+
+
+def subject_template(subject: str) -> str:
+    """Normalize a subject so recurring messages share one template
+
+    Reply/forward prefixes are dropped and dates and numbers replaced, so
+    "Your order #1234 shipped Mar 3" and "Your order #987 shipped Apr 10"
+    give the same template.
+    """
+    template = _SUBJECT_PREFIX.sub("", subject or "").lower()
+    template = _SUBJECT_DATE.sub("#", template)
+    template = _SUBJECT_DIGITS.sub("#", template)
+    return " ".join(template.split())
+
+
+class EmailClusterer:
+    """Groups similar emails so one model decision can cover all of them
+
+    Emails are keyed by their List-Id, or failing that their normalized
+    sender address, plus the subject template when match_subject is set.
+    Clusters keep the order emails were fetched in and are split at
+    max_size.
+    """
+
+    def __init__(
+        self,
+        max_size: int = 50,
+        representatives: int = 1,
+        min_confidence: float = 0.8,
+        match_subject: bool = True,
+    ):
+        self.max_size = max(1, max_size)
+        self.representatives = min(max(1, representatives), 2)
+        self.min_confidence = min_confidence
+        self.match_subject = match_subject
+
+    @staticmethod
+    def normalize_sender(address: str) -> str:
+        """Lower-case an address and drop any +tag from the local part"""
+        local, _, domain = (address or "").strip().lower().rpartition("@")
+        if not local:
+            return domain
+        return f"{local.split('+', 1)[0]}@{domain}"
+
+    def key(self, email: Email) -> Optional[str]:
+        """Cluster key for an email, or None if it should stand alone"""
+        list_id = email.headers.get("list-id", "")
+        if "<" in list_id:
+            list_id = list_id[list_id.rfind("<") + 1 :].rstrip("> ")
+        origin = list_id.strip().lower() or self.normalize_sender(email.sender_email)
+        if not origin:
+            return None
+        if self.match_subject:
+            return f"{origin}|{subject_template(email.subject)}"
+        return origin
+
+    def group(self, emails: List[Email]) -> List[List[int]]:
+        """Split email indexes into clusters, in order of first appearance"""
+        clusters: Dict[Any, List[int]] = {}
+        for index, email in enumerate(emails):
+            key = self.key(email)
+            clusters.setdefault(index if key is None else key, []).append(index)
+        return [
+            members[start : start + self.max_size]
+            for members in clusters.values()
+            for start in range(0, len(members), self.max_size)
+        ]
+
+    def agreed(self, categories: List[EmailCategory]) -> Optional[EmailCategory]:
+        """The shared decision of a cluster's representatives, if confident
+
+        Representatives must agree on action and folder, and each must
+        reach min_confidence. A decision without a confidence only counts
+        when min_confidence is 0. Failed categorizations never propagate.
+        """
+        first = categories[0]
+        for category in categories:
+            if (category.action, category.folder) != (first.action, first.folder):
+                return None
+            if category.failed:
+                return None
+            confidence = category.confidence
+            if self.min_confidence > 0 and (
+                confidence is None or confidence < self.min_confidence
+            ):
+                return None
+        return first
+
+
+# ============================================================================
+# RESULTS
+# ============================================================================
+
+
+class ResultSink(ABC):
+    """Receives each categorization decision as it is made"""
+
+    @abstractmethod
+    def write(self, record: Dict[str, Any]):
+        """Take one decision record"""
+        pass
+
+    def close(self):
+        """Flush and release anything the sink holds open"""
+        pass
+
+
+class ResultSummary(ResultSink):
+    """Running totals of decisions, in memory independent of their number"""
+
+    def __init__(self):
+        self.total = 0
+        self.actions: Dict[str, int] = {}
+        self.sources: Dict[str, int] = {}
+        self.accounts: Dict[str, Dict[str, int]] = {}
+        self.folders: Dict[Tuple[str, str], int] = {}
+        self.first: Optional[float] = None
+        self.last: Optional[float] = None
+
+    def write(self, record: Dict[str, Any]):
+        action = record.get("action") or "unknown"
+        account = record.get("account") or ""
+        key = (account, record.get("folder") or "")
+        self.total += 1
+        self.actions[action] = self.actions.get(action, 0) + 1
+        source = record.get("source") or "model"
+        self.sources[source] = self.sources.get(source, 0) + 1
+        counts = self.accounts.setdefault(account, {})
+        counts[action] = counts.get(action, 0) + 1
+        self.folders[key] = self.folders.get(key, 0) + 1
+        when = record.get("time")
+        if isinstance(when, (int, float)):
+            self.first = when if self.first is None else min(self.first, when)
+            self.last = when if self.last is None else max(self.last, when)
+
+    def lines(self) -> List[str]:
+        """Summary lines: totals per action, and per account for several folders"""
+        lines = [f"Total emails processed: {self.total}"]
+        lines += [f"  {action}: {count}" for action, count in self.actions.items()]
+        if len(self.folders) > 1:
+            for account, counts in self.accounts.items():
+                details = ", ".join(f"{a}: {n}" for a, n in counts.items())
+                lines.append(f"  [{account}] {sum(counts.values())} emails ({details})")
+        return lines
+
+
+class JSONLResultSink(ResultSink):
+    """Writes records to a JSON Lines file, gzip-compressed if named .gz
+
+    Plain files are line buffered, so every decision reaches the file as it
+    is made and survives a crash. Compressed files are flushed every
+    flush_every records, which keeps what has been written readable. The
+    file is appended to, unless append is False.
+    """
+
+    def __init__(self, path: Path, flush_every: int = 100, append: bool = True):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        mode = "a" if append else "w"
+        if self.path.suffix == ".gz":
+            self._file = gzip.open(self.path, f"{mode}t", encoding="utf-8")
+            self.flush_every = flush_every
+        else:
+            self._file = open(self.path, mode, encoding="utf-8", buffering=1)
+            self.flush_every = 0
+        self._unflushed = 0
+
+    def write(self, record: Dict[str, Any]):
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        if self.flush_every:
+            self._unflushed += 1
+            if self._unflushed >= self.flush_every:
+                self._file.flush()
+                self._unflushed = 0
+
+    def close(self):
+        self._file.close()
+
+
+def result_record(
+    account: str, folder: str, email: Email, category: EmailCategory, dry_run: bool
+) -> Dict[str, Any]:
+    """The JSON-serializable record of one decision"""
+    return {
+        "time": time.time(),
+        "account": account,
+        "folder": folder,
+        "id": email.id,
+        "subject": email.subject,
+        "sender": email.sender_email,
+        "action": category.action.value,
+        "destination": category.folder,
+        "reason": category.reason,
+        "confidence": category.confidence,
+        "source": category.source or "model",
+        "dry_run": dry_run,
+    }
+
+
+def email_fingerprint(email: Email) -> str:
+    """Digest of the fields that show whether an email changed since it was seen"""
+    fields = [
+        email.subject,
+        email.sender_email,
+        email.received_datetime,
+        email.size,
+        email.is_read,
+    ]
+    return hashlib.sha256(json.dumps(fields).encode()).hexdigest()[:16]
+
+
+def plan_record(
+    account: str, email: Email, category: EmailCategory, action: ProviderAction
+) -> Dict[str, Any]:
+    """The plan file record of an action decided for an email"""
+    return {
+        "account": account,
+        "folder": action.folder,
+        "id": action.email_id,
+        "fingerprint": email_fingerprint(email),
+        "operation": action.operation,
+        "destination": action.destination,
+        "action": category.action.value,
+        "subject": email.subject,
+        "sender": email.sender_email,
+        "reason": category.reason,
+    }
+
+
+class PlanCheckpoint:
+    """How many records of a plan file have been applied
+
+    Kept next to the plan as <plan>.progress, together with the plan's size
+    and modification time so a rewritten plan starts over.
+    """
+
+    def __init__(self, plan: Path):
+        self.path = plan.with_name(f"{plan.name}.progress")
+        stat = plan.stat()
+        self.plan = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+    def load(self) -> int:
+        """Number of records already applied"""
+        try:
+            state = json.loads(self.path.read_text())
+        except (OSError, ValueError):
+            return 0
+        if state.get("plan") != self.plan:
+            logger.warning("Plan changed since it was last applied, starting over")
+            return 0
+        return int(state.get("done", 0))
+
+    def save(self, done: int):
+        """Record progress, replacing the checkpoint atomically"""
+        temporary = self.path.with_name(f".{self.path.name}.tmp")
+        temporary.write_text(
+            json.dumps({"plan": self.plan, "done": done, "updated": time.time()})
+        )
+        os.replace(temporary, self.path)
+
+
+def read_results(path: Path) -> Iterator[Dict[str, Any]]:
+    """Stream the records of a results file, plain or gzip-compressed
+
+    Unreadable lines are skipped, and a compressed file cut short by a crash
+    yields the records written before it.
+    """
+    with open(path, "rb") as f:
+        compressed = f.read(2) == b"\x1f\x8b"
+    opener = gzip.open if compressed else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        try:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if isinstance(record, dict):
+                    yield record
+        except EOFError:
+            logger.warning(f"{path} ends early, it was not closed cleanly")
+
+
+def report_results(paths: List[Path]) -> bool:
+    """Summarize one or more results files, streaming through them"""
+    summary = ResultSummary()
+    for path in paths:
+        try:
+            for record in read_results(path):
+                summary.write(record)
+        except OSError as e:
+            logger.error(f"Failed to read {path}: {e}")
+            return False
+
+    for line in summary.lines():
+        logger.info(line)
+    if summary.total:
+        details = ", ".join(f"{s}: {n}" for s, n in summary.sources.items())
+        logger.info(f"Decision sources: {details}")
+        for (account, folder), count in summary.folders.items():
+            logger.info(f"  {account}/{folder}: {count}")
+    if summary.first is not None:
+        first = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(summary.first))
+        last = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(summary.last))
+        logger.info(f"Decisions made from {first} to {last}")
+    return True
+
+
+# ============================================================================
+# BACKEND REGISTRY
+# ============================================================================
+
+
+@dataclass
+class Backend:
+    """A model or email provider factory and the packages it imports"""
+
+    name: str
+    factory: Callable[..., Any]
+    packages: Tuple[str, ...] = ()
+
+    def load(self):
+        """Import the backend's packages, failing clearly if one is missing"""
+        for package in self.packages:
+            try:
+                importlib.import_module(package)
+            except ImportError:
+                raise ValueError(
+                    f"The {self.name} backend needs the {package} package: "
+                    f"pip install {package}"
+                )
+
+
+# Backends by the name used for ai.model and email.provider
+MODEL_BACKENDS: Dict[str, Backend] = {}
+PROVIDER_BACKENDS: Dict[str, Backend] = {}
+
+
+def register_model(name: str, *packages: str):
+    """Register a factory building the model for ai.model: name
+
+    The factory is called with the Config and the run's BackendContext once
+    packages are imported, and returns an AIModel.
+    """
+
+    def register(factory: Callable[..., Any]) -> Callable[..., Any]:
+        MODEL_BACKENDS[name] = Backend(name, factory, packages)
+        return factory
+
+    return register
+
+
+def register_provider(name: str, *packages: str):
+    """Register a factory building the provider for email.provider: name
+
+    The factory is called with the Config, the Config holding the account's
+    email section and the run's BackendContext once packages are imported,
+    and returns an EmailProvider.
+    """
+
+    def register(factory: Callable[..., Any]) -> Callable[..., Any]:
+        PROVIDER_BACKENDS[name] = Backend(name, factory, packages)
+        return factory
+
+    return register
+
+
+@dataclass
+class BackendContext:
+    """Run-wide settings backends are built with, besides their config"""
+
+    workers: int = 1
+    backlog: bool = False
+    sync_store: Optional[SyncStateStore] = None
+    extra_headers: List[str] = field(default_factory=list)
+    preview_chars: Optional[int] = None
+
+
+def build_model(model_type: str, config: Config, context: BackendContext) -> AIModel:
+    """Create the registered model backend for model_type"""
+    backend = MODEL_BACKENDS.get(model_type)
+    if backend is None:
+        raise ValueError(f"Unknown AI model type: {model_type}")
+    backend.load()
+    return backend.factory(config, context)
+
+
+def build_provider(
+    config: Config, settings: Config, context: BackendContext
+) -> EmailProvider:
+    """Create the registered provider named by the email section of settings"""
+    provider_type = settings.get("email.provider", "office365")
+    backend = PROVIDER_BACKENDS.get(provider_type)
+    if backend is None:
+        raise ValueError(f"Unknown email provider: {provider_type}")
+    backend.load()
+    return backend.factory(config, settings, context)
+
+
+def retry_policy(config: Config) -> RetryPolicy:
+    """Retry policy shared by all HTTP backends"""
+    return RetryPolicy(
+        max_retries=int(config.get("http.max_retries", 3)),
+        backoff=float(config.get("http.backoff", 1.0)),
+        max_backoff=float(config.get("http.max_backoff", 60)),
+    )
+
+
+def _http_client(
+    config: Config, context: BackendContext, section: str, default_timeout: float
+) -> HTTPClient:
+    """Pooled HTTP client for a backend, sized for the worker pool"""
+    return HTTPClient(
+        pool_size=int(config.get("http.pool_size", max(10, context.workers))),
+        timeout=float(config.get(f"{section}.timeout", default_timeout)),
+        retry=retry_policy(config),
+    )
+
+
+@register_model("cascade")
+def cascade_model(config: Config, context: BackendContext) -> CascadeModel:
+    """Build the ordered tiers of ai.cascade, cheapest first"""
+    tiers = []
+    for entry in config.get("ai.cascade.tiers") or []:
+        model_type = entry["model"] if isinstance(entry, dict) else entry
+        if model_type == "cascade":
+            raise ValueError("A cascade tier cannot itself be a cascade")
+        min_confidence = (
+            entry.get("min_confidence", 0.8) if isinstance(entry, dict) else 0.8
+        )
+        tiers.append(
+            CascadeTier(
+                name=model_type,
+                model=build_model(model_type, config, context),
+                min_confidence=float(min_confidence),
+            )
+        )
+    escalate = config.get("ai.cascade.escalate_actions", ["delete"])
+    return CascadeModel(
+        tiers, escalate_actions=[EmailAction(a) for a in _as_list(escalate)]
+    )
+
+
+@register_model("ollama", "requests")
+def ollama_model(config: Config, context: BackendContext) -> AIModel:
+    return OllamaModel(
+        base_url=config.get("ai.ollama.url", "http://localhost:11434"),
+        model=config.get("ai.ollama.model", "qwen2.5:7b"),
+        http=_http_client(config, context, "ai.ollama", default_timeout=30),
+        keep_alive=config.get("ai.ollama.keep_alive", "30m"),
+    )
+
+
+@register_model("anthropic", "anthropic")
+def anthropic_model(config: Config, context: BackendContext) -> AIModel:
+    api_key = config.get("ai.anthropic.api_key")
+    if not api_key:
+        raise ValueError("Anthropic API key not found in config")
+    return AnthropicModel(
+        api_key=api_key,
+        model=config.get("ai.anthropic.model", "claude-3-5-sonnet-20241022"),
+        timeout=float(config.get("ai.anthropic.timeout", 60)),
+        max_retries=retry_policy(config).max_retries,
+        base_url=config.get("ai.anthropic.base_url"),
+    )
+
+
+@register_model("openai", "openai")
+def openai_model(config: Config, context: BackendContext) -> AIModel:
+    api_key = config.get("ai.openai.api_key")
+    if not api_key:
+        raise ValueError("OpenAI API key not found in config")
+    return OpenAIModel(
+        api_key=api_key,
+        model=config.get("ai.openai.model", "gpt-4"),
+        timeout=float(config.get("ai.openai.timeout", 60)),
+        max_retries=retry_policy(config).max_retries,
+        base_url=config.get("ai.openai.base_url"),
+    )
+
+
+def _token_cache(settings: Config) -> Optional[TokenCache]:
+    """Persistent MSAL token cache for an Office 365 account"""
+    if not settings.get("email.office365.token_cache.enabled", True):
+        return None
+    path = settings.get("email.office365.token_cache.path")
+    return TokenCache(
+        (
+            Path(path).expanduser()
+            if path
+            else _default_token_cache_path(
+                settings.get("email.office365.tenant_id", "common"),
+                settings.get("email.office365.client_id"),
+                settings.get("email.username"),
+            )
+        ),
+        key=settings.get("email.office365.token_cache.key"),
+    )
+
+
+@register_provider("office365", "requests", "msal")
+def office365_provider(
+    config: Config, settings: Config, context: BackendContext
+) -> EmailProvider:
+    return Office365Provider(
+        client_id=settings.get("email.office365.client_id"),
+        client_secret=settings.get("email.office365.client_secret"),
+        tenant_id=settings.get("email.office365.tenant_id", "common"),
+        user_email=settings.get("email.username"),
+        sync_store=context.sync_store,
+        graph_url=settings.get(
+            "email.office365.graph_url", "https://graph.microsoft.com/v1.0"
+        ),
+        http=_http_client(config, context, "email.office365", default_timeout=30),
+        extra_headers=context.extra_headers,
+        preview_chars=context.preview_chars,
+        token_cache=_token_cache(settings),
+    )
+
+
+@register_provider("imap")
+@register_provider("gmail")
+@register_provider("proton")
+def imap_provider(
+    config: Config, settings: Config, context: BackendContext
+) -> EmailProvider:
+    # Parser processes: email.imap.parse_workers, or a core each for --backlog
+    parse_workers = int(settings.get("email.imap.parse_workers", 0))
+    if context.backlog and parse_workers <= 0:
+        parse_workers = os.cpu_count() or 1
+    return IMAPProvider(
+        host=settings.get("email.imap.host"),
+        port=int(settings.get("email.imap.port", 993)),
+        username=settings.get("email.username"),
+        password=settings.get("email.password"),
+        use_ssl=settings.get("email.imap.ssl", True),
+        connections=int(settings.get("email.imap.connections", 2)),
+        sync_store=context.sync_store,
+        extra_headers=context.extra_headers,
+        preview_chars=context.preview_chars,
+        parse_workers=parse_workers,
+        peek_bytes=int(settings.get("email.imap.peek_bytes", 16384)),
+    )
+
+
 # ============================================================================
 # MAIN APPLICATION
 # ============================================================================
 
 
+# Marks the end of a pipeline stage's output on its queue
+_STAGE_DONE = object()
+
+
+@dataclass
+class MailSource:
+    """One account folder feeding the processing pipeline"""
+
+    account: str
+    provider: EmailProvider
+    folder: str
+
+    @property
+    def label(self) -> str:
+        return f"{self.account}/{self.folder}"
+
+
+class FairQueue:
+    """Work queue shared by several producers, served round-robin
+
+    Each key (an account) gets its own queue of at most maxsize items, and
+    get() takes from the keys in turn so one busy account cannot starve the
+    others. Producers register with open() and finish with close(); once
+    all have closed and the queues are drained, get() returns _STAGE_DONE.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._cond = threading.Condition()
+        self._queues: Dict[str, deque] = {}
+        self._turns: deque = deque()
+        self._producers = 0
+
+    def open(self, key: str):
+        with self._cond:
+            self._producers += 1
+            if key not in self._queues:
+                self._queues[key] = deque()
+                self._turns.append(key)
+
+    def close(self):
+        with self._cond:
+            self._producers -= 1
+            self._cond.notify_all()
+
+    def put(self, key: str, item: Any):
+        with self._cond:
+            while len(self._queues[key]) >= self.maxsize:
+                self._cond.wait()
+            self._queues[key].append(item)
+            self._cond.notify_all()
+
+    def get(self) -> Any:
+        with self._cond:
+            while True:
+                for _ in range(len(self._turns)):
+                    key = self._turns[0]
+                    self._turns.rotate(-1)
+                    if self._queues[key]:
+                        item = self._queues[key].popleft()
+                        self._cond.notify_all()
+                        return item
+                if self._producers == 0:
+                    return _STAGE_DONE
+                self._cond.wait()
+
+
 class EmailAssistant:
     """Main email assistant application"""
 
-    def __init__(self, config: Config, dry_run: bool = True):
+    def __init__(
+        self,
+        config: Config,
+        dry_run: bool = True,
+        workers: Optional[int] = None,
+        batch_size: Optional[int] = None,
+        use_cache: bool = True,
+        incremental: Optional[bool] = None,
+        watch: bool = False,
+        backlog: bool = False,
+        classify: bool = True,
+    ):
         self.config = config
         self.dry_run = dry_run
-        self.ai_model = self._init_ai_model()
-        self.email_provider = self._init_email_provider()
+        self.backlog = backlog
+        self.workers = max(1, workers or int(config.get("processing.workers", 1)))
+        self.batch_size = max(
+            1, batch_size or int(config.get("processing.batch_size", 10))
+        )
+        self.queue_size = max(
+            self.workers, int(config.get("processing.queue_size", 4 * self.workers))
+        )
+        self.apply_batch_size = int(config.get("processing.apply_batch_size", 100))
+        self.page_size = int(config.get("processing.page_size", 100))
+        self.max_fetchers = max(1, int(config.get("processing.max_fetchers", 4)))
+        if incremental is None:
+            incremental = config.get("sync.incremental", False)
+        self.sync_store = open_sync_store(config) if incremental else None
+        if watch and self.sync_store is None:
+            # Watching always fetches incrementally; a dry run keeps the
+            # position in memory so the stored one is left alone
+            self.sync_store = (
+                SyncStateStore(None) if dry_run else open_sync_store(config)
+            )
+        self.rules = RulesEngine.from_config(config.get("rules", []))
+        self.compactor = (
+            ContentCompactor(max_tokens=int(config.get("compaction.max_tokens", 256)))
+            if config.get("compaction.enabled", True)
+            else None
+        )
+        self.clusterer = self._init_clusterer()
+        self.cluster_window = int(config.get("clustering.window", 500))
+        self.propagated = 0
+        self._stats_lock = threading.Lock()
+        self.backends = BackendContext(
+            workers=self.workers,
+            backlog=backlog,
+            sync_store=self.sync_store,
+            extra_headers=self._extra_headers(),
+            preview_chars=self._preview_chars(),
+        )
+        # Applying a saved plan only needs the accounts, not the model
+        self.ai_model = self._init_ai_model() if classify else None
+        self.accounts, self.account_folders = self._init_accounts()
+        self.account_name = next(iter(self.accounts))
+        self.email_provider = self.accounts[self.account_name]
+        self.cache = self._init_cache() if use_cache and classify else None
+        self.history = (
+            open_history(config)
+            if classify
+            and config.get(
+                "classifier.record_history", config.get("classifier.enabled", False)
+            )
+            else None
+        )
+        self.classifier = self._init_classifier() if classify else None
+        self.classifier_threshold = float(config.get("classifier.threshold", 0.9))
+        self.metrics_textfile = config.get("metrics.textfile")
+        self.metrics_report = config.get("metrics.report")
+        self.profiler: Optional[RunProfiler] = None
+        self.result_sinks: List[ResultSink] = []
+        self.plan_sink: Optional[ResultSink] = None
 
     def _init_ai_model(self) -> AIModel:
         """Initialize AI model based on config"""
-        model_type = self.config.get("ai.model", "ollama")
-
-        if model_type == "ollama":
-            url = self.config.get("ai.ollama.url", "http://localhost:11434")
-            model = self.config.get("ai.ollama.model", "qwen2.5:7b")
-            return OllamaModel(base_url=url, model=model)
-
-        elif model_type == "anthropic":
-            api_key = self.config.get("ai.anthropic.api_key")
-            if not api_key:
-                raise ValueError("Anthropic API key not found in config")
-            model = self.config.get("ai.anthropic.model", "claude-3-5-sonnet-20241022")
-            return AnthropicModel(api_key=api_key, model=model)
-
-        elif model_type == "openai":
-            api_key = self.config.get("ai.openai.api_key")
-            if not api_key:
-                raise ValueError("OpenAI API key not found in config")
-            model = self.config.get("ai.openai.model", "gpt-4")
-            return OpenAIModel(api_key=api_key, model=model)
-
-        else:
-            raise ValueError(f"Unknown AI model type: {model_type}")
+        return build_model(
+            self.config.get("ai.model", "ollama"), self.config, self.backends
+        )
+
+    def _init_clusterer(self) -> Optional[EmailClusterer]:
+        """Set up sender/List-Id clustering if enabled in config"""
+        if not self.config.get("clustering.enabled", False):
+            return None
+        return EmailClusterer(
+            max_size=int(self.config.get("clustering.max_size", 50)),
+            representatives=int(self.config.get("clustering.representatives", 1)),
+            min_confidence=float(self.config.get("clustering.min_confidence", 0.8)),
+            match_subject=self.config.get("clustering.match_subject", True),
+        )
+
+    def _preview_chars(self) -> Optional[int]:
+        """Body characters to fetch per email; more when compaction can trim them"""
+        if not self.compactor:
+            return None
+        return int(self.config.get("compaction.preview_chars", 1000))
+
+    def _extra_headers(self) -> List[str]:
+        """Headers the provider must fetch for rules and clustering"""
+        names = set(self.rules.header_names)
+        if self.clusterer:
+            names.add("list-id")
+        return sorted(names)
+
+    def _init_classifier(self) -> Optional[LocalClassifier]:
+        """Load the trained local classifier if enabled in config"""
+        if not self.config.get("classifier.enabled", False):
+            return None
+        if not _load_numpy():
+            logger.warning("Local classifier needs numpy: pip install numpy")
+            return None
+        path = classifier_path(self.config)
+        if not path.exists():
+            logger.warning(f"No local classifier at {path}, run the train command")
+            return None
+        try:
+            return LocalClassifier.load(path)
+        except Exception as e:
+            logger.error(f"Failed to load local classifier: {e}")
+            return None
+
+    def _init_cache(self) -> Optional[CategorizationCache]:
+        """Open the categorization cache unless disabled in config"""
+        if not self.config.get("cache.enabled", True):
+            return None
+        return open_cache(self.config)
+
+    def _model_name(self) -> str:
+        """Identify the backend and model, for cache namespacing"""
+        backend = self.config.get("ai.model", "ollama")
+        return f"{backend}:{getattr(self.ai_model, 'model', '')}"
+
+    def _init_accounts(self) -> Tuple[Dict[str, EmailProvider], Dict[str, List[str]]]:
+        """Connect every account in the accounts: list, or the email: section
+
+        Returns providers and folders to process, keyed by account name.
+        """
+        entries = self.config.get("accounts")
+        if not entries:
+            name = self.config.get("email.username") or "default"
+            folders = list(self.config.get("email.folders") or ["inbox"])
+            return {name: self._init_email_provider()}, {name: folders}
+
+        providers, folders = {}, {}
+        for number, entry in enumerate(entries, 1):
+            name = str(entry.get("name") or entry.get("username") or f"account{number}")
+            if name in providers:
+                raise ValueError(f"Duplicate account name: {name}")
+            providers[name] = build_provider(
+                self.config, Config.for_account(name, entry), self.backends
+            )
+            folders[name] = list(entry.get("folders") or ["inbox"])
+        return providers, folders
 
     def _init_email_provider(self) -> EmailProvider:
         """Initialize email provider based on config"""
-        provider_type = self.config.get("email.provider", "office365")
+        return build_provider(self.config, self.config, self.backends)
+
+    def test_connections(self, model: bool = True) -> bool:
+        """Test all connections, or just the email providers"""
+        if model and self.ai_model:
+            logger.info("Testing AI model connection...")
+            if not self.ai_model.test_connection():
+                logger.error("AI model connection failed")
+                return False
+            logger.info("✓ AI model connection successful")
+
+        for name, provider in self.accounts.items():
+            logger.info(f"Testing email provider connection for {name}...")
+            if not provider.test_connection():
+                logger.error(f"Email provider connection failed for {name}")
+                return False
+            logger.info(f"✓ Email provider connection successful for {name}")
 
-        if provider_type == "office365":
-            return Office365Provider(
-                client_id=self.config.get("email.office365.client_id"),
-                client_secret=self.config.get("email.office365.client_secret"),
-                tenant_id=self.config.get("email.office365.tenant_id", "common"),
-                user_email=self.config.get("email.username"),
-            )
+        return True
 
-        elif provider_type in ["imap", "gmail", "proton"]:
-            return IMAPProvider(
-                host=self.config.get("email.imap.host"),
-                port=int(self.config.get("email.imap.port", 993)),
-                username=self.config.get("email.username"),
-                password=self.config.get("email.password"),
-                use_ssl=self.config.get("email.imap.ssl", True),
+    def process_emails(self, folder: str = "inbox", limit: int = 50):
+        """Process emails from one folder of the main account"""
+        source = MailSource(self.account_name, self.email_provider, folder)
+        return self._process([source], limit)
+
+    def process_accounts(self, limit: int = 50, folders: Optional[List[str]] = None):
+        """Process every configured account and folder in one pipeline
+
+        folders overrides the folders listed for each account.
+        """
+        sources = [
+            MailSource(name, provider, folder)
+            for name, provider in self.accounts.items()
+            for folder in folders or self.account_folders[name]
+        ]
+        return self._process(sources, limit)
+
+    def _process(self, sources: List["MailSource"], limit: int):
+        """Run the processing pipeline over one or more account folders
+
+        Runs as a three stage pipeline: fetch threads streaming pages of
+        emails from each source (at most max_fetchers at once), a shared pool
+        of classification workers, and an apply stage running on the calling
+        thread. Workers classify batch_size emails per model request and take
+        work from the accounts in turn, so a large mailbox cannot starve the
+        others. Results are reported in fetch order per source, and their
+        actions are handed to the source's provider in bulk every
+        apply_batch_size emails.
+
+        With clustering enabled, the fetch stage groups each window of emails
+        into clusters and only their representatives are sent to the model.
+
+        Each decision is written to every sink in result_sinks as it is made.
+        Returns a ResultSummary of the decisions.
+        """
+        if self.ai_model is None:
+            raise ValueError("This assistant was set up without a model to classify")
+        # Load categorization prompt
+        prompt = self.config.get("categorization.prompt", self._default_prompt())
+        namespace = CategorizationCache.namespace(prompt, self._model_name())
+
+        work = FairQueue(maxsize=self.queue_size)
+        result_queue: queue.Queue = queue.Queue(maxsize=self.queue_size)
+        fetch_slots = threading.Semaphore(self.max_fetchers)
+        window_size = self.cluster_window if self.clusterer else self.batch_size
+        labelled = len(sources) > 1
+
+        def fetch_stage(index: int, source: MailSource):
+            count = 0
+            window: List[Email] = []
+            put = functools.partial(work.put, source.account)
+            try:
+                with fetch_slots:
+                    logger.info(f"Fetching up to {limit} emails from {source.label}...")
+                    for email in source.provider.iter_emails(
+                        folder=source.folder, limit=limit, page_size=self.page_size
+                    ):
+                        if self.compactor:
+                            with metrics.timer("prompt"):
+                                self.compactor.apply(email)
+                        window.append(email)
+                        if len(window) >= window_size:
+                            self._queue_window(window, (index, count), put)
+                            count += len(window)
+                            window = []
+                    if window:
+                        self._queue_window(window, (index, count), put)
+                        count += len(window)
+            except Exception as e:
+                logger.error(f"Fetch stage failed for {source.label}: {e}")
+            finally:
+                logger.info(f"Found {count} emails in {source.label}")
+                work.close()
+
+        def classify_stage():
+            # The apply stage waits for every worker's _STAGE_DONE, and for
+            # a result at every position, so neither may go missing
+            try:
+                while True:
+                    item = work.get()
+                    if item is _STAGE_DONE:
+                        return
+                    try:
+                        results = self._categorize_clusters(item, prompt, namespace)
+                    except Exception as e:
+                        logger.error(f"Classification worker failed: {e}")
+                        results = [
+                            (position, email, EmailCategory.for_error(e))
+                            for cluster in item
+                            for position, email in cluster
+                        ]
+                    for result in results:
+                        result_queue.put(result)
+            finally:
+                result_queue.put(_STAGE_DONE)
+
+        threads = []
+        for index, source in enumerate(sources):
+            work.open(source.account)
+            threads.append(
+                threading.Thread(
+                    target=self._thread_target(fetch_stage),
+                    args=(index, source),
+                    name=f"fetch-{index}",
+                    daemon=True,
+                )
             )
+        threads += [
+            threading.Thread(
+                target=self._thread_target(classify_stage),
+                name=f"classify-{n}",
+                daemon=True,
+            )
+            for n in range(self.workers)
+        ]
+        for thread in threads:
+            thread.start()
+
+        # Apply stage: reorder classified emails and apply actions in fetch order
+        summary = ResultSummary()
+        pending = {}
+        next_index = [0] * len(sources)
+        planned: Dict[int, List[tuple]] = {id(s.provider): [] for s in sources}
+        # Emails whose decision was made (and applied), per source
+        processed: List[Set[str]] = [set() for _ in sources]
+        remaining_workers = self.workers
+        while remaining_workers:
+            item = result_queue.get()
+            if item is _STAGE_DONE:
+                remaining_workers -= 1
+                continue
+            pending[item[0]] = item
+            for index, source in enumerate(sources):
+                while (index, next_index[index]) in pending:
+                    _, email, category = pending.pop((index, next_index[index]))
+                    next_index[index] += 1
+                    label = f"{source.label} {next_index[index]}" if labelled else None
+                    action = self._report_decision(
+                        next_index[index], email, category, label=label
+                    )
+                    provider_planned = planned[id(source.provider)]
+                    if not category.failed:
+                        processed[index].add(email.id)
+                    if action:
+                        provider_planned.append((email, action, processed[index]))
+                    if len(provider_planned) >= self.apply_batch_size:
+                        self._apply_planned(source.provider, provider_planned)
+                    record = result_record(
+                        source.account, source.folder, email, category, self.dry_run
+                    )
+                    summary.write(record)
+                    self._write_result(record)
+                    if self.plan_sink:
+                        self._write_plan(source.account, email, category)
 
-        else:
-            raise ValueError(f"Unknown email provider: {provider_type}")
+        for thread in threads:
+            thread.join()
 
-    def test_connections(self) -> bool:
-        """Test all connections"""
-        logger.info("Testing AI model connection...")
-        if not self.ai_model.test_connection():
-            logger.error("AI model connection failed")
+        providers = {id(s.provider): s.provider for s in sources}
+        for key, provider in providers.items():
+            if not self.dry_run:
+                self._apply_planned(provider, planned[key])
+                provider.finish()
+
+        # A dry run leaves the stored sync position alone so --execute sees
+        # the same emails; an in-memory position (dry-run watch mode) still
+        # advances. After a failed fetch it only moves past what was processed.
+        if not self.dry_run or (self.sync_store and self.sync_store.path is None):
+            for index, source in enumerate(sources):
+                source.provider.commit_sync(source.folder, processed[index])
+
+        return summary
+
+    def _thread_target(self, target: Callable[..., Any]) -> Callable[..., Any]:
+        """Wrap a pipeline thread's target for profiling, when enabled"""
+        return self.profiler.wrap(target) if self.profiler else target
+
+    def export_metrics(self):
+        """Write the Prometheus textfile and JSON report, if configured"""
+        if self.metrics_textfile:
+            try:
+                metrics.write_textfile(Path(self.metrics_textfile).expanduser())
+            except OSError as e:
+                logger.error(f"Failed to write metrics textfile: {e}")
+        if self.metrics_report:
+            report = {
+                **metrics.report(),
+                "dry_run": self.dry_run,
+                "model_usage": {
+                    backend: usage.counts
+                    for backend, usage in self._model_usages().items()
+                },
+            }
+            try:
+                path = Path(self.metrics_report).expanduser()
+                path.parent.mkdir(parents=True, exist_ok=True)
+                path.write_text(json.dumps(report, indent=2) + "\n")
+            except OSError as e:
+                logger.error(f"Failed to write run report: {e}")
+
+    def _model_usages(self) -> Dict[str, TokenUsage]:
+        """Token usage per backend, looking inside a cascade"""
+        if self.ai_model is None:
+            return {}
+        if isinstance(self.ai_model, CascadeModel):
+            return {tier.name: tier.model.usage for tier in self.ai_model.tiers}
+        return {self.ai_model.backend: self.ai_model.usage}
+
+    def _write_result(self, record: Dict[str, Any]):
+        """Hand a decision to the result sinks, dropping any that fail"""
+        for sink in list(self.result_sinks):
+            try:
+                sink.write(record)
+            except OSError as e:
+                logger.error(f"Failed to write results, no longer saving them: {e}")
+                self.result_sinks.remove(sink)
+
+    def _write_plan(self, account: str, email: Email, category: EmailCategory):
+        """Save the action decided for an email to the plan, if there is one"""
+        try:
+            action = self._plan_action(email, category)
+        except ValueError as e:
+            logger.error(f"  ✗ Not planned: {e}")
+            return
+        if action is None:
+            return
+        try:
+            self.plan_sink.write(plan_record(account, email, category, action))
+        except OSError as e:
+            logger.error(f"Failed to write the plan, no longer saving it: {e}")
+            self.plan_sink = None
+
+    def close_results(self):
+        """Close the result sinks and plan, logging rather than raising on failure"""
+        sinks = self.result_sinks + ([self.plan_sink] if self.plan_sink else [])
+        for sink in sinks:
+            try:
+                sink.close()
+            except OSError as e:
+                logger.error(f"Failed to close results output: {e}")
+        self.result_sinks = []
+        self.plan_sink = None
+
+    def apply_plan(self, path: Path) -> bool:
+        """Apply the actions of a plan file saved with --plan-out
+
+        Records are handled apply_batch_size at a time: the emails are
+        fetched again by id, any no longer in their folder or whose
+        fingerprint changed are skipped, and the rest are applied in bulk.
+        Progress is checkpointed after each chunk, so running the same plan
+        again resumes after the last completed chunk.
+        """
+        try:
+            checkpoint = PlanCheckpoint(path)
+        except OSError as e:
+            logger.error(f"Cannot read plan {path}: {e}")
             return False
-        logger.info("✓ AI model connection successful")
+        done = checkpoint.load()
+        if done:
+            logger.info(f"Resuming after {done} already applied plan entries")
 
-        logger.info("Testing email provider connection...")
-        if not self.email_provider.test_connection():
-            logger.error("Email provider connection failed")
+        counts = {"applied": 0, "changed": 0, "missing": 0, "failed": 0}
+        chunk: List[Dict[str, Any]] = []
+        position = 0
+        try:
+            for record in read_results(path):
+                position += 1
+                if position <= done:
+                    continue
+                chunk.append(record)
+                if len(chunk) >= self.apply_batch_size:
+                    self._apply_plan_chunk(chunk, counts)
+                    checkpoint.save(position)
+                    chunk = []
+            if chunk:
+                self._apply_plan_chunk(chunk, counts)
+                checkpoint.save(position)
+        except OSError as e:
+            logger.error(f"Failed to apply plan {path}: {e}")
             return False
-        logger.info("✓ Email provider connection successful")
-
-        return True
 
-    def process_emails(self, folder: str = "inbox", limit: int = 50):
-        """Process emails from inbox"""
-        # Load categorization prompt
-        prompt = self.config.get("categorization.prompt", self._default_prompt())
+        logger.info(
+            f"Plan applied: {counts['applied']} actions, {counts['failed']} failed, "
+            f"skipped {counts['changed']} changed and {counts['missing']} missing emails"
+        )
+        return counts["failed"] == 0
+
+    def _apply_plan_chunk(self, records: List[Dict[str, Any]], counts: Dict[str, int]):
+        """Check one chunk of plan records against the mailbox and apply it"""
+        groups: Dict[tuple, List[Dict[str, Any]]] = {}
+        for record in records:
+            groups.setdefault((record.get("account"), record.get("folder")), []).append(
+                record
+            )
 
-        logger.info(f"Fetching up to {limit} emails from {folder}...")
-        emails = self.email_provider.get_emails(folder=folder, limit=limit)
-        logger.info(f"Found {len(emails)} emails")
+        for (account, folder), group in groups.items():
+            provider = self.accounts.get(account)
+            if provider is None:
+                logger.error(f"Plan account {account} is not configured, skipping")
+                counts["failed"] += len(group)
+                continue
+            try:
+                current = provider.get_emails_by_id(folder, [r["id"] for r in group])
+            except Exception as e:
+                logger.error(f"Failed to check planned emails in {folder}: {e}")
+                counts["failed"] += len(group)
+                continue
+
+            planned = []
+            for record in group:
+                email = current.get(record["id"])
+                if email is None:
+                    logger.info(
+                        f"  Skipped, no longer in {folder}: {record['subject']}"
+                    )
+                    counts["missing"] += 1
+                elif email_fingerprint(email) != record.get("fingerprint"):
+                    logger.info(f"  Skipped, changed since planning: {email.subject}")
+                    counts["changed"] += 1
+                else:
+                    action = ProviderAction(
+                        record["id"],
+                        record["operation"],
+                        record.get("destination"),
+                        folder,
+                    )
+                    planned.append((email, action, set()))
+            total = len(planned)
+            applied = self._apply_planned(provider, planned)
+            counts["applied"] += applied
+            counts["failed"] += total - applied
+            provider.finish()
+
+    def watch(
+        self,
+        folder: str = "inbox",
+        limit: int = 50,
+        stop: Optional[threading.Event] = None,
+    ):
+        """Process new emails as they arrive, until stop is set
+
+        Uses IMAP IDLE to be told about new messages, processing whatever
+        arrived since the last pass each time the folder changes. IDLE is
+        re-issued every watch.idle_timeout seconds, below the 29 minutes
+        after which servers may drop an idle client, and the folder is
+        processed again then too, so mail whose notification was missed
+        waits at most that long. Lost connections are re-established with
+        backoff.
+        """
+        if not isinstance(self.email_provider, IMAPProvider):
+            raise ValueError("Watch mode needs the IMAP email provider")
+        stop = stop or threading.Event()
+        idle_timeout = min(float(self.config.get("watch.idle_timeout", 1500)), 29 * 60)
+        retry = retry_policy(self.config)
+        failures = 0
+
+        logger.info(f"Watching {folder} for new emails")
+        while not stop.is_set():
+            try:
+                summary = self.process_emails(folder=folder, limit=limit)
+                if summary.total:
+                    logger.info(f"Processed {summary.total} new emails")
+                self.export_metrics()
+                self.email_provider.idle(folder, idle_timeout, stop=stop)
+                failures = 0
+            except Exception as e:
+                delay = retry.delay(failures)
+                failures += 1
+                logger.error(
+                    f"Watch connection lost ({e}), reconnecting in {delay:.1f}s"
+                )
+                if stop.wait(delay):
+                    break
+                try:
+                    self.email_provider.reconnect()
+                except Exception as e:
+                    logger.error(f"Reconnect failed: {e}")
+        logger.info("Stopped watching")
+
+    def _queue_window(
+        self, emails: List[Email], start: Tuple[int, int], put: Callable[[Any], None]
+    ) -> None:
+        """Group a window of fetched emails into clusters and queue them
+
+        start is the (source, index) position of the window's first email.
+        Each queued item is a list of clusters of (position, email) pairs,
+        holding up to batch_size representatives. Without clustering every
+        email is a cluster of its own.
+        """
+        source, first = start
+        if self.clusterer:
+            groups = self.clusterer.group(emails)
+        else:
+            groups = [[index] for index in range(len(emails))]
+        representatives = self.clusterer.representatives if self.clusterer else 1
+
+        item: List[List[tuple]] = []
+        size = 0
+        for group in groups:
+            item.append([((source, first + index), emails[index]) for index in group])
+            size += min(len(group), representatives)
+            if size >= self.batch_size:
+                put(item)
+                item, size = [], 0
+        if item:
+            put(item)
+
+    def _categorize_clusters(
+        self, clusters: List[List[tuple]], prompt: str, namespace: str
+    ) -> List[tuple]:
+        """Categorize clusters, propagating agreed decisions to all members
+
+        Representatives of every cluster are categorized together. When
+        they agree confidently, the rest of the cluster takes their
+        decision (rules still apply per email); otherwise the remaining
+        members are categorized as usual. Returns (position, email,
+        category) tuples.
+        """
+        representatives = self.clusterer.representatives if self.clusterer else 1
+        heads = [cluster[:representatives] for cluster in clusters]
+        head_emails = [email for head in heads for _, email in head]
+        head_categories = iter(self._categorize_batch(head_emails, prompt, namespace))
 
         results = []
-        for i, email in enumerate(emails, 1):
-            logger.info(f"\n[{i}/{len(emails)}] Processing: {email.subject}")
-            logger.info(f"  From: {email.sender_email}")
+        undecided = []
+        propagated = 0
+        for cluster, head in zip(clusters, heads):
+            categories = [next(head_categories) for _ in head]
+            results += [(p, e, c) for (p, e), c in zip(head, categories)]
+            rest = cluster[len(head) :]
+            if not rest:
+                continue
+            decision = self.clusterer.agreed(categories)
+            if decision is None:
+                undecided += rest
+                continue
+            propagated_category = EmailCategory(
+                action=decision.action,
+                reason=decision.reason,
+                folder=decision.folder,
+                confidence=decision.confidence,
+                source="cluster",
+            )
+            for position, email in rest:
+                category = self.rules.match(email)
+                if category is None:
+                    category = propagated_category
+                    propagated += 1
+                else:
+                    metrics.inc("decisions", source="rule")
+                results.append((position, email, category))
 
-            category = self.ai_model.categorize_email(email, prompt)
+        for start in range(0, len(undecided), self.batch_size):
+            chunk = undecided[start : start + self.batch_size]
+            categories = self._categorize_batch(
+                [email for _, email in chunk], prompt, namespace
+            )
+            results += [(p, e, c) for (p, e), c in zip(chunk, categories)]
+        if propagated:
+            with self._stats_lock:
+                self.propagated += propagated
+            metrics.inc("decisions", propagated, source="cluster")
+        return results
 
-            logger.info(f"  Decision: {category.action.value}")
-            logger.info(f"  Reason: {category.reason}")
+    def _categorize_batch(
+        self, emails: List[Email], prompt: str, namespace: str
+    ) -> List[EmailCategory]:
+        """Categorize a batch of emails
+
+        Rules are tried first, then the cache, then the local classifier,
+        and only the remaining emails go to the model. Emails that fail are
+        kept in the inbox and are not cached. Model decisions are recorded
+        in the history the local classifier is trained on.
+        """
+        keys = [CategorizationCache.key(email, namespace) for email in emails]
+        categories = {}
+        for key, email in zip(keys, emails):
+            category = self.rules.match(email)
+            if category:
+                categories[key] = category
+        unmatched = [key for key in keys if key not in categories]
+        metrics.inc("decisions", len(keys) - len(unmatched), source="rule")
+        if self.cache and unmatched:
+            try:
+                cached = self.cache.get_many(unmatched)
+            except (sqlite3.Error, ValueError) as e:
+                logger.error(f"Cache lookup failed, asking the model instead: {e}")
+                cached = {}
+            categories.update(cached)
+            metrics.inc("decisions", len(cached), source="cache")
+        misses = [(k, e) for k, e in zip(keys, emails) if k not in categories]
+
+        if self.classifier and misses:
+            for key, email in misses:
+                try:
+                    category = self.classifier.classify(
+                        email, self.classifier_threshold
+                    )
+                except Exception as e:
+                    logger.error(f"Local classifier failed, asking the model: {e}")
+                    category = None
+                if category:
+                    categories[key] = category
+            metrics.inc(
+                "decisions",
+                sum(1 for k, _ in misses if k in categories),
+                source="local",
+            )
+            misses = [(k, e) for k, e in misses if k not in categories]
+
+        if misses:
+            metrics.inc("decisions", len(misses), source="model")
+            try:
+                fresh = self.ai_model.categorize_batch([e for _, e in misses], prompt)
+            except Exception as e:
+                logger.error(f"Categorization failed: {e}")
+                metrics.inc(
+                    "categorization_errors", len(misses), backend=self.ai_model.backend
+                )
+                fresh = [EmailCategory.for_error(e) for _ in misses]
+            new_entries = list(zip([k for k, _ in misses], fresh))
+            categories.update(new_entries)
+            if self.history:
+                decided = [
+                    (email, category)
+                    for (_, email), category in zip(misses, fresh)
+                    if not category.failed
+                ]
+                try:
+                    self.history.append(
+                        [email for email, _ in decided],
+                        [category for _, category in decided],
+                    )
+                except OSError as e:
+                    logger.error(f"Failed to record decisions in the history: {e}")
+            if self.cache:
+                try:
+                    self.cache.put_many(
+                        [(k, c) for k, c in new_entries if not c.failed]
+                    )
+                except sqlite3.Error as e:
+                    logger.error(f"Failed to cache categorizations: {e}")
 
-            if not self.dry_run:
-                success = self._apply_action(email, category)
-                if success:
-                    logger.info(f"  ✓ Action applied")
-                else:
-                    logger.error(f"  ✗ Action failed")
-            else:
-                logger.info(f"  [DRY RUN] Would apply action: {category.action.value}")
+        return [categories[key] for key in keys]
 
-            results.append({"email": email, "category": category})
+    def _report_decision(
+        self,
+        position: int,
+        email: Email,
+        category: EmailCategory,
+        label: Optional[str] = None,
+    ) -> Optional[ProviderAction]:
+        """Log a categorization decision and return the action to apply
+
+        label replaces the position in the log when several folders are
+        processed together. Returns None in dry-run mode and for emails that
+        stay in the inbox.
+        """
+        logger.info(f"\n[{label or position}] Processing: {email.subject}")
+        logger.info(f"  From: {email.sender_email}")
+        if category.source:
+            logger.info(f"  Decision: {category.action.value} ({category.source})")
+        else:
+            logger.info(f"  Decision: {category.action.value}")
+        logger.info(f"  Reason: {category.reason}")
 
-        return results
+        if self.dry_run:
+            logger.info(f"  [DRY RUN] Would apply action: {category.action.value}")
+            return None
 
-    def _apply_action(self, email: Email, category: EmailCategory) -> bool:
-        """Apply categorization action to email"""
+        try:
+            return self._plan_action(email, category)
+        except ValueError as e:
+            logger.error(f"  ✗ Action failed: {e}")
+            return None
+
+    def _plan_action(
+        self, email: Email, category: EmailCategory
+    ) -> Optional[ProviderAction]:
+        """Translate a categorization into a provider action"""
         action = category.action
 
         if action == EmailAction.KEEP_INBOX:
-            return True
+            return None
         elif action == EmailAction.ARCHIVE:
-            return self.email_provider.move_email(email.id, "archive")
+            return ProviderAction(email.id, "move", "archive", email.folder)
         elif action == EmailAction.DELETE:
-            return self.email_provider.delete_email(email.id)
+            return ProviderAction(email.id, "delete", folder=email.folder)
         elif action == EmailAction.MARK_READ:
-            return self.email_provider.mark_as_read(email.id)
+            return ProviderAction(email.id, "mark_read", folder=email.folder)
         elif action == EmailAction.MOVE_FOLDER:
             if category.folder:
-                return self.email_provider.move_email(email.id, category.folder)
-            return False
+                return ProviderAction(email.id, "move", category.folder, email.folder)
+            raise ValueError("move_folder decision without a folder")
         else:
-            logger.warning(f"Unknown action: {action}")
-            return False
+            raise ValueError(f"Unknown action: {action}")
+
+    def _apply_planned(self, provider: EmailProvider, planned: List[tuple]) -> int:
+        """Apply queued (email, action, processed) entries in bulk
+
+        An email whose action fails is removed from its processed set, so
+        the sync position is not advanced past it. Logs and counts the
+        outcome, returning the number applied.
+        """
+        if not planned:
+            return 0
+        with metrics.timer("apply"):
+            outcomes = provider.apply_actions([a for _, a, _ in planned])
+        failed = [(e, done) for (e, _, done), ok in zip(planned, outcomes) if not ok]
+        metrics.inc("actions", len(planned) - len(failed), result="applied")
+        metrics.inc("actions", len(failed), result="failed")
+        logger.info(f"✓ Applied {len(planned) - len(failed)} actions")
+        for email, done in failed:
+            done.discard(email.id)
+            logger.error(f"  ✗ Action failed: {email.subject}")
+        planned.clear()
+        return len(outcomes) - len(failed)
 
     def _default_prompt(self) -> str:
         """Default categorization prompt"""
@@ -814,6 +5228,100 @@ Archive newsletters, marketing emails, and transactional emails (receipts, confi
 Only delete obvious spam."""
 
 
+def open_cache(config: Config) -> CategorizationCache:
+    """Open the categorization cache described by config"""
+    path = config.get("cache.path")
+    return CategorizationCache(
+        Path(path).expanduser() if path else _default_cache_path(),
+        ttl_seconds=float(config.get("cache.ttl_days", 30)) * 86400,
+        max_entries=int(config.get("cache.max_entries", 50000)),
+    )
+
+
+def open_history(config: Config) -> DecisionHistory:
+    """Open the decision history described by config"""
+    path = config.get("classifier.history_path")
+    return DecisionHistory(
+        Path(path).expanduser() if path else _default_history_path(),
+        max_records=int(config.get("classifier.history_max_records", 100000)),
+    )
+
+
+def classifier_path(config: Config) -> Path:
+    """Location of the trained local classifier"""
+    path = config.get("classifier.path")
+    return Path(path).expanduser() if path else _default_classifier_path()
+
+
+def train_classifier(config: Config) -> bool:
+    """Train the local classifier on the decision history and save it"""
+    records = open_history(config).load()
+    if not records:
+        logger.error(
+            "No decision history to train on; set classifier.record_history: true "
+            "and process some emails first"
+        )
+        return False
+    logger.info(f"Training on {len(records)} decisions")
+    try:
+        classifier = LocalClassifier.train(
+            records, n_features=int(config.get("classifier.features", 2**16))
+        )
+    except ValueError as e:
+        logger.error(f"Training failed: {e}")
+        return False
+    path = classifier_path(config)
+    classifier.save(path)
+    logger.info(f"Saved classifier with labels {classifier.labels} to {path}")
+    return True
+
+
+def evaluate_classifier(config: Config, holdout: float) -> bool:
+    """Train on older decisions and report how the newest would be handled"""
+    records = sorted(open_history(config).load(), key=lambda r: r.get("time", 0))
+    split = int(len(records) * (1 - holdout))
+    train, test = records[:split], records[split:]
+    if not test:
+        logger.error("Not enough decision history to evaluate")
+        return False
+    try:
+        classifier = LocalClassifier.train(
+            train, n_features=int(config.get("classifier.features", 2**16))
+        )
+    except ValueError as e:
+        logger.error(f"Training failed: {e}")
+        return False
+
+    threshold = float(config.get("classifier.threshold", 0.9))
+    thresholds = sorted({0.5, 0.7, 0.8, 0.9, 0.95, 0.99, threshold})
+    logger.info(f"Trained on {len(train)} decisions, testing on {len(test)}")
+    logger.info("threshold  coverage  accuracy")
+    for row in classifier.evaluate(test, thresholds):
+        accuracy = f"{row['accuracy']:.1%}" if row["accuracy"] is not None else "-"
+        marker = "  <- classifier.threshold" if row["threshold"] == threshold else ""
+        logger.info(
+            f"{row['threshold']:>9.2f}  {row['coverage']:>8.1%}  {accuracy:>8}{marker}"
+        )
+    return True
+
+
+def open_sync_store(config: Config) -> SyncStateStore:
+    """Open the incremental sync state store described by config"""
+    path = config.get("sync.path")
+    return SyncStateStore(
+        Path(path).expanduser() if path else _default_sync_state_path()
+    )
+
+
+def write_profile(assistant: "EmailAssistant", path: Optional[Path]):
+    """Save the run's profile, if one was taken, and log its top functions"""
+    if not (assistant.profiler and path):
+        return
+    top = assistant.profiler.dump(path)
+    logger.info(f"Profile saved to {path} (inspect with: python -m pstats {path})")
+    logger.info(top)
+
+
 def main():
     parser = argparse.ArgumentParser(
         description="AI-powered email categorization and management",
@@ -826,12 +5334,39 @@ Examples:
   # Actually apply changes
   %(prog)s --config config.yaml --execute
 
-  # Process specific folder
+  # Process specific folder (of every configured account)
   %(prog)s --folder spam --limit 100
 
+  # Classify with 8 concurrent model requests of 20 emails each
+  %(prog)s --config config.yaml --workers 8 --batch-size 20
+
   # Test connections only
   %(prog)s --config config.yaml --test
 
+  # Show categorization cache statistics
+  %(prog)s --config config.yaml --cache-stats
+
+  # Only process emails that are new or changed since the last run
+  %(prog)s --config config.yaml --execute --incremental
+
+  # Work through a large IMAP backlog, parsing on every core
+  %(prog)s --config config.yaml --execute --backlog --limit 20000
+
+  # Stay connected and classify new IMAP mail as it arrives
+  %(prog)s --config config.yaml --execute --watch
+
+  # Save every decision as it is made, then summarize saved runs
+  %(prog)s --config config.yaml --output decisions.jsonl.gz
+  %(prog)s report decisions.jsonl.gz older-run.jsonl
+
+  # Classify once and save the plan, review it, then apply just the actions
+  %(prog)s --config config.yaml --plan-out plan.jsonl
+  %(prog)s --config config.yaml apply plan.jsonl
+
+  # Train the local classifier on past model decisions, then check it
+  %(prog)s --config config.yaml train
+  %(prog)s --config config.yaml evaluate
+
   # Use environment variables (no config file needed)
   EMAIL_PROVIDER=office365 O365_CLIENT_ID=xxx %(prog)s
         """,
@@ -844,7 +5379,8 @@ Examples:
         help="Actually apply actions (default is dry-run)",
     )
     parser.add_argument(
-        "--folder", default="inbox", help="Email folder to process (default: inbox)"
+        "--folder",
+        help="Email folder to process (default: the configured folders, or inbox)",
     )
     parser.add_argument(
         "--limit",
@@ -853,26 +5389,167 @@ Examples:
         default=50,
         help="Maximum number of emails to process (default: 50)",
     )
+    parser.add_argument(
+        "--workers",
+        "-w",
+        type=int,
+        help="Concurrent classification workers (default: processing.workers or 1)",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        help="Emails per model request (default: processing.batch_size or 10)",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Always query the model, bypassing the categorization cache",
+    )
+    parser.add_argument(
+        "--cache-stats",
+        action="store_true",
+        help="Show categorization cache statistics and exit",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        default=None,
+        help="Only fetch emails new or changed since the last run (sync.incremental)",
+    )
+    parser.add_argument(
+        "--reset-sync",
+        action="store_true",
+        help="Forget stored sync positions so the next run starts from scratch",
+    )
+    parser.add_argument(
+        "--backlog",
+        action="store_true",
+        help="Parse IMAP messages in worker processes, one per core by default "
+        "(email.imap.parse_workers)",
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="Keep running and process new emails as they arrive (IMAP IDLE)",
+    )
+    parser.add_argument(
+        "--output",
+        "-o",
+        type=Path,
+        help="Append each decision to this JSONL file, gzipped if it ends in .gz "
+        "(output.path)",
+    )
+    parser.add_argument(
+        "--plan-out",
+        type=Path,
+        help="Save the planned actions of a dry run to this JSONL file, for apply",
+    )
+    parser.add_argument(
+        "--metrics-file",
+        type=Path,
+        help="Write a Prometheus textfile of run metrics (metrics.textfile)",
+    )
+    parser.add_argument(
+        "--report",
+        type=Path,
+        help="Write a JSON report of stage timings and counters (metrics.report)",
+    )
+    parser.add_argument(
+        "--profile",
+        type=Path,
+        help="Profile the run with cProfile and save the stats to this file",
+    )
     parser.add_argument("--test", action="store_true", help="Test connections and exit")
     parser.add_argument("--verbose", "-v", action="store_true", help="Verbose output")
 
+    commands = parser.add_subparsers(dest="command")
+    commands.add_parser(
+        "train", help="Train the local classifier on recorded model decisions"
+    )
+    evaluate = commands.add_parser(
+        "evaluate", help="Report local classifier coverage and accuracy"
+    )
+    evaluate.add_argument(
+        "--holdout",
+        type=float,
+        default=0.2,
+        help="Fraction of the newest decisions held out for testing (default: 0.2)",
+    )
+    report = commands.add_parser(
+        "report", help="Summarize decisions saved with --output"
+    )
+    report.add_argument("files", nargs="+", type=Path, help="Results files (JSONL)")
+    apply = commands.add_parser(
+        "apply",
+        help="Apply a plan saved with --plan-out, skipping emails changed since",
+    )
+    apply.add_argument("plan", type=Path, help="Plan file (JSONL)")
+
     args = parser.parse_args()
 
     if args.verbose:
         logger.setLevel(logging.DEBUG)
 
+    if args.command == "report":
+        sys.exit(0 if report_results(args.files) else 1)
+
     # Load configuration
-    config = Config(args.config)
+    try:
+        config = Config(args.config)
+    except ValueError as e:
+        logger.error(str(e))
+        sys.exit(1)
+
+    if args.cache_stats:
+        cache = open_cache(config)
+        for key, value in cache.stats().items():
+            logger.info(f"{key}: {value}")
+        cache.close()
+        sys.exit(0)
+
+    if args.command in ("train", "evaluate"):
+        if not _load_numpy():
+            logger.error("The local classifier needs numpy: pip install numpy")
+            sys.exit(1)
+        if args.command == "train":
+            ok = train_classifier(config)
+        else:
+            ok = evaluate_classifier(config, args.holdout)
+        sys.exit(0 if ok else 1)
+
+    if args.plan_out and args.execute:
+        logger.error(
+            "--plan-out saves actions for a later apply, use it without --execute"
+        )
+        sys.exit(1)
+
+    if args.reset_sync:
+        open_sync_store(config).reset()
+        logger.info("Sync state reset")
 
     # Initialize assistant
-    dry_run = not args.execute
+    dry_run = not args.execute and args.command != "apply"
     if dry_run:
         logger.info("=" * 60)
         logger.info("DRY RUN MODE - No changes will be made")
         logger.info("Use --execute to actually apply actions")
         logger.info("=" * 60)
 
-    assistant = EmailAssistant(config, dry_run=dry_run)
+    try:
+        assistant = EmailAssistant(
+            config,
+            dry_run=dry_run,
+            workers=args.workers,
+            batch_size=args.batch_size,
+            use_cache=not args.no_cache,
+            incremental=args.incremental,
+            watch=args.watch,
+            backlog=args.backlog,
+            classify=args.command != "apply",
+        )
+    except ValueError as e:
+        logger.error(str(e))
+        sys.exit(1)
 
     # Test connections
     if not assistant.test_connections():
@@ -883,22 +5560,86 @@ Examples:
         logger.info("Connection tests passed!")
         sys.exit(0)
 
+    if args.metrics_file:
+        assistant.metrics_textfile = args.metrics_file
+    if args.report:
+        assistant.metrics_report = args.report
+    if args.profile:
+        assistant.profiler = RunProfiler()
+    output = args.output or config.get("output.path")
+    try:
+        if output:
+            assistant.result_sinks.append(JSONLResultSink(Path(output).expanduser()))
+        if args.plan_out:
+            assistant.plan_sink = JSONLResultSink(args.plan_out, append=False)
+    except OSError as e:
+        logger.error(f"Cannot open output file: {e}")
+        sys.exit(1)
+
+    if args.command == "apply":
+        ok = assistant.apply_plan(args.plan)
+        assistant.export_metrics()
+        sys.exit(0 if ok else 1)
+
+    if args.watch:
+        stop = threading.Event()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, lambda *_: stop.set())
+        try:
+            assistant._thread_target(assistant.watch)(
+                folder=args.folder or "inbox", limit=args.limit, stop=stop
+            )
+        except ValueError as e:
+            logger.error(str(e))
+            sys.exit(1)
+        finally:
+            if assistant.cache:
+                assistant.cache.close()
+            assistant.close_results()
+            write_profile(assistant, args.profile)
+        sys.exit(0)
+
     # Process emails
-    results = assistant.process_emails(folder=args.folder, limit=args.limit)
+    try:
+        summary = assistant._thread_target(assistant.process_accounts)(
+            limit=args.limit, folders=[args.folder] if args.folder else None
+        )
+    finally:
+        assistant.close_results()
 
     # Summary
     logger.info("\n" + "=" * 60)
     logger.info("SUMMARY")
     logger.info("=" * 60)
-    logger.info(f"Total emails processed: {len(results)}")
-
-    action_counts = {}
-    for result in results:
-        action = result["category"].action.value
-        action_counts[action] = action_counts.get(action, 0) + 1
-
-    for action, count in action_counts.items():
-        logger.info(f"  {action}: {count}")
+    for line in summary.lines():
+        logger.info(line)
+
+    if isinstance(assistant.ai_model, CascadeModel):
+        for line in assistant.ai_model.summary():
+            logger.info(line)
+    else:
+        logger.info(f"Model usage: {assistant.ai_model.usage.summary()}")
+    if assistant.rules.rules:
+        logger.info(f"Rule hits: {assistant.rules.hits}")
+    if assistant.clusterer:
+        logger.info(f"Cluster-propagated decisions: {assistant.propagated}")
+    if assistant.classifier:
+        logger.info(
+            f"Local classifier: {assistant.classifier.hits} of {summary.total} "
+            f"answered at threshold {assistant.classifier_threshold}"
+        )
+
+    if assistant.cache:
+        logger.info(
+            f"Cache: {assistant.cache.hits} hits, {assistant.cache.misses} misses"
+        )
+        assistant.cache.close()
+
+    logger.info("Stage timings:")
+    for line in metrics.summary():
+        logger.info(f"  {line}")
+    assistant.export_metrics()
+    write_profile(assistant, args.profile)
 
     if dry_run:
         logger.info("\n[DRY RUN] No changes were made. Use --execute to apply actions.")
@@ -0,0 +1,147 @@
+"""The benchmark's Graph stand-in, extended with what the tests exercise"""
+
+import re
+from typing import Any, Dict, List
+from unittest import mock
+from urllib.parse import parse_qs, quote, urlparse
+
+from helpers import bench, ea
+
+
+class GraphStub(bench.FakeGraphServer):
+    """FakeGraphServer that also answers delta queries and can fail requests
+
+    A delta round is a snapshot of the messages changed since its token,
+    taken when it starts; its deltaLink carries the change sequence of
+    that moment, so anything changed while the round is paged through is
+    reported by the next one. Every message starts out unchanged.
+
+    $batch requests are checked against Graph's limit of 20 sub-requests
+    and their sizes recorded in batches. Requests for a message id listed
+    in failures are answered with the next of its statuses instead, and
+    requests bearing a token in rejected_tokens with 401. The tokens of all
+    requests are recorded in tokens.
+    """
+
+    BATCH_LIMIT = 20
+
+    def __init__(self, messages: List[bytes], folder: str = "inbox"):
+        super().__init__(messages, folder)
+        self.sequence = 0
+        self.changed = dict.fromkeys(self.messages, 0)
+        self.rounds: List[Dict[str, Any]] = []
+        self.batches: List[int] = []
+        self.failures: Dict[str, List[int]] = {}
+        self.rejected_tokens: set = set()
+        self.tokens: List[str] = []
+
+    def arrive(self, raw: bytes, folder: str = "inbox") -> str:
+        """Deliver a new message, newer than all the others"""
+        with self._lock:
+            index = len(self.changed)
+            message_id = f"AAMkNew{index:08d}"
+            self.messages[message_id] = self._resource(message_id, raw, index)
+            self.folders[message_id] = folder
+            self.sequence += 1
+            self.changed[message_id] = self.sequence
+        return message_id
+
+    def route(self, method, path, body, headers):
+        url = urlparse(path)
+        if headers:
+            token = (headers.get("Authorization") or "").removeprefix("Bearer ")
+            self.tokens.append(token)
+            if token in self.rejected_tokens:
+                return 401, {"error": {"code": "InvalidAuthenticationToken"}}
+        if url.path == "/v1.0/$batch":
+            return self._batch(body["requests"])
+        item = re.search(r"/me/messages/([^/]+)", url.path)
+        if item and self.failures.get(item.group(1)):
+            status = self.failures[item.group(1)].pop(0)
+            return status, {"error": {"message": f"scripted {status}"}}
+        delta = re.fullmatch(r"/v1.0/me/mailFolders/([^/]+)/messages/delta", url.path)
+        if delta and method == "GET":
+            prefer = (headers.get("Prefer") if headers else None) or ""
+            size = re.search(r"odata.maxpagesize=(\d+)", prefer)
+            with self._lock:
+                return self._delta(
+                    delta.group(1),
+                    parse_qs(url.query),
+                    int(size.group(1)) if size else 10,
+                )
+        return super().route(method, path, body, headers)
+
+    def _batch(self, requests: List[Dict[str, Any]]):
+        self.batches.append(len(requests))
+        if len(requests) > self.BATCH_LIMIT:
+            return 400, {"error": {"message": "Too many requests in the batch"}}
+        responses = []
+        for request in requests:
+            status, data = self.route(
+                request["method"], request["url"], request.get("body"), {}
+            )
+            response = {"id": request["id"], "status": status, "body": data}
+            if status == 429:
+                response["headers"] = {"Retry-After": "0"}
+            responses.append(response)
+        return 200, {"responses": responses}
+
+    def _route(self, method, route, query, body):
+        status, data = super()._route(method, route, query, body)
+        item = re.fullmatch(r"/me/messages/([^/]+)(/move)?", route)
+        if item and method != "GET" and status < 300:
+            self.sequence += 1
+            self.changed[item.group(1)] = self.sequence
+        return status, data
+
+    def _delta(self, folder: str, query: Dict[str, List[str]], size: int):
+        if "$skiptoken" in query:
+            number, offset = map(int, query["$skiptoken"][0].split("."))
+        else:
+            offset = 0
+            since, filter_ = -1, (query.get("$filter") or [""])[0]
+            if "$deltatoken" in query:
+                previous = self.rounds[int(query["$deltatoken"][0])]
+                since, filter_ = previous["sequence"], previous["filter"]
+            received = filter_.removeprefix("receivedDateTime ge ")
+            items = [
+                message
+                for message_id, message in self.messages.items()
+                if self.folders[message_id] == folder
+                and self.changed[message_id] > since
+                and message["receivedDateTime"] >= received
+            ]
+            number = len(self.rounds)
+            self.rounds.append(
+                {"sequence": self.sequence, "filter": filter_, "items": items}
+            )
+
+        items = self.rounds[number]["items"]
+        link = f"{self.url}/me/mailFolders/{quote(folder)}/messages/delta"
+        result: Dict[str, Any] = {"value": items[offset : offset + size]}
+        if offset + size < len(items):
+            result["@odata.nextLink"] = f"{link}?$skiptoken={number}.{offset + size}"
+        else:
+            result["@odata.deltaLink"] = f"{link}?$deltatoken={number}"
+        return 200, result
+
+
+def skip_authentication():
+    """Patch Office365Provider to skip MSAL, as the benchmark does"""
+    return mock.patch.object(
+        ea.Office365Provider,
+        "_authenticate",
+        lambda self, **_: setattr(self, "access_token", "test"),
+    )
+
+
+def office365_settings(graph: GraphStub) -> dict:
+    """email: settings for an account on a GraphStub"""
+    return {
+        "provider": "office365",
+        "office365": {
+            "client_id": "test",
+            "graph_url": graph.url,
+            "token_cache": {"enabled": False},
+        },
+    }
@@ -0,0 +1,188 @@
+"""Shared setup for the email assistant tests
+
+The scripts' file names are not identifiers, so they are imported with
+importlib from the scripts directory, the assistant by the benchmark's
+own loader.
+"""
+
+import importlib
+import logging
+import sys
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+SCRIPTS = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(SCRIPTS))
+
+bench = importlib.import_module("email-assistant-bench")
+ea = bench.load_assistant()
+# Failures the tests provoke on purpose would otherwise fill the output
+ea.logger.setLevel(logging.CRITICAL)
+
+
+def make_email(
+    id: str = "1",
+    subject: str = "Hello",
+    sender_email: str = "alice@example.com",
+    body_preview: str = "Hi there",
+    folder: Optional[str] = "INBOX",
+    headers: Optional[dict] = None,
+):
+    return ea.Email(
+        id=id,
+        subject=subject,
+        sender=sender_email.split("@")[0].title(),
+        sender_email=sender_email,
+        body_preview=body_preview,
+        received_datetime="Mon, 1 Jan 2024 00:00:00 +0000",
+        is_read=False,
+        folder=folder,
+        headers=headers or {},
+    )
+
+
+def category(action: str = "archive", confidence: Optional[float] = 0.9, **kwargs):
+    return ea.EmailCategory(
+        action=ea.EmailAction(action),
+        reason=kwargs.pop("reason", "test"),
+        confidence=confidence,
+        **kwargs,
+    )
+
+
+class ScriptedModel(ea.PromptModel):
+    """PromptModel answering each _generate call with the next response
+
+    A response that is an exception is raised instead. Once responses run
+    out, default answers; a callable default is called with the content.
+    Calls are recorded as (instructions, content) pairs.
+    """
+
+    backend = "scripted"
+    model = "scripted"
+
+    def __init__(self, responses: List, default: Optional[str] = None):
+        super().__init__()
+        self.responses = list(responses)
+        self.default = default
+        self.calls: List[tuple] = []
+        self._lock = threading.Lock()
+
+    def test_connection(self) -> bool:
+        return True
+
+    def _generate(self, instructions: str, content: str, max_tokens: int = 1024) -> str:
+        with self._lock:
+            self.calls.append((instructions, content))
+            response = self.responses.pop(0) if self.responses else self.default
+        if callable(response):
+            response = response(content)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+
+class MemoryProvider(ea.EmailProvider):
+    """Provider serving emails from a list and recording the actions applied
+
+    With fail_after set, iter_emails raises after yielding that many emails.
+    """
+
+    def __init__(self):
+        self.emails: List = []
+        self.applied: List[tuple] = []
+        self.fail_after: Optional[int] = None
+
+    def get_emails(self, folder: str = "inbox", limit: int = 50):
+        return self.emails[:limit]
+
+    def iter_emails(self, folder: str = "inbox", limit: int = 50, page_size: int = 100):
+        for count, email in enumerate(self.emails[:limit]):
+            if count == self.fail_after:
+                raise ConnectionError("connection dropped")
+            yield email
+
+    def get_emails_by_id(self, folder: str, ids: List[str]):
+        return {e.id: e for e in self.emails if e.id in ids and e.folder == folder}
+
+    def move_email(self, email_id: str, destination_folder: str) -> bool:
+        self.applied.append(("move", email_id, destination_folder))
+        return True
+
+    def mark_as_read(self, email_id: str) -> bool:
+        self.applied.append(("mark_read", email_id))
+        return True
+
+    def delete_email(self, email_id: str) -> bool:
+        self.applied.append(("delete", email_id))
+        return True
+
+    def test_connection(self) -> bool:
+        return True
+
+
+class RecordingSink(ea.ResultSink):
+    def __init__(self):
+        self.records: List[Dict[str, Any]] = []
+
+    def write(self, record: Dict[str, Any]):
+        self.records.append(record)
+
+
+ea.register_model("scripted")(lambda config, context: ScriptedModel([]))
+ea.register_provider("memory")(lambda config, settings, context: MemoryProvider())
+
+
+def make_assistant(state: Path, config: Optional[dict] = None, **kwargs):
+    """EmailAssistant on a ScriptedModel and a MemoryProvider
+
+    The cache, decision history and sync positions are kept under state.
+    config sections are merged over those defaults; lists replace them.
+    """
+    settings = {
+        "ai": {"model": "scripted"},
+        "email": {"provider": "memory", "username": "test@example.com"},
+        "cache": {"path": str(state / "cache.db")},
+        "classifier": {"history_path": str(state / "history.jsonl")},
+        "sync": {"path": str(state / "sync.json")},
+    }
+    for section, values in (config or {}).items():
+        if isinstance(values, dict):
+            settings.setdefault(section, {}).update(values)
+        else:
+            settings[section] = values
+    assistant = ea.EmailAssistant(ea.Config.from_dict(settings), **kwargs)
+    assistant.result_sinks.append(RecordingSink())
+    return assistant
+
+
+def close_assistant(assistant):
+    if assistant.cache:
+        assistant.cache.close()
+    for provider in assistant.accounts.values():
+        if isinstance(provider, ea.IMAPProvider):
+            provider.pool.close()
+
+
+def raw_message(number: int, subject: Optional[str] = None) -> bytes:
+    """A small RFC 5322 message, for the fake mail servers"""
+    return (
+        f"From: Sender {number} <sender{number}@example.com>\r\n"
+        f"To: me@example.com\r\n"
+        f"Subject: {subject or f'Email {number}'}\r\n"
+        f"Date: Mon, 1 Jan 2024 00:{number % 60:02d}:00 +0000\r\n"
+        f"Message-ID: <{number}@test.example.com>\r\n"
+        f"\r\n"
+        f"Body of email {number}\r\n"
+    ).encode()
+
+
+def imap_settings(server) -> dict:
+    """email: settings for an account on a bench FakeIMAPServer"""
+    return {
+        "provider": "imap",
+        "username": "test",
+        "password": "test",
+        "imap": {"host": "127.0.0.1", "port": server.port, "ssl": False},
+    }
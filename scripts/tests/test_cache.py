@@ -0,0 +1,101 @@
+import json
+import shutil
+import tempfile
+import time
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from helpers import category, close_assistant, ea, make_assistant, make_email
+
+ARCHIVE = json.dumps({"action": "archive", "reason": "newsletter"})
+
+
+class CategorizationCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.state = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.state)
+        self.emails = [make_email(id=str(i), subject=f"Email {i}") for i in range(3)]
+
+    def open(self, **kwargs):
+        cache = ea.CategorizationCache(self.state / "cache.db", **kwargs)
+        self.addCleanup(cache.close)
+        return cache
+
+    def keys(self, namespace="test"):
+        return [ea.CategorizationCache.key(email, namespace) for email in self.emails]
+
+    def test_entries_survive_reopening_until_they_expire(self):
+        keys = self.keys()
+        self.open(ttl_seconds=60).put_many([(keys[0], category("delete"))])
+
+        cache = self.open(ttl_seconds=60)
+        [found] = cache.get_many(keys).values()
+        self.assertEqual(found.action, ea.EmailAction.DELETE)
+        self.assertEqual((cache.hits, cache.misses), (1, 2))
+
+        later = time.time() + 61
+        with mock.patch.object(ea.time, "time", return_value=later):
+            self.assertEqual(cache.get_many(keys), {})
+            cache.prune()
+        self.assertEqual(cache.stats()["entries"], 0)
+
+    def test_least_recently_used_entries_are_evicted(self):
+        keys = self.keys()
+        cache = self.open(max_entries=2)
+        now = time.time()
+        for offset, key in enumerate(keys[:2]):
+            with mock.patch.object(ea.time, "time", return_value=now + offset):
+                cache.put_many([(key, category())])
+        # Reading the oldest entry makes the second one least recently used
+        with mock.patch.object(ea.time, "time", return_value=now + 2):
+            cache.get_many([keys[0]])
+        with mock.patch.object(ea.time, "time", return_value=now + 3):
+            cache.put_many([(keys[2], category())])
+
+        self.assertEqual(set(cache.get_many(keys)), {keys[0], keys[2]})
+        self.assertEqual(cache.stats()["entries"], 2)
+
+    def test_namespaces_depend_on_prompt_and_model(self):
+        namespace = ea.CategorizationCache.namespace
+        self.assertEqual(namespace("prompt", "a:1"), namespace("prompt", "a:1"))
+        self.assertNotEqual(namespace("prompt", "a:1"), namespace("other", "a:1"))
+        self.assertNotEqual(namespace("prompt", "a:1"), namespace("prompt", "a:2"))
+        self.assertNotEqual(self.keys("one"), self.keys("two"))
+
+
+class AssistantCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.state = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.state)
+
+    def run_assistant(self, prompt: str = "prompt", **kwargs) -> int:
+        """Process three emails and return the number of model requests"""
+        assistant = make_assistant(
+            self.state,
+            {"categorization": {"prompt": prompt}, "processing": {"batch_size": 1}},
+            **kwargs,
+        )
+        self.addCleanup(close_assistant, assistant)
+        assistant.ai_model.default = ARCHIVE
+        assistant.email_provider.emails = [
+            make_email(id=str(i), subject=f"Email {i}") for i in range(3)
+        ]
+        assistant.process_emails()
+        return len(assistant.ai_model.calls)
+
+    def test_repeated_runs_are_answered_from_the_cache(self):
+        self.assertEqual(self.run_assistant(), 3)
+        self.assertEqual(self.run_assistant(), 0)
+
+    def test_changing_the_prompt_misses_the_old_entries(self):
+        self.run_assistant()
+        self.assertEqual(self.run_assistant(prompt="new prompt"), 3)
+
+    def test_no_cache_asks_the_model_every_time(self):
+        self.run_assistant()
+        self.assertEqual(self.run_assistant(use_cache=False), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
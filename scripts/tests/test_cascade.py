@@ -0,0 +1,121 @@
+import json
+import tempfile
+import unittest
+from pathlib import Path
+
+from helpers import ScriptedModel, close_assistant, ea, make_assistant, make_email
+
+
+def answer(action: str, confidence=None) -> str:
+    decision = {"action": action, "reason": f"{action} it"}
+    if confidence is not None:
+        decision["confidence"] = confidence
+    return json.dumps(decision)
+
+
+def cascade(cheap, expensive, **kwargs):
+    return ea.CascadeModel(
+        [
+            ea.CascadeTier("cheap", cheap, min_confidence=0.8),
+            ea.CascadeTier("expensive", expensive, min_confidence=0.8),
+        ],
+        **kwargs,
+    )
+
+
+class CascadeModelTest(unittest.TestCase):
+    def setUp(self):
+        self.emails = [make_email(id=str(i), subject=f"Email {i}") for i in range(4)]
+
+    def categorize(self, cheap_answers, expensive_default, count=1, **kwargs):
+        cheap = ScriptedModel(cheap_answers)
+        expensive = ScriptedModel([], default=expensive_default)
+        model = cascade(cheap, expensive, **kwargs)
+        return model, expensive, model.categorize_batch(self.emails[:count], "prompt")
+
+    def test_only_unsure_answers_reach_the_next_tier(self):
+        batch = json.dumps(
+            [
+                {"id": "1", **json.loads(answer("archive", 0.95))},
+                {"id": "2", **json.loads(answer("mark_read", 0.4))},
+                {"id": "3", **json.loads(answer("archive"))},
+            ]
+        )
+        # Email 4 is missing from the batch and its own request fails
+        model, expensive, categories = self.categorize(
+            [batch, ConnectionError("model down")], answer("keep_inbox", 0.9), count=4
+        )
+
+        self.assertEqual(
+            [c.action.value for c in categories],
+            ["archive", "keep_inbox", "keep_inbox", "keep_inbox"],
+        )
+        self.assertFalse(any(c.failed for c in categories))
+        # One batch request for the three, answered one by one on fallback
+        escalated = expensive.calls[0][1]
+        for number in (1, 2, 3):
+            self.assertIn(f"Email {number}", escalated)
+        self.assertNotIn("Email 0", escalated)
+        cheap, last = model.tiers
+        self.assertEqual((cheap.answered, cheap.escalated), (1, 3))
+        self.assertEqual((last.answered, last.escalated), (3, 0))
+
+    def test_escalate_actions_are_checked_whatever_the_confidence(self):
+        model, expensive, [category] = self.categorize(
+            [answer("delete", 1.0)],
+            answer("archive", 0.9),
+            escalate_actions=[ea.EmailAction.DELETE],
+        )
+        self.assertEqual(category.action, ea.EmailAction.ARCHIVE)
+        self.assertEqual(len(expensive.calls), 1)
+
+    def test_the_last_tier_always_answers(self):
+        model, expensive, [category] = self.categorize(
+            [answer("archive", 0.1)], answer("delete", 0.2)
+        )
+        self.assertEqual(category.action, ea.EmailAction.DELETE)
+        self.assertEqual(model.tiers[1].answered, 1)
+        self.assertEqual(len(model.summary()), 2)
+
+    def test_a_cascade_needs_tiers(self):
+        with self.assertRaises(ValueError):
+            ea.CascadeModel([])
+
+
+class CascadeConfigTest(unittest.TestCase):
+    def setUp(self):
+        self.state = Path(tempfile.mkdtemp())
+
+    def test_tiers_are_built_from_the_config(self):
+        assistant = make_assistant(
+            self.state,
+            {
+                "ai": {
+                    "model": "cascade",
+                    "cascade": {
+                        "tiers": [
+                            "scripted",
+                            {"model": "scripted", "min_confidence": 0.5},
+                        ],
+                        "escalate_actions": ["delete", "move_folder"],
+                    },
+                }
+            },
+        )
+        self.addCleanup(close_assistant, assistant)
+
+        model = assistant.ai_model
+        self.assertIsInstance(model, ea.CascadeModel)
+        self.assertEqual([t.min_confidence for t in model.tiers], [0.8, 0.5])
+        self.assertEqual(
+            model.escalate_actions, {ea.EmailAction.DELETE, ea.EmailAction.MOVE_FOLDER}
+        )
+
+    def test_a_tier_cannot_be_a_cascade(self):
+        config = {"ai": {"model": "cascade", "cascade": {"tiers": ["cascade"]}}}
+        with self.assertRaises(ValueError):
+            make_assistant(self.state, config)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,110 @@
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+
+from helpers import category, close_assistant, ea, make_assistant, make_email
+
+SENDERS = {
+    "archive": ("news@shop.example", "Weekly deals", "Big sale on shoes"),
+    "keep_inbox": ("boss@work.example", "Meeting tomorrow", "Can we talk about"),
+    "move_folder:Bills": ("billing@power.example", "Your invoice", "Amount due"),
+}
+
+
+def records(count: int = 10) -> list:
+    return [
+        {
+            "time": number,
+            "sender_email": sender,
+            "subject": f"{subject} {number}",
+            "body_preview": f"{body} item {number}",
+            "label": label,
+        }
+        for number in range(count)
+        for label, (sender, subject, body) in SENDERS.items()
+    ]
+
+
+@unittest.skipUnless(ea._load_numpy(), "needs numpy")
+class LocalClassifierTest(unittest.TestCase):
+    def setUp(self):
+        self.classifier = ea.LocalClassifier.train(records(), n_features=2**10)
+
+    def test_predictions_follow_the_training_labels(self):
+        for label, (sender, subject, body) in SENDERS.items():
+            predicted, confidence = self.classifier.predict_proba(
+                sender, subject + " again", body
+            )
+            self.assertEqual(predicted, label)
+            self.assertGreater(confidence, 0.5)
+
+    def test_classify_only_answers_when_confident(self):
+        email = make_email(
+            subject="Your invoice 99",
+            sender_email="billing@power.example",
+            body_preview="Amount due",
+        )
+
+        found = self.classifier.classify(email, threshold=0.5)
+        self.assertEqual(
+            (found.action, found.folder, found.source),
+            (ea.EmailAction.MOVE_FOLDER, "Bills", "local"),
+        )
+        self.assertIsNone(self.classifier.classify(email, threshold=1.01))
+        self.assertEqual(self.classifier.hits, 1)
+
+    def test_evaluate_reports_coverage_and_accuracy(self):
+        low, high = self.classifier.evaluate(records(3), [0.0, 1.01])
+
+        self.assertEqual((low["coverage"], low["accuracy"]), (1.0, 1.0))
+        self.assertEqual((high["coverage"], high["accuracy"]), (0.0, None))
+
+    def test_saved_classifiers_predict_the_same(self):
+        state = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, state)
+        self.classifier.save(state / "classifier.npz")
+        loaded = ea.LocalClassifier.load(state / "classifier.npz")
+
+        args = ("news@shop.example", "Weekly deals", "sale")
+        self.assertEqual(loaded.labels, self.classifier.labels)
+        self.assertEqual(
+            loaded.predict_proba(*args)[0], self.classifier.predict_proba(*args)[0]
+        )
+
+    def test_training_needs_two_labels(self):
+        with self.assertRaises(ValueError):
+            ea.LocalClassifier.train(records(2)[:1])
+
+
+class DecisionHistoryTest(unittest.TestCase):
+    def setUp(self):
+        self.state = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.state)
+
+    def test_history_is_recorded_when_the_classifier_is_used(self):
+        for config, recorded in (
+            ({}, False),
+            ({"classifier": {"record_history": True}}, True),
+        ):
+            assistant = make_assistant(self.state, config)
+            self.addCleanup(close_assistant, assistant)
+            self.assertEqual(assistant.history is not None, recorded)
+
+    def test_the_oldest_decisions_are_dropped(self):
+        history = ea.DecisionHistory(self.state / "history.jsonl", max_records=4)
+        emails = [make_email(id=str(i), subject=f"Email {i}") for i in range(6)]
+        history.append(emails[:5], [category()] * 5)
+        self.assertEqual(len(history.load()), 5)
+
+        history.append(emails[5:], [category()])
+        subjects = [record["subject"] for record in history.load()]
+        self.assertEqual(subjects, ["Email 2", "Email 3", "Email 4", "Email 5"])
+
+        reopened = ea.DecisionHistory(self.state / "history.jsonl", max_records=4)
+        reopened.append(emails[:1], [category()])
+        self.assertEqual(len(reopened.load()), 5)
+
+
+if __name__ == "__main__":
+    unittest.main()
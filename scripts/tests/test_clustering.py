@@ -0,0 +1,124 @@
+import json
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+
+from helpers import category, close_assistant, ea, make_assistant, make_email
+
+
+def digest(number: int, **kwargs):
+    return make_email(
+        id=str(number),
+        subject=f"Weekly digest #{number}",
+        sender_email="news+weekly@digest.example.com",
+        **kwargs,
+    )
+
+
+class ClustererTest(unittest.TestCase):
+    def setUp(self):
+        self.clusterer = ea.EmailClusterer(max_size=3, min_confidence=0.8)
+
+    def test_subject_templates_drop_numbers_dates_and_prefixes(self):
+        self.assertEqual(
+            ea.subject_template("Re: Fwd: Your order #1234 shipped Mar 3"),
+            ea.subject_template("Your order #987 shipped April 10th, 2024"),
+        )
+
+    def test_list_id_takes_precedence_over_the_sender(self):
+        listed = make_email(headers={"list-id": "Digest <digest.example.com>"})
+        self.assertTrue(self.clusterer.key(listed).startswith("digest.example.com|"))
+        self.assertTrue(
+            self.clusterer.key(digest(1)).startswith("news@digest.example.com|")
+        )
+
+    def test_groups_keep_fetch_order_and_split_at_max_size(self):
+        emails = [digest(n) for n in range(4)] + [make_email(subject="Lunch?")]
+        emails.insert(1, make_email(subject="Other"))
+        self.assertEqual(self.clusterer.group(emails), [[0, 2, 3], [4], [1], [5]])
+
+    def test_only_confident_agreement_propagates(self):
+        agreed = self.clusterer.agreed
+        self.assertEqual(agreed([category(), category()]).action.value, "archive")
+        self.assertIsNone(agreed([category(), category("delete")]))
+        self.assertIsNone(agreed([category(), category(confidence=0.5)]))
+        self.assertIsNone(agreed([category(confidence=None)]))
+        self.assertIsNone(agreed([ea.EmailCategory.for_error(TimeoutError())]))
+        self.clusterer.min_confidence = 0
+        self.assertIsNotNone(agreed([category(confidence=None)]))
+
+
+class PropagationTest(unittest.TestCase):
+    def setUp(self):
+        state = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, state)
+        self.assistant = make_assistant(
+            state,
+            {
+                "clustering": {"enabled": True, "min_confidence": 0.8},
+                "rules": [
+                    {
+                        "name": "urgent",
+                        "action": "keep_inbox",
+                        "match": {"headers": {"X-Priority": "1"}},
+                    }
+                ],
+                "cache": {"enabled": False},
+            },
+        )
+        self.addCleanup(close_assistant, self.assistant)
+        self.model = self.assistant.ai_model
+        self.emails = [digest(n) for n in range(1, 6)]
+
+    def process(self):
+        provider = self.assistant.email_provider
+        provider.emails = self.emails
+        self.assistant.process_emails()
+        return self.assistant.result_sinks[0].records
+
+    def test_confident_decision_covers_the_cluster(self):
+        self.model.default = json.dumps(
+            {"action": "archive", "reason": "digest", "confidence": 0.95}
+        )
+        records = self.process()
+
+        self.assertEqual(len(self.model.calls), 1)
+        self.assertEqual([r["id"] for r in records], ["1", "2", "3", "4", "5"])
+        self.assertEqual(
+            [r["source"] for r in records],
+            ["model", "cluster", "cluster", "cluster", "cluster"],
+        )
+        self.assertEqual(self.assistant.propagated, 4)
+
+    def test_rules_still_apply_to_cluster_members(self):
+        self.emails[2].headers = {"x-priority": "1"}
+        self.model.default = json.dumps(
+            {"action": "archive", "reason": "digest", "confidence": 0.95}
+        )
+        records = self.process()
+        self.assertEqual(records[2]["source"], "rule")
+        self.assertEqual(records[2]["action"], "keep_inbox")
+        self.assertEqual(records[3]["source"], "cluster")
+
+    def test_unsure_decision_sends_members_to_the_model(self):
+        self.model.default = json.dumps(
+            {"action": "archive", "reason": "maybe", "confidence": 0.5}
+        )
+        records = self.process()
+        self.assertNotIn("cluster", [r["source"] for r in records])
+        self.assertEqual(self.assistant.propagated, 0)
+
+    def test_failed_decision_is_not_propagated(self):
+        self.model.responses = [ConnectionError("model down")]
+        self.model.default = json.dumps({"action": "archive", "reason": "ok"})
+        self.emails = self.emails[:2]
+        records = self.process()
+
+        self.assertEqual(records[0]["action"], "keep_inbox")
+        self.assertEqual(records[1]["action"], "archive")
+        self.assertEqual(records[1]["source"], "model")
+
+
+if __name__ == "__main__":
+    unittest.main()
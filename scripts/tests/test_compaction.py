@@ -0,0 +1,83 @@
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+
+from helpers import close_assistant, ea, make_assistant, make_email
+
+REPLY = """Thanks, Thursday works for me.
+See https://calendar.example.com/invite?id=12345&token=abcdef for details.
+
+--
+Bob Smith
+Head of Things
+
+On Mon, 1 Jan 2024 at 09:00, Alice <alice@example.com> wrote:
+> Does Thursday work?
+"""
+
+OUTLOOK = """Approved.
+
+From: Alice
+Sent: Monday, 1 January 2024 09:00
+Subject: Budget
+Please approve the budget.
+"""
+
+
+class ContentCompactorTest(unittest.TestCase):
+    def setUp(self):
+        self.compactor = ea.ContentCompactor(max_tokens=60)
+
+    def test_quoted_replies_and_signatures_are_removed(self):
+        self.assertEqual(
+            self.compactor.compact(REPLY),
+            "Thanks, Thursday works for me. " "See <calendar.example.com> for details.",
+        )
+        self.assertEqual(self.compactor.compact(OUTLOOK), "Approved.")
+
+    def test_footers_and_quotes_only_end_the_body_after_some_text(self):
+        text = "> quoted first\nSent from my phone\nActual text\n-- \nSig"
+        self.assertEqual(self.compactor.compact(text), "Sent from my phone Actual text")
+        disclaimer = "Hi\nThis email is confidential and intended for you only."
+        self.assertEqual(self.compactor.compact(disclaimer), "Hi")
+
+    def test_html_is_converted_to_text(self):
+        html = "<html><style>p {}</style><p>Hello</p><p>there\u200b</p></html>"
+        self.assertEqual(self.compactor.compact(html), "Hello there")
+
+    def test_previews_are_cut_to_the_token_budget(self):
+        email = make_email(body_preview=" ".join(f"word{i}" for i in range(200)))
+        self.compactor.apply(email)
+
+        self.assertTrue(email.body_preview.endswith(" …"))
+        self.assertTrue(email.body_preview.startswith("word0 word1"))
+        self.assertLessEqual(
+            ea.ContentCompactor.estimate_tokens(email.to_summary()), 60
+        )
+
+    def test_short_previews_are_kept_whole(self):
+        email = make_email(body_preview="Short note")
+        self.compactor.apply(email)
+        self.assertEqual(email.body_preview, "Short note")
+
+
+class PreviewCharsTest(unittest.TestCase):
+    def setUp(self):
+        self.state = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.state)
+
+    def preview_chars(self, compaction: dict):
+        assistant = make_assistant(self.state, {"compaction": compaction})
+        self.addCleanup(close_assistant, assistant)
+        return assistant.backends.preview_chars
+
+    def test_compaction_fetches_longer_previews(self):
+        self.assertEqual(self.preview_chars({}), 1000)
+        self.assertEqual(self.preview_chars({"preview_chars": 400}), 400)
+        # Providers then keep their own default
+        self.assertIsNone(self.preview_chars({"enabled": False}))
+
+
+if __name__ == "__main__":
+    unittest.main()
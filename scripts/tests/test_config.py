@@ -0,0 +1,68 @@
+import os
+import unittest
+from unittest import mock
+
+from helpers import ea
+
+
+class AccountConfigTest(unittest.TestCase):
+    def test_account_secrets_come_from_suffixed_env_vars(self):
+        entry = {"provider": "imap", "username": "me@example.com"}
+        environ = {
+            "EMAIL_PASSWORD": "global",
+            "EMAIL_PASSWORD_MY_HOME": "home secret",
+            "EMAIL_USERNAME_MY_HOME": "ignored",
+        }
+        with mock.patch.dict(os.environ, environ):
+            config = ea.Config.for_account("my-home", entry)
+
+        self.assertEqual(config.get("email.password"), "home secret")
+        self.assertEqual(config.get("email.username"), "me@example.com")
+        self.assertNotIn("password", entry)
+
+    def test_other_accounts_do_not_get_the_secret(self):
+        with mock.patch.dict(os.environ, {"O365_CLIENT_SECRET_WORK": "work secret"}):
+            work = ea.Config.for_account("work", {"provider": "office365"})
+            home = ea.Config.for_account("home", {"provider": "office365"})
+
+        self.assertEqual(work.get("email.office365.client_secret"), "work secret")
+        self.assertIsNone(home.get("email.office365.client_secret"))
+
+    def test_docker_secrets_are_prefixed_with_the_account_name(self):
+        with mock.patch.object(ea.Config, "_load_docker_secrets") as load:
+            ea.Config.for_account("My Work", {"provider": "office365"})
+
+        [mapping] = load.call_args.args
+        self.assertEqual(mapping["my_work_email_password"], "email.password")
+        self.assertEqual(
+            mapping["my_work_o365_token_cache_key"], "email.office365.token_cache.key"
+        )
+        self.assertEqual(set(mapping.values()), set(ea.Config.ACCOUNT_SECRETS))
+
+
+class BackendRegistryTest(unittest.TestCase):
+    def test_factories_are_looked_up_by_name_and_given_the_config(self):
+        seen = []
+        ea.register_model("recorded")(
+            lambda config, context: seen.append((config, context)) or "model"
+        )
+        self.addCleanup(ea.MODEL_BACKENDS.pop, "recorded")
+        config = ea.Config.from_dict({"ai": {"model": "recorded"}})
+        context = ea.BackendContext(workers=3)
+
+        self.assertEqual(ea.build_model("recorded", config, context), "model")
+        self.assertEqual(seen, [(config, context)])
+        with self.assertRaises(ValueError):
+            ea.build_model("missing", config, context)
+
+    def test_missing_packages_are_reported_by_name(self):
+        ea.register_provider("needy", "no_such_package")(lambda *args: None)
+        self.addCleanup(ea.PROVIDER_BACKENDS.pop, "needy")
+        settings = ea.Config.from_dict({"email": {"provider": "needy"}})
+
+        with self.assertRaisesRegex(ValueError, "no_such_package"):
+            ea.build_provider(settings, settings, ea.BackendContext())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,262 @@
+import imaplib
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+
+from helpers import bench, close_assistant, ea, imap_settings, make_assistant
+
+MESSAGES = [
+    b"Subject: Plain\r\n\r\nFirst line\r\nSecond line\r\n",
+    b"Subject: Quoted\r\nContent-Transfer-Encoding: quoted-printable\r\n\r\n"
+    b"Caf=C3=A9 line\r\nNext =\r\nline\r\n",
+    b"Subject: Base64\r\nContent-Transfer-Encoding: base64\r\n\r\n"
+    b"T25lDQpUd28NCg==\r\n",
+    b"Subject: HTML\r\nContent-Type: text/html\r\n\r\n"
+    b"<p>Hello</p>\r\n<p>there</p>\r\n",
+]
+
+ATTACHED = (
+    b"Subject: Attached\r\nMIME-Version: 1.0\r\n"
+    b'Content-Type: multipart/mixed; boundary="outer"\r\n\r\n'
+    b"--outer\r\n"
+    b'Content-Type: multipart/alternative; boundary="inner"\r\n\r\n'
+    b"--inner\r\nContent-Type: text/html; charset=utf-8\r\n\r\n"
+    b"<p>The body</p>\r\n--inner--\r\n"
+    b"--outer\r\nContent-Type: text/plain; charset=us-ascii\r\n"
+    b'Content-Disposition: attachment; filename="notes.txt"\r\n\r\n'
+    b"The attachment\r\n--outer--\r\n"
+)
+
+
+class PreviewParityTest(unittest.TestCase):
+    def setUp(self):
+        self.server = bench.FakeIMAPServer(MESSAGES)
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.state = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.state)
+
+    def previews(self, parse_workers: int) -> list:
+        settings = imap_settings(self.server)
+        settings["imap"]["parse_workers"] = parse_workers
+        assistant = make_assistant(self.state, {"email": settings})
+        self.addCleanup(close_assistant, assistant)
+        emails = assistant.email_provider.iter_emails("INBOX", limit=10)
+        return [email.body_preview for email in emails]
+
+    def test_parser_processes_give_the_same_previews(self):
+        previews = self.previews(parse_workers=0)
+
+        self.assertEqual(previews, self.previews(parse_workers=2))
+        self.assertEqual(previews[0], "First line\nSecond line\n")
+        self.assertEqual(previews[2], "One\nTwo\n")
+        self.assertEqual(previews[3], "Hello there")
+        self.assertFalse(any("\r" in preview for preview in previews))
+
+
+class FetchResponseTest(unittest.TestCase):
+    def parse(self, data):
+        return list(ea._parse_fetch_response(data))
+
+    def test_literals_and_continuation_lines(self):
+        header = b"Subject: Hi\r\n\r\n"
+        data = [
+            (b"1 (UID 5 BODY[HEADER.FIELDS (SUBJECT)] {15}", header),
+            b" FLAGS (\\Seen $Label) RFC822.SIZE 120)",
+            (b"2 (UID 6 BODY[TEXT]<0> {3}", b"abc"),
+            b")",
+        ]
+        first, second = self.parse(data)
+
+        self.assertEqual(first["BODY[HEADER.FIELDS (SUBJECT)]"], header)
+        self.assertEqual(first["FLAGS"], ["\\Seen", "$Label"])
+        self.assertEqual((first["UID"], first["RFC822.SIZE"]), ("5", "120"))
+        self.assertEqual(second, {"UID": "6", "BODY[TEXT]": b"abc"})
+
+    def test_items_in_any_order(self):
+        data = [
+            b'3 (FLAGS () BODY[1]<0> "say \\"hi\\"" UID 9)',
+            b"4 (uid 10 body[1] NIL)",
+            None,
+        ]
+        first, second = self.parse(data)
+
+        self.assertEqual(first, {"FLAGS": [], "BODY[1]": 'say "hi"', "UID": "9"})
+        self.assertEqual(second, {"UID": "10", "BODY[1]": None})
+
+
+class BodyStructureTest(unittest.TestCase):
+    def setUp(self):
+        self.server = bench.FakeIMAPServer(MESSAGES + [ATTACHED])
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+    def text_parts(self) -> list:
+        imap = imaplib.IMAP4("127.0.0.1", self.server.port)
+        self.addCleanup(imap.logout)
+        imap.login("test", "test")
+        imap.select("INBOX")
+        _, data = imap.uid("FETCH", "1:*", "(UID BODYSTRUCTURE)")
+        return [
+            ea._find_text_part(item["BODYSTRUCTURE"])
+            for item in ea._parse_fetch_response(data)
+        ]
+
+    def test_text_parts_are_found(self):
+        plain, quoted, base64, html, attached = self.text_parts()
+
+        self.assertEqual(plain, ("1", "7BIT", None, "PLAIN"))
+        self.assertEqual(quoted[1], "QUOTED-PRINTABLE")
+        self.assertEqual(base64[1], "BASE64")
+        self.assertEqual(html[3], "HTML")
+        # The nested HTML body wins over the text/plain attachment
+        self.assertEqual(attached, ("1.1", "7BIT", "utf-8", "HTML"))
+
+    def test_attachments_are_not_previewed(self):
+        state = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, state)
+        assistant = make_assistant(state, {"email": imap_settings(self.server)})
+        self.addCleanup(close_assistant, assistant)
+
+        *_, email = assistant.email_provider.iter_emails("INBOX", limit=10)
+        self.assertEqual(email.subject, "Attached")
+        self.assertEqual(email.body_preview, "The body")
+
+
+class ConnectionPoolTest(unittest.TestCase):
+    def setUp(self):
+        self.server = bench.FakeIMAPServer(MESSAGES)
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.connections = []
+
+    def connect(self):
+        imap = imaplib.IMAP4("127.0.0.1", self.server.port)
+        imap.login("test", "test")
+        self.connections.append(imap)
+        return imap
+
+    def pool(self, **kwargs):
+        pool = ea.IMAPConnectionPool(self.connect, **kwargs)
+        self.addCleanup(pool.close)
+        return pool
+
+    def test_sessions_are_reused_with_their_folder_selected(self):
+        pool = self.pool(size=2)
+        with pool.session("INBOX") as first:
+            first.select("INBOX")
+            with pool.session() as second:
+                pass
+        with pool.session("INBOX") as again:
+            self.assertIs(again, first)
+            self.assertEqual(again.selected, "INBOX")
+        with pool.session() as other:
+            self.assertIs(other, second)
+        self.assertEqual(len(self.connections), 2)
+
+    def test_dropped_idle_connections_are_replaced(self):
+        pool = self.pool(health_check_after=0)
+        with pool.session() as session:
+            session.select("INBOX")
+        self.connections[0].shutdown()
+
+        with pool.session("INBOX") as session:
+            self.assertEqual(session.imap.noop()[0], "OK")
+            self.assertEqual(session.selected, "INBOX")
+        self.assertEqual(len(self.connections), 2)
+
+    def test_sessions_in_use_are_closed_when_released_after_close(self):
+        pool = self.pool()
+        with pool.session() as busy:
+            pool.close()
+        self.assertFalse(busy.healthy())
+
+        with pool.session() as session:
+            self.assertIsNot(session, busy)
+            self.assertEqual(session.imap.noop()[0], "OK")
+
+    def test_commands_are_retried_on_a_new_connection(self):
+        state = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, state)
+        assistant = make_assistant(state, {"email": imap_settings(self.server)})
+        self.addCleanup(close_assistant, assistant)
+        provider = assistant.email_provider
+        with provider.pool.session() as session:
+            session.imap.shutdown()
+
+        emails = provider.get_emails_by_id("INBOX", ["1", "2"])
+        self.assertEqual(sorted(emails), ["1", "2"])
+
+
+class ApplyActionsTest(unittest.TestCase):
+    def setUp(self):
+        self.server = bench.FakeIMAPServer(MESSAGES)
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.inbox = self.server.store.folder("INBOX")
+        self.state = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.state)
+
+    def provider(self, *missing: str):
+        """IMAPProvider on the server, without the given capabilities"""
+        self.server.store.CAPABILITIES = tuple(
+            c for c in bench.IMAPStore.CAPABILITIES if c not in missing
+        )
+        assistant = make_assistant(self.state, {"email": imap_settings(self.server)})
+        self.addCleanup(close_assistant, assistant)
+        return assistant.email_provider
+
+    def apply(self, provider) -> list:
+        # Another client flags message 4 for deletion without expunging it
+        self.inbox.messages[3].flags.add("\\Deleted")
+        return provider.apply_actions(
+            [
+                ea.ProviderAction("1", "move", "Archive"),
+                ea.ProviderAction("2", "move", "Archive"),
+                ea.ProviderAction("3", "mark_read"),
+            ]
+        )
+
+    def uids(self, folder: str = "INBOX") -> list:
+        return [m.uid for m in self.server.store.folder(folder).messages]
+
+    def test_moves_use_uid_move(self):
+        provider = self.provider()
+
+        self.assertEqual(self.apply(provider), [True, True, True])
+        self.assertEqual(self.uids(), [3, 4])
+        self.assertEqual(len(self.uids("Archive")), 2)
+        self.assertIn("\\Seen", self.inbox.messages[0].flags)
+        provider.finish()
+        self.assertEqual(self.uids(), [3, 4])
+
+    def test_without_move_copies_are_expunged_by_uid_in_finish(self):
+        provider = self.provider("MOVE")
+
+        self.assertEqual(self.apply(provider), [True, True, True])
+        self.assertEqual(self.uids(), [1, 2, 3, 4])
+        self.assertEqual(len(self.uids("Archive")), 2)
+        provider.finish()
+        # Only this run's messages are expunged
+        self.assertEqual(self.uids(), [3, 4])
+        provider.finish()
+        self.assertEqual(self.uids(), [3, 4])
+
+    def test_without_uidplus_the_folder_is_expunged(self):
+        provider = self.provider("MOVE", "UIDPLUS")
+
+        self.assertEqual(self.apply(provider), [True, True, True])
+        provider.finish()
+        self.assertEqual(self.uids(), [3])
+
+    def test_uid_sets_are_compressed_into_ranges(self):
+        uid_set = ea._uid_set([9, 1, 2, 3, 7, 10, 11, 12, 2])
+
+        self.assertEqual(uid_set, "1:3,7,9:12")
+        self.assertEqual(list(ea._expand_uid_set(uid_set)), [1, 2, 3, 7, 9, 10, 11, 12])
+        self.assertEqual(ea._uid_set([5]), "5")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,111 @@
+import json
+import re
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+
+from helpers import close_assistant, ea, make_assistant, make_email
+
+ARCHIVE = json.dumps({"action": "archive", "reason": "newsletter"})
+SAMPLE = re.compile(r'^[a-z_]+(\{([a-z]+="([^"\\]|\\.)*",?)*\})? \S+$')
+
+
+class MetricsTest(unittest.TestCase):
+    def setUp(self):
+        self.metrics = ea.Metrics()
+        for seconds in (0.003, 0.02, 100):
+            self.metrics.observe("fetch", seconds, folder="INBOX")
+        self.metrics.inc("model_requests", backend="ollama")
+        self.metrics.inc("model_requests", 2, backend="ollama")
+
+    def lines(self) -> list:
+        return self.metrics.to_prometheus().splitlines()
+
+    def test_every_metric_has_help_and_type(self):
+        lines = self.lines()
+        for metric, kind in (
+            ("email_assistant_stage_seconds", "histogram"),
+            ("email_assistant_model_requests_total", "counter"),
+            ("email_assistant_last_run_timestamp_seconds", "gauge"),
+        ):
+            self.assertEqual(lines.count(f"# TYPE {metric} {kind}"), 1)
+            self.assertEqual(
+                sum(line.startswith(f"# HELP {metric} ") for line in lines), 1
+            )
+        # Counters that never changed are left out
+        self.assertFalse(any("imap_reconnects" in line for line in lines))
+        for line in lines:
+            if not line.startswith("#"):
+                self.assertRegex(line, SAMPLE)
+
+    def test_histogram_buckets_are_cumulative(self):
+        lines = self.lines()
+        prefix = 'email_assistant_stage_seconds_bucket{stage="fetch",folder="INBOX",'
+        self.assertIn(prefix + 'le="0.001"} 0', lines)
+        self.assertIn(prefix + 'le="0.005"} 1', lines)
+        self.assertIn(prefix + 'le="0.025"} 2', lines)
+        self.assertIn(prefix + 'le="60"} 2', lines)
+        self.assertIn(prefix + 'le="+Inf"} 3', lines)
+        self.assertIn(
+            'email_assistant_stage_seconds_count{stage="fetch",folder="INBOX"} 3', lines
+        )
+        self.assertIn('email_assistant_model_requests_total{backend="ollama"} 3', lines)
+
+    def test_label_values_are_escaped(self):
+        self.metrics.inc("actions", result='say "hi"\\\nbye')
+
+        self.assertIn(
+            'email_assistant_actions_total{result="say \\"hi\\"\\\\\\nbye"} 1',
+            self.lines(),
+        )
+
+    def test_unknown_counters_are_rejected(self):
+        with self.assertRaises(ValueError):
+            self.metrics.inc("no_such_counter")
+
+    def test_json_report(self):
+        report = json.loads(json.dumps(self.metrics.report()))
+
+        [stage] = report["stages"]
+        self.assertEqual(
+            (stage["stage"], stage["folder"], stage["calls"]), ("fetch", "INBOX", 3)
+        )
+        self.assertAlmostEqual(stage["seconds"], 100.023)
+        self.assertTrue(0.005 < stage["p50"] <= 0.025)
+        self.assertEqual(
+            report["counters"],
+            [{"name": "model_requests", "backend": "ollama", "value": 3}],
+        )
+
+
+class MetricsExportTest(unittest.TestCase):
+    def test_a_run_writes_the_textfile_and_report(self):
+        state = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, state)
+        assistant = make_assistant(
+            state,
+            {
+                "metrics": {
+                    "textfile": str(state / "metrics" / "assistant.prom"),
+                    "report": str(state / "report.json"),
+                }
+            },
+        )
+        self.addCleanup(close_assistant, assistant)
+        assistant.ai_model.default = ARCHIVE
+        assistant.email_provider.emails = [make_email()]
+        assistant.process_emails()
+        assistant.export_metrics()
+
+        textfile = (state / "metrics" / "assistant.prom").read_text()
+        self.assertIn('email_assistant_stage_seconds_count{stage="model"', textfile)
+        self.assertFalse(list((state / "metrics").glob(".*.tmp")))
+        report = json.loads((state / "report.json").read_text())
+        self.assertTrue(report["dry_run"])
+        self.assertIn("scripted", report["model_usage"])
+        self.assertIn("model", {stage["stage"] for stage in report["stages"]})
+
+
+if __name__ == "__main__":
+    unittest.main()
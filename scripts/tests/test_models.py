@@ -0,0 +1,114 @@
+import json
+import unittest
+
+from helpers import ScriptedModel, ea, make_email
+
+
+def decision(action: str, **fields) -> dict:
+    return {"action": action, "reason": f"{action} it", **fields}
+
+
+class CategorizeBatchTest(unittest.TestCase):
+    def setUp(self):
+        self.emails = [make_email(id=str(i), subject=f"Email {i}") for i in range(3)]
+
+    def test_one_request_answers_every_email_in_order(self):
+        model = ScriptedModel(
+            [
+                json.dumps(
+                    {
+                        "results": [
+                            {"id": "3", **decision("delete")},
+                            {"id": "[1]", **decision("archive", confidence=0.7)},
+                            {"id": "2", **decision("mark_read")},
+                        ]
+                    }
+                )
+            ]
+        )
+        categories = model.categorize_batch(self.emails, "prompt")
+
+        self.assertEqual(len(model.calls), 1)
+        self.assertIn(ea.BATCH_RESPONSE_FORMAT, model.calls[0][0])
+        self.assertEqual(
+            [c.action.value for c in categories], ["archive", "mark_read", "delete"]
+        )
+        self.assertEqual(categories[0].confidence, 0.7)
+
+    def test_missing_and_invalid_entries_are_asked_individually(self):
+        model = ScriptedModel(
+            [
+                json.dumps(
+                    [
+                        {"id": "1", **decision("archive")},
+                        {"id": "2", "action": "shred", "reason": "bad action"},
+                    ]
+                ),
+                json.dumps(decision("keep_inbox")),
+                json.dumps(decision("delete")),
+            ]
+        )
+        categories = model.categorize_batch(self.emails, "prompt")
+
+        self.assertEqual(len(model.calls), 3)
+        self.assertIn("Email 1", model.calls[1][1])
+        self.assertIn("Email 2", model.calls[2][1])
+        self.assertEqual(
+            [c.action.value for c in categories], ["archive", "keep_inbox", "delete"]
+        )
+
+    def test_unparseable_batch_falls_back_to_single_requests(self):
+        model = ScriptedModel(
+            ["not json"] + [json.dumps(decision("archive"))] * len(self.emails)
+        )
+        categories = model.categorize_batch(self.emails, "prompt")
+
+        self.assertEqual(len(model.calls), 1 + len(self.emails))
+        self.assertTrue(all(c.action == ea.EmailAction.ARCHIVE for c in categories))
+
+    def test_failed_request_keeps_the_email_in_the_inbox(self):
+        model = ScriptedModel([ConnectionError("model down")])
+        [category] = model.categorize_batch(self.emails[:1], "prompt")
+
+        self.assertIn(ea.SINGLE_RESPONSE_FORMAT, model.calls[0][0])
+        self.assertEqual(category.action, ea.EmailAction.KEEP_INBOX)
+        self.assertTrue(category.reason.startswith("Error during categorization"))
+
+    def test_confidence_is_clamped(self):
+        model = ScriptedModel([json.dumps(decision("archive", confidence="1.7"))])
+        [category] = model.categorize_batch(self.emails[:1], "prompt")
+        self.assertEqual(category.confidence, 1.0)
+
+
+class SingleEmailModelTest(unittest.TestCase):
+    def test_batches_default_to_one_email_at_a_time(self):
+        class Model(ea.AIModel):
+            def __init__(self):
+                super().__init__()
+                self.seen = []
+
+            def test_connection(self):
+                return True
+
+            def categorize_email(self, email, prompt):
+                self.seen.append(email.id)
+                return ea.EmailCategory(ea.EmailAction.ARCHIVE, "one by one")
+
+        model = Model()
+        emails = [make_email(id=str(i)) for i in range(3)]
+        categories = model.categorize_batch(emails, "prompt")
+
+        self.assertEqual(model.seen, ["0", "1", "2"])
+        self.assertEqual(len(categories), 3)
+
+    def test_prompt_models_must_implement_generate(self):
+        class Incomplete(ea.PromptModel):
+            def test_connection(self):
+                return True
+
+        with self.assertRaises(TypeError):
+            Incomplete()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,209 @@
+import json
+import shutil
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import requests
+from graph_stub import GraphStub, skip_authentication
+from helpers import ea, raw_message
+
+try:
+    from cryptography.fernet import Fernet, InvalidToken
+except ImportError:
+    Fernet = None
+
+
+class BatchTest(unittest.TestCase):
+    def setUp(self):
+        self.graph = GraphStub([raw_message(n) for n in range(1, 51)])
+        self.addCleanup(self.graph.server_close)
+        self.addCleanup(self.graph.shutdown)
+        self.ids = sorted(self.graph.messages)
+        with skip_authentication():
+            self.provider = ea.Office365Provider(
+                client_id="test",
+                graph_url=self.graph.url,
+                http=ea.HTTPClient(retry=ea.RetryPolicy(max_retries=2, backoff=0)),
+            )
+
+    def test_actions_are_sent_twenty_at_a_time(self):
+        actions = [ea.ProviderAction(i, "mark_read") for i in self.ids[:45]]
+        self.assertEqual(self.provider.apply_actions(actions), [True] * 45)
+        self.assertEqual(self.graph.batches, [20, 20, 5])
+        self.assertTrue(all(self.graph.messages[i]["isRead"] for i in self.ids[:45]))
+
+    def test_failed_items_fail_alone(self):
+        missing, rejected = self.ids[3], self.ids[4]
+        self.graph.failures = {missing: [404], rejected: [400]}
+        actions = [
+            ea.ProviderAction(i, "move", destination="archive") for i in self.ids[:6]
+        ]
+        results = self.provider.apply_actions(actions)
+
+        self.assertEqual(results, [True, True, True, False, False, True])
+        self.assertEqual(self.graph.batches, [6])
+        self.assertEqual(self.graph.folders[self.ids[5]], "archive")
+        self.assertEqual(self.graph.folders[rejected], "inbox")
+
+    def test_throttled_items_are_retried(self):
+        throttled, down = self.ids[1], self.ids[2]
+        self.graph.failures = {throttled: [429], down: [503, 503, 503]}
+        actions = [ea.ProviderAction(i, "delete") for i in self.ids[:3]]
+        results = self.provider.apply_actions(actions)
+
+        # Retries resend only the throttled items, until max_retries runs out
+        self.assertEqual(results, [True, True, False])
+        self.assertEqual(self.graph.batches, [3, 2, 1])
+        self.assertNotIn(throttled, self.graph.messages)
+        self.assertIn(down, self.graph.messages)
+
+    def test_unknown_operations_are_not_sent(self):
+        actions = [
+            ea.ProviderAction(self.ids[0], "flag"),
+            ea.ProviderAction(self.ids[1], "mark_read"),
+        ]
+        self.assertEqual(self.provider.apply_actions(actions), [False, True])
+        self.assertEqual(self.graph.batches, [1])
+
+    def test_emails_are_fetched_by_id_in_batches(self):
+        wanted = self.ids[:25] + ["AAMkGone"]
+        found = self.provider.get_emails_by_id("inbox", wanted)
+
+        self.assertEqual(sorted(found), self.ids[:25])
+        self.assertEqual(self.graph.batches, [20, 6])
+
+    def test_emails_moved_elsewhere_are_left_out(self):
+        moved = ea.ProviderAction(self.ids[0], "move", destination="archive")
+        self.assertEqual(self.provider.apply_actions([moved]), [True])
+
+        with mock.patch.object(self.graph, "route", wraps=self.graph.route) as route:
+            inbox = self.provider.get_emails_by_id("inbox", self.ids[:3])
+            archive = self.provider.get_emails_by_id("archive", self.ids[:3])
+            again = self.provider.get_emails_by_id("inbox", self.ids[:3])
+
+        self.assertEqual(sorted(inbox), self.ids[1:3])
+        self.assertEqual(list(archive), self.ids[:1])
+        self.assertEqual(archive[self.ids[0]].folder, "archive")
+        self.assertEqual(again.keys(), inbox.keys())
+        # Each folder's id is looked up once
+        lookups = [
+            call.args[1].partition("?")[0]
+            for call in route.call_args_list
+            if call.args[1].startswith("/v1.0/me/mailFolders/")
+        ]
+        self.assertEqual(
+            lookups, ["/v1.0/me/mailFolders/inbox", "/v1.0/me/mailFolders/archive"]
+        )
+
+
+class TokenRefreshTest(unittest.TestCase):
+    def setUp(self):
+        self.graph = GraphStub([raw_message(1)])
+        self.addCleanup(self.graph.server_close)
+        self.addCleanup(self.graph.shutdown)
+        self.logins = []
+
+        def authenticate(provider, force_refresh=False):
+            self.logins.append(force_refresh)
+            provider.access_token = f"token{len(self.logins)}"
+
+        patch = mock.patch.object(ea.Office365Provider, "_authenticate", authenticate)
+        patch.start()
+        self.addCleanup(patch.stop)
+        self.provider = ea.Office365Provider(client_id="test", graph_url=self.graph.url)
+
+    def test_a_rejected_token_is_refreshed_and_the_request_replayed(self):
+        self.graph.rejected_tokens = {"token1"}
+        response = self.provider._make_request("GET", "/me/mailFolders")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.graph.tokens, ["token1", "token2"])
+        self.assertEqual(self.logins, [False, True])
+
+        self.provider._make_request("GET", "/me/mailFolders")
+        self.assertEqual(self.graph.tokens[-1], "token2")
+        self.assertEqual(len(self.logins), 2)
+
+    def test_a_request_is_replayed_only_once(self):
+        self.graph.rejected_tokens = {"token1", "token2"}
+        with self.assertRaises(requests.HTTPError):
+            self.provider._make_request("GET", "/me/mailFolders")
+        self.assertEqual(self.graph.tokens, ["token1", "token2"])
+
+    def test_expiring_tokens_are_refreshed_before_the_request(self):
+        self.provider._token_expires = ea.time.time() + 60
+        self.provider._make_request("GET", "/me/mailFolders")
+
+        self.assertEqual(self.graph.tokens, ["token2"])
+        self.assertEqual(self.logins, [False, False])
+
+
+@unittest.skipIf(Fernet is None, "needs cryptography")
+class TokenCacheTest(unittest.TestCase):
+    STATE = json.dumps({"AccessToken": {"key": {"secret": "access token"}}})
+
+    def setUp(self):
+        self.state = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.state)
+        self.path = self.state / "msal.bin"
+        # Fast key derivation, and the Fernet fallback even with msal-extensions
+        for patch in (
+            mock.patch.object(ea.TokenCache, "KDF_ITERATIONS", 1000),
+            mock.patch.dict(sys.modules, {"msal_extensions": None}),
+        ):
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def saved(self, key: str = "secret") -> "ea.TokenCache":
+        cache = ea.TokenCache(self.path, key=key)
+        cache.cache.deserialize(self.STATE)
+        cache.cache.has_state_changed = True
+        cache.save()
+        return cache
+
+    def test_tokens_survive_reloading(self):
+        self.saved()
+
+        self.assertEqual(self.path.stat().st_mode & 0o777, 0o600)
+        self.assertEqual(
+            self.path.with_name("msal.bin.salt").stat().st_mode & 0o777, 0o600
+        )
+        self.assertNotIn(b"access token", self.path.read_bytes())
+        reloaded = ea.TokenCache(self.path, key="secret")
+        self.assertEqual(json.loads(reloaded.cache.serialize()), json.loads(self.STATE))
+        self.assertFalse(reloaded.cache.has_state_changed)
+
+    def test_a_wrong_key_starts_empty(self):
+        self.saved()
+        with self.assertLogs(ea.logger, "WARNING"):
+            reloaded = ea.TokenCache(self.path, key="other")
+        self.assertNotIn("access token", reloaded.cache.serialize())
+
+    def test_the_key_is_salted(self):
+        self.saved()
+        bare = Fernet(ea.urlsafe_b64encode(ea.hashlib.sha256(b"secret").digest()))
+        with self.assertRaises(InvalidToken):
+            bare.decrypt(self.path.read_bytes())
+
+        salt = self.path.with_name("msal.bin.salt").read_bytes()
+        self.path.unlink()
+        self.path.with_name("msal.bin.salt").unlink()
+        self.saved()
+        self.assertNotEqual(self.path.with_name("msal.bin.salt").read_bytes(), salt)
+
+    def test_unsalted_caches_are_read_and_re_encrypted(self):
+        bare = Fernet(ea.urlsafe_b64encode(ea.hashlib.sha256(b"secret").digest()))
+        self.path.write_bytes(bare.encrypt(self.STATE.encode()))
+
+        ea.TokenCache(self.path, key="secret").save()
+        with self.assertRaises(InvalidToken):
+            bare.decrypt(self.path.read_bytes())
+        reloaded = ea.TokenCache(self.path, key="secret")
+        self.assertEqual(json.loads(reloaded.cache.serialize()), json.loads(self.STATE))
+
+
+if __name__ == "__main__":
+    unittest.main()
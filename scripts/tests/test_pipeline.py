@@ -0,0 +1,113 @@
+import json
+import shutil
+import sqlite3
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from helpers import close_assistant, ea, make_assistant, make_email
+
+ARCHIVE = json.dumps({"action": "archive", "reason": "newsletter"})
+
+
+class PipelineErrorTest(unittest.TestCase):
+    def setUp(self):
+        state = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, state)
+        self.assistant = make_assistant(
+            state,
+            {"processing": {"batch_size": 2}, "classifier": {"record_history": True}},
+            dry_run=False,
+            workers=2,
+        )
+        self.addCleanup(close_assistant, self.assistant)
+        self.assistant.ai_model.default = ARCHIVE
+        self.provider = self.assistant.email_provider
+        self.provider.emails = [
+            make_email(id=str(i), subject=f"Email {i}") for i in range(5)
+        ]
+
+    def process(self):
+        """Run the pipeline, failing instead of hanging if a stage never ends"""
+        done = {}
+        thread = threading.Thread(
+            target=lambda: done.update(summary=self.assistant.process_emails()),
+            daemon=True,
+        )
+        thread.start()
+        thread.join(10)
+        self.assertFalse(thread.is_alive(), "the pipeline hung")
+        return done["summary"]
+
+    @property
+    def records(self):
+        return self.assistant.result_sinks[0].records
+
+    def test_cache_errors_are_cache_misses(self):
+        failing = mock.patch.object(
+            self.assistant.cache,
+            "get_many",
+            side_effect=sqlite3.OperationalError("database is locked"),
+        )
+        with (
+            failing,
+            mock.patch.object(
+                self.assistant.cache, "put_many", side_effect=sqlite3.OperationalError
+            ),
+        ):
+            summary = self.process()
+
+        self.assertEqual(summary.actions, {"archive": 5})
+        self.assertEqual(len(self.provider.applied), 5)
+
+    def test_classifier_errors_fall_back_to_the_model(self):
+        self.assistant.classifier = mock.Mock()
+        self.assistant.classifier.classify.side_effect = ValueError("bad model file")
+        summary = self.process()
+
+        self.assertEqual(summary.actions, {"archive": 5})
+        self.assertEqual(summary.sources, {"model": 5})
+
+    def test_history_errors_do_not_stop_the_run(self):
+        with mock.patch.object(
+            self.assistant.history, "append", side_effect=OSError("disk full")
+        ):
+            summary = self.process()
+        self.assertEqual(summary.total, 5)
+
+    def test_worker_failure_keeps_its_emails_in_the_inbox(self):
+        original = self.assistant._categorize_clusters
+
+        def categorize(clusters, prompt, namespace):
+            if any(email.id == "2" for cluster in clusters for _, email in cluster):
+                raise RuntimeError("worker crashed")
+            return original(clusters, prompt, namespace)
+
+        with mock.patch.object(self.assistant, "_categorize_clusters", categorize):
+            summary = self.process()
+
+        self.assertEqual([r["id"] for r in self.records], ["0", "1", "2", "3", "4"])
+        self.assertEqual([r["action"] for r in self.records[2:4]], ["keep_inbox"] * 2)
+        self.assertTrue(self.records[2]["reason"].startswith("Error during"))
+        self.assertEqual(summary.actions, {"archive": 3, "keep_inbox": 2})
+        self.assertEqual(len(self.provider.applied), 3)
+
+    def test_failed_fetch_processes_what_was_queued(self):
+        self.provider.fail_after = 3
+        summary = self.process()
+        self.assertEqual([r["id"] for r in self.records], ["0", "1"])
+        self.assertEqual(summary.total, 2)
+
+
+class EmailCategoryTest(unittest.TestCase):
+    def test_error_fallback_is_recognised(self):
+        category = ea.EmailCategory.for_error(TimeoutError("read timed out"))
+        self.assertEqual(category.action, ea.EmailAction.KEEP_INBOX)
+        self.assertTrue(category.failed)
+        self.assertFalse(ea.EmailCategory(ea.EmailAction.ARCHIVE, "ok").failed)
+
+
+if __name__ == "__main__":
+    unittest.main()
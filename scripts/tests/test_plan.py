@@ -0,0 +1,90 @@
+import dataclasses
+import json
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from helpers import close_assistant, ea, make_assistant, make_email
+
+ARCHIVE = json.dumps({"action": "archive", "reason": "newsletter"})
+
+
+class PlanApplyTest(unittest.TestCase):
+    def setUp(self):
+        self.state = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.state)
+        self.plan = self.state / "plan.jsonl"
+        self.emails = [make_email(id=str(i), subject=f"Email {i}") for i in range(5)]
+
+        planner = make_assistant(self.state)
+        planner.ai_model.default = ARCHIVE
+        planner.email_provider.emails = list(self.emails)
+        planner.plan_sink = ea.JSONLResultSink(self.plan, append=False)
+        planner.process_emails()
+        planner.close_results()
+        close_assistant(planner)
+
+    def applier(self):
+        """An assistant for the apply command, on a mailbox holding the emails"""
+        assistant = make_assistant(
+            self.state,
+            {"processing": {"apply_batch_size": 2}},
+            dry_run=False,
+            classify=False,
+        )
+        self.addCleanup(close_assistant, assistant)
+        assistant.email_provider.emails = list(self.emails)
+        return assistant
+
+    def applied(self, assistant):
+        return [email_id for _, email_id, _ in assistant.email_provider.applied]
+
+    def test_a_plan_is_applied_without_a_model(self):
+        self.assertEqual(len(list(ea.read_results(self.plan))), 5)
+        assistant = self.applier()
+
+        self.assertIsNone(assistant.ai_model)
+        self.assertIsNone(assistant.cache)
+        self.assertTrue(assistant.test_connections())
+        self.assertTrue(assistant.apply_plan(self.plan))
+        self.assertEqual(self.applied(assistant), ["0", "1", "2", "3", "4"])
+        with self.assertRaises(ValueError):
+            assistant.process_emails()
+
+    def test_changed_and_missing_emails_are_skipped(self):
+        self.emails[1] = dataclasses.replace(self.emails[1], is_read=True)
+        del self.emails[3]
+        assistant = self.applier()
+
+        self.assertTrue(assistant.apply_plan(self.plan))
+        self.assertEqual(self.applied(assistant), ["0", "2", "4"])
+
+    def test_a_second_run_resumes_after_the_last_applied_chunk(self):
+        first = self.applier()
+        check = first.email_provider.get_emails_by_id
+        calls = []
+
+        def interrupted(folder, ids):
+            calls.append(ids)
+            if len(calls) == 2:
+                raise KeyboardInterrupt
+            return check(folder, ids)
+
+        with mock.patch.object(first.email_provider, "get_emails_by_id", interrupted):
+            with self.assertRaises(KeyboardInterrupt):
+                first.apply_plan(self.plan)
+        self.assertEqual(self.applied(first), ["0", "1"])
+
+        second = self.applier()
+        self.assertTrue(second.apply_plan(self.plan))
+        self.assertEqual(self.applied(second), ["2", "3", "4"])
+
+        third = self.applier()
+        self.assertTrue(third.apply_plan(self.plan))
+        self.assertEqual(self.applied(third), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+import json
+import unittest
+from types import SimpleNamespace
+
+from helpers import ea, make_email
+
+ANSWER = json.dumps({"action": "archive", "reason": "newsletter", "confidence": 0.9})
+
+
+class FakeHTTP:
+    """HTTPClient stand-in answering every request like Ollama's generate"""
+
+    timeout = 30
+
+    def __init__(self):
+        self.requests = []
+
+    def request(self, method, url, **kwargs):
+        self.requests.append(kwargs["json"])
+        body = {"response": ANSWER, "prompt_eval_count": 40, "eval_count": 12}
+        return SimpleNamespace(raise_for_status=lambda: None, json=lambda: body)
+
+
+class FakeMessages:
+    """anthropic client.messages stand-in reporting a prompt cache read"""
+
+    def __init__(self):
+        self.requests = []
+
+    def create(self, **kwargs):
+        self.requests.append(kwargs)
+        usage = SimpleNamespace(
+            input_tokens=30,
+            cache_read_input_tokens=1200,
+            cache_creation_input_tokens=0,
+            output_tokens=15,
+        )
+        return SimpleNamespace(usage=usage, content=[SimpleNamespace(text=ANSWER)])
+
+
+class PromptPrefixTest(unittest.TestCase):
+    def setUp(self):
+        self.emails = [make_email(id=str(i), subject=f"Email {i}") for i in range(2)]
+
+    def test_ollama_sends_the_same_instructions_for_every_email(self):
+        http = FakeHTTP()
+        model = ea.OllamaModel(http=http, keep_alive="1h")
+        for email in self.emails:
+            model.categorize_email(email, "my prompt")
+
+        first, second = http.requests
+        self.assertEqual(first["system"], second["system"])
+        self.assertTrue(first["system"].startswith("my prompt"))
+        self.assertNotIn("Email 0", first["system"])
+        self.assertIn("Email 0", first["prompt"])
+        self.assertIn("Email 1", second["prompt"])
+        self.assertEqual(first["keep_alive"], "1h")
+        self.assertEqual(model.usage.counts["requests"], 2)
+        self.assertEqual(model.usage.counts["input_tokens"], 80)
+
+    def test_anthropic_marks_the_instructions_for_caching(self):
+        model = ea.AnthropicModel.__new__(ea.AnthropicModel)
+        ea.PromptModel.__init__(model)
+        model.model = "test"
+        model.client = SimpleNamespace(messages=FakeMessages())
+        [category] = model.categorize_batch(self.emails[:1], "my prompt")
+
+        [request] = model.client.messages.requests
+        [system] = request["system"]
+        self.assertEqual(system["cache_control"], {"type": "ephemeral"})
+        self.assertTrue(system["text"].startswith("my prompt"))
+        self.assertIn("Email 0", request["messages"][0]["content"])
+        self.assertEqual(category.action, ea.EmailAction.ARCHIVE)
+        self.assertEqual(model.usage.counts["input_tokens"], 1230)
+        self.assertEqual(model.usage.counts["cached_input_tokens"], 1200)
+        self.assertIn("98%", model.usage.summary())
+
+
+if __name__ == "__main__":
+    unittest.main()
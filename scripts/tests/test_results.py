@@ -0,0 +1,101 @@
+import json
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+
+from helpers import close_assistant, ea, make_assistant, make_email
+
+ARCHIVE = json.dumps({"action": "archive", "reason": "newsletter"})
+DELETE = json.dumps({"action": "delete", "reason": "spam"})
+
+
+class JSONLResultSinkTest(unittest.TestCase):
+    def setUp(self):
+        self.state = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.state)
+
+    def write(self, path: Path, numbers, **kwargs) -> "ea.JSONLResultSink":
+        sink = ea.JSONLResultSink(path, **kwargs)
+        for number in numbers:
+            sink.write({"id": str(number), "subject": f"Café {number}"})
+        return sink
+
+    def ids(self, path: Path) -> list:
+        return [record["id"] for record in ea.read_results(path)]
+
+    def test_gzip_files_round_trip_across_appends(self):
+        path = self.state / "results.jsonl.gz"
+        self.write(path, range(3)).close()
+        self.write(path, range(3, 5)).close()
+
+        self.assertEqual(path.read_bytes()[:2], b"\x1f\x8b")
+        self.assertEqual(self.ids(path), ["0", "1", "2", "3", "4"])
+        self.assertEqual(next(ea.read_results(path))["subject"], "Café 0")
+
+        self.write(path, [9], append=False).close()
+        self.assertEqual(self.ids(path), ["9"])
+
+    def test_a_gzip_file_cut_short_keeps_its_flushed_records(self):
+        path = self.state / "results.jsonl.gz"
+        sink = self.write(path, range(25), flush_every=10)
+        # What a crash would leave behind: everything up to the last flush
+        crashed = self.state / "crashed.jsonl.gz"
+        crashed.write_bytes(path.read_bytes())
+        sink.close()
+
+        self.assertEqual(self.ids(crashed), [str(n) for n in range(20)])
+        self.assertEqual(len(self.ids(path)), 25)
+
+    def test_plain_files_skip_unreadable_lines(self):
+        path = self.state / "results.jsonl"
+        sink = self.write(path, range(2))
+        # Line buffered: readable before the sink is closed
+        self.assertEqual(self.ids(path), ["0", "1"])
+        sink.close()
+        with open(path, "a") as f:
+            f.write('{"id": "2"\n[1, 2]\n')
+
+        self.assertEqual(self.ids(path), ["0", "1"])
+
+
+class ReportResultsTest(unittest.TestCase):
+    def setUp(self):
+        self.state = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.state)
+        self.results = self.state / "results.jsonl.gz"
+
+    def run_assistant(self, answer: str, count: int):
+        """Process count emails, appending the decisions to the results file"""
+        assistant = make_assistant(self.state, use_cache=False)
+        self.addCleanup(close_assistant, assistant)
+        assistant.ai_model.default = answer
+        assistant.email_provider.emails = [
+            make_email(id=str(i), subject=f"Email {i}") for i in range(count)
+        ]
+        assistant.result_sinks.append(ea.JSONLResultSink(self.results))
+        assistant.process_emails()
+        assistant.close_results()
+
+    def test_runs_are_aggregated(self):
+        self.run_assistant(ARCHIVE, 3)
+        self.run_assistant(DELETE, 2)
+        plain = self.state / "older.jsonl"
+        plain.write_text(json.dumps({"action": "archive", "source": "rules"}) + "\n")
+
+        with self.assertLogs(ea.logger, "INFO") as logs:
+            self.assertTrue(ea.report_results([self.results, plain]))
+
+        messages = [record.getMessage() for record in logs.records]
+        self.assertIn("Total emails processed: 6", messages)
+        self.assertIn("  archive: 4", messages)
+        self.assertIn("  delete: 2", messages)
+        self.assertIn("Decision sources: model: 5, rules: 1", messages)
+        self.assertTrue(any(m.startswith("Decisions made from") for m in messages))
+
+    def test_missing_files_fail(self):
+        self.assertFalse(ea.report_results([self.state / "missing.jsonl"]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,113 @@
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+
+from helpers import close_assistant, ea, make_assistant, make_email
+
+
+def engine(*entries) -> "ea.RulesEngine":
+    return ea.RulesEngine.from_config(list(entries))
+
+
+def rule(name: str, action: str = "archive", **match) -> dict:
+    return {"name": name, "action": action, "match": match}
+
+
+class RulesEngineTest(unittest.TestCase):
+    def test_first_matching_rule_in_config_order_wins(self):
+        rules = engine(
+            rule("anything urgent", "keep_inbox", subject="urgent"),
+            rule("shop", "delete", sender="shop@example.com"),
+        )
+        urgent = make_email(subject="URGENT: sale", sender_email="shop@example.com")
+        category = rules.match(urgent)
+
+        self.assertEqual(category.action, ea.EmailAction.KEEP_INBOX)
+        self.assertEqual(category.reason, "Matched rule 'anything urgent'")
+        self.assertEqual((category.source, category.confidence), ("rule", 1.0))
+        self.assertEqual(
+            rules.match(make_email(sender_email="Shop@Example.com")).action,
+            ea.EmailAction.DELETE,
+        )
+        self.assertIsNone(rules.match(make_email()))
+
+    def test_domains_cover_subdomains(self):
+        rules = engine(rule("newsletters", domain=["@substack.com"]))
+        self.assertTrue(rules.match(make_email(sender_email="a@substack.com")))
+        self.assertTrue(rules.match(make_email(sender_email="a@news.substack.com")))
+        self.assertIsNone(rules.match(make_email(sender_email="a@notsubstack.com")))
+
+    def test_every_other_condition_must_hold(self):
+        rules = engine(
+            {
+                **rule(
+                    "receipts",
+                    "move_folder",
+                    sender=["receipts@example.com", "billing@example.com"],
+                    subject="receipt|order confirmation",
+                    folder="inbox",
+                ),
+                "folder": "Receipts",
+            }
+        )
+        receipt = make_email(subject="Your receipt", sender_email="billing@example.com")
+        self.assertEqual(rules.match(receipt).folder, "Receipts")
+        receipt.folder = "Archive"
+        self.assertIsNone(rules.match(receipt))
+        self.assertIsNone(
+            rules.match(make_email(subject="Hi", sender_email="billing@example.com"))
+        )
+
+    def test_header_conditions(self):
+        rules = engine(rule("lists", headers={"List-Unsubscribe": "."}))
+        self.assertEqual(rules.header_names, ["list-unsubscribe"])
+        listed = make_email(headers={"list-unsubscribe": "<mailto:u@example.com>"})
+        self.assertTrue(rules.match(listed))
+        self.assertIsNone(rules.match(make_email()))
+
+    def test_subject_patterns_with_backreferences(self):
+        rules = engine(
+            rule("builds", subject=r"(build|deploy) failed"),
+            rule("repeated", "delete", subject=r"\b(\w+) \1\b"),
+        )
+        self.assertEqual(
+            rules.match(make_email(subject="win win offer")).action,
+            ea.EmailAction.DELETE,
+        )
+        self.assertTrue(rules.match(make_email(subject="Build failed on main")))
+
+    def test_invalid_rules_are_rejected(self):
+        for entry in [
+            rule("bad action", "shred", sender="a@example.com"),
+            rule("no folder", "move_folder", sender="a@example.com"),
+            rule("bad pattern", subject="(unclosed"),
+            {"name": "no action", "match": {"sender": "a@example.com"}},
+        ]:
+            with self.subTest(entry["name"]):
+                with self.assertRaisesRegex(ValueError, entry["name"]):
+                    engine(entry)
+
+
+class RulesInPipelineTest(unittest.TestCase):
+    def test_matched_emails_never_reach_the_model(self):
+        state = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, state)
+        assistant = make_assistant(state)
+        self.addCleanup(close_assistant, assistant)
+        assistant.rules = engine(rule("shop", "delete", domain="shop.example.com"))
+        emails = [
+            make_email(id="1", sender_email="deals@shop.example.com"),
+            make_email(id="2", sender_email="bob@example.com"),
+        ]
+        assistant.ai_model.default = '{"action": "keep_inbox", "reason": "bob"}'
+
+        categories = assistant._categorize_batch(emails, "prompt", "namespace")
+
+        self.assertEqual([c.source for c in categories], ["rule", None])
+        self.assertEqual(len(assistant.ai_model.calls), 1)
+        self.assertNotIn("shop.example.com", assistant.ai_model.calls[0][1])
+
+
+if __name__ == "__main__":
+    unittest.main()
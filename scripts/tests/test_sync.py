@@ -0,0 +1,270 @@
+import json
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from graph_stub import GraphStub, office365_settings, skip_authentication
+from helpers import (
+    bench,
+    close_assistant,
+    imap_settings,
+    make_assistant,
+    raw_message,
+)
+
+ARCHIVE = json.dumps({"action": "archive", "reason": "newsletter"})
+
+
+def answer_unless(*subjects: str):
+    """Model answer archiving everything but emails with these subjects"""
+
+    def answer(content: str):
+        if any(f"Subject: {subject}\n" in content for subject in subjects):
+            return ConnectionError("model unavailable")
+        return ARCHIVE
+
+    return answer
+
+
+class IMAPSyncTest(unittest.TestCase):
+    def setUp(self):
+        self.server = bench.FakeIMAPServer([raw_message(n) for n in range(1, 31)])
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.state = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.state)
+        self.assistant = self.make_assistant()
+
+    def make_assistant(self):
+        assistant = make_assistant(
+            self.state,
+            {
+                "email": imap_settings(self.server),
+                "cache": {"enabled": False},
+                "processing": {"batch_size": 1, "page_size": 10},
+            },
+            dry_run=False,
+            incremental=True,
+        )
+        self.addCleanup(close_assistant, assistant)
+        assistant.ai_model.default = ARCHIVE
+        # Store positions as a real run would, without moving any mail
+        provider = assistant.email_provider
+        provider.apply_actions = lambda actions: [True] * len(actions)
+        return assistant
+
+    def process(self, limit: int = 50) -> list:
+        self.assistant.result_sinks[0].records.clear()
+        self.assistant.process_emails(folder="INBOX", limit=limit)
+        return [int(r["id"]) for r in self.assistant.result_sinks[0].records]
+
+    def stored(self) -> dict:
+        provider = self.assistant.email_provider
+        return json.loads((self.state / "sync.json").read_text())[
+            provider.sync_key("INBOX")
+        ]
+
+    def test_positions_advance_over_processed_emails(self):
+        self.assertEqual(self.process(limit=20), list(range(11, 31)))
+        self.assertEqual(self.stored()["last_uid"], 30)
+        self.assertEqual(self.process(), [])
+
+        self.server.store.folder("INBOX").append(raw_message(31))
+        self.assertEqual(self.process(), [31])
+        self.assertEqual(self.stored()["last_uid"], 31)
+
+    def test_failed_fetch_keeps_the_rest_for_next_run(self):
+        provider = self.assistant.email_provider
+        fetch_window = provider._fetch_window
+        windows = []
+
+        def flaky(folder, uids, previews=True):
+            windows.append(uids)
+            if len(windows) == 2:
+                raise OSError("connection reset")
+            return fetch_window(folder, uids, previews)
+
+        with mock.patch.object(provider, "_fetch_window", flaky):
+            self.assertEqual(self.process(), list(range(1, 11)))
+        self.assertEqual(self.stored()["last_uid"], 10)
+
+        self.assertEqual(self.process(), list(range(11, 31)))
+        self.assertEqual(self.stored()["last_uid"], 30)
+
+    def test_failed_categorization_is_fetched_again(self):
+        self.assistant.ai_model.default = answer_unless("Email 5")
+        records = self.process()
+        self.assertEqual(len(records), 30)
+        self.assertEqual(self.stored()["last_uid"], 30)
+        self.assertEqual(self.stored()["retry"], {"5": 1})
+
+        self.assistant.ai_model.default = ARCHIVE
+        self.assertEqual(self.process(), [5])
+        self.assertEqual(self.stored()["retry"], {})
+        self.assertEqual(self.process(), [])
+
+    def test_failed_action_is_fetched_again(self):
+        self.assistant.email_provider.apply_actions = lambda actions: [
+            action.email_id != "7" for action in actions
+        ]
+        self.process()
+        self.assertEqual(self.stored()["last_uid"], 30)
+        self.assertEqual(self.stored()["retry"], {"7": 1})
+
+    def test_an_email_that_always_fails_does_not_hold_back_the_folder(self):
+        self.assertEqual(self.process(limit=5), list(range(26, 31)))
+        for number in range(31, 45):
+            self.server.store.folder("INBOX").append(raw_message(number))
+        self.assistant.ai_model.default = answer_unless("Email 32")
+
+        runs = [self.process(limit=5) for _ in range(4)]
+
+        self.assertEqual(
+            runs,
+            [
+                [31, 32, 33, 34, 35],
+                [32, 36, 37, 38, 39],
+                [32, 40, 41, 42, 43],
+                [44],
+            ],
+        )
+        self.assertEqual(self.stored()["last_uid"], 44)
+        self.assertEqual(self.stored()["retry"], {})
+        self.assertEqual(self.process(limit=5), [])
+
+    def test_emails_expunged_before_fetching_do_not_block(self):
+        provider = self.assistant.email_provider
+        select_uids = provider._select_uids
+        folder = self.server.store.folder("INBOX")
+
+        def select_then_expunge(imap, name, limit):
+            uids = select_uids(imap, name, limit)
+            with self.server.store.lock:
+                folder.messages = [m for m in folder.messages if m.uid != 3]
+            return uids
+
+        with mock.patch.object(provider, "_select_uids", select_then_expunge):
+            self.assertNotIn(3, self.process())
+        self.assertEqual(self.stored()["last_uid"], 30)
+
+    def test_own_flag_changes_are_not_fetched_again(self):
+        self.assistant.ai_model.default = json.dumps(
+            {"action": "mark_read", "reason": "low priority"}
+        )
+        provider = self.assistant.email_provider
+        del provider.apply_actions
+        self.assertEqual(len(self.process()), 30)
+        self.assertEqual(
+            self.stored()["highestmodseq"],
+            self.server.store.folder("INBOX").highestmodseq,
+        )
+        self.assertEqual(self.process(), [])
+
+        # Another client's change is still picked up
+        with self.server.store.lock:
+            folder = self.server.store.folder("INBOX")
+            folder.highestmodseq += 1
+            folder.messages[2].modseq = folder.highestmodseq
+        self.assertEqual(self.process(), [3])
+
+    def test_servers_without_enable_sync_by_uid(self):
+        self.server.store.CAPABILITIES = ("IMAP4rev1", "CONDSTORE")
+        self.assistant = self.make_assistant()
+        self.assertFalse(self.assistant.email_provider.condstore)
+
+        self.assertEqual(len(self.process()), 30)
+        self.assertIsNone(self.stored()["highestmodseq"])
+        self.server.store.folder("INBOX").append(raw_message(31))
+        self.assertEqual(self.process(), [31])
+
+    def test_dry_run_leaves_the_stored_position(self):
+        self.assistant.dry_run = True
+        self.process()
+        self.assertFalse((self.state / "sync.json").exists())
+
+
+class Office365SyncTest(unittest.TestCase):
+    def setUp(self):
+        self.graph = GraphStub([raw_message(n) for n in range(1, 9)])
+        self.addCleanup(self.graph.server_close)
+        self.addCleanup(self.graph.shutdown)
+        authenticate = skip_authentication()
+        authenticate.start()
+        self.addCleanup(authenticate.stop)
+        self.state = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.state)
+        self.assistant = make_assistant(
+            self.state,
+            {
+                "email": office365_settings(self.graph),
+                "cache": {"enabled": False},
+                "processing": {"page_size": 3},
+            },
+            dry_run=False,
+            incremental=True,
+        )
+        self.addCleanup(close_assistant, self.assistant)
+        self.assistant.ai_model.default = json.dumps(
+            {"action": "keep_inbox", "reason": "important"}
+        )
+
+    def process(self, limit: int = 50) -> list:
+        self.assistant.result_sinks[0].records.clear()
+        self.assistant.process_emails(folder="inbox", limit=limit)
+        return [r["subject"] for r in self.assistant.result_sinks[0].records]
+
+    def test_first_run_lists_through_the_delta_round(self):
+        self.assertEqual(
+            sorted(self.process(limit=5)), [f"Email {n}" for n in range(4, 9)]
+        )
+        self.assertEqual(self.process(), [])
+
+    def test_mail_arriving_during_the_first_run_is_not_lost(self):
+        provider = self.assistant.email_provider
+        parse = provider._parse_message
+        delivered = []
+
+        def parse_then_deliver(item, folder):
+            if not delivered:
+                delivered.append(self.graph.arrive(raw_message(9)))
+            return parse(item, folder)
+
+        with mock.patch.object(provider, "_parse_message", parse_then_deliver):
+            self.assertEqual(len(self.process()), 8)
+        self.assertEqual(self.process(), ["Email 9"])
+
+    def test_unprocessed_emails_are_fetched_again(self):
+        self.process()
+        self.graph.arrive(raw_message(9))
+        self.graph.arrive(raw_message(10))
+        self.assistant.ai_model.default = answer_unless("Email 10")
+        self.assertEqual(sorted(self.process()), ["Email 10", "Email 9"])
+
+        # Email 9 was archived, so only the failed email is left to retry
+        self.assistant.ai_model.default = ARCHIVE
+        self.assertEqual(self.process(), ["Email 10"])
+        self.assertEqual(self.process(), [])
+
+    def test_an_email_that_always_fails_does_not_hold_back_the_folder(self):
+        self.process()
+        for number in range(9, 16):
+            self.graph.arrive(raw_message(number))
+        self.assistant.ai_model.default = answer_unless("Email 9")
+
+        runs = [sorted(self.process(limit=3)) for _ in range(4)]
+
+        self.assertEqual(
+            runs,
+            [
+                ["Email 10", "Email 11", "Email 9"],
+                ["Email 12", "Email 13", "Email 14", "Email 9"],
+                ["Email 15", "Email 9"],
+                [],
+            ],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,156 @@
+import json
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from helpers import (
+    bench,
+    close_assistant,
+    ea,
+    imap_settings,
+    make_assistant,
+    raw_message,
+)
+
+
+def wait_for(condition, timeout: float = 10) -> bool:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.02)
+    return True
+
+
+class IMAPServerTest(unittest.TestCase):
+    def setUp(self):
+        self.server = bench.FakeIMAPServer([raw_message(n) for n in range(1, 4)])
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+
+class IdleTest(IMAPServerTest):
+    def setUp(self):
+        super().setUp()
+        self.provider = ea.IMAPProvider(
+            "127.0.0.1", self.server.port, "test", "test", use_ssl=False
+        )
+        self.addCleanup(self.provider.pool.close)
+
+    def idle(self, **kwargs) -> tuple:
+        started = time.monotonic()
+        changed = self.provider.idle("INBOX", **kwargs)
+        return changed, time.monotonic() - started
+
+    def noop(self):
+        return self.provider._run("INBOX", lambda imap: imap.noop())
+
+    def test_delivery_ends_idle(self):
+        timer = threading.Timer(0.2, self.server.store.deliver, [raw_message(4)])
+        timer.start()
+        self.addCleanup(timer.cancel)
+        changed, elapsed = self.idle(timeout=10)
+
+        self.assertTrue(changed)
+        self.assertLess(elapsed, 5)
+        _, data = self.provider._run(
+            "INBOX", lambda imap: imap.uid("SEARCH", None, "ALL")
+        )
+        self.assertEqual(data[0].split(), [b"1", b"2", b"3", b"4"])
+
+    def test_timeout_leaves_the_connection_usable(self):
+        changed, elapsed = self.idle(timeout=0.3, tick=0.1)
+        self.assertFalse(changed)
+        self.assertGreaterEqual(elapsed, 0.3)
+        self.assertEqual(self.noop()[0], "OK")
+
+    def test_stop_ends_idle(self):
+        stop = threading.Event()
+        timer = threading.Timer(0.2, stop.set)
+        timer.start()
+        self.addCleanup(timer.cancel)
+        changed, elapsed = self.idle(timeout=10, stop=stop, tick=0.05)
+        self.assertFalse(changed)
+        self.assertLess(elapsed, 5)
+
+    def test_changes_announced_before_idle_count(self):
+        self.noop()
+        self.server.store.deliver(raw_message(4))
+        # The EXISTS arrives with this response, and imaplib queues it
+        self.noop()
+        changed, elapsed = self.idle(timeout=10)
+        self.assertTrue(changed)
+        self.assertLess(elapsed, 1)
+
+    def test_changes_buffered_behind_the_continuation_count(self):
+        self.noop()
+        # Announced in the same packet as IDLE's "+", so it waits in
+        # imaplib's read buffer rather than on the socket
+        self.server.store.deliver(raw_message(4))
+        changed, elapsed = self.idle(timeout=10)
+        self.assertTrue(changed)
+        self.assertLess(elapsed, 1)
+
+
+class WatchTest(IMAPServerTest):
+    def setUp(self):
+        super().setUp()
+        state = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, state)
+        self.assistant = make_assistant(
+            state,
+            {
+                "email": imap_settings(self.server),
+                "cache": {"enabled": False},
+                "watch": {"idle_timeout": 0.3},
+            },
+            watch=True,
+        )
+        self.addCleanup(close_assistant, self.assistant)
+        self.assistant.ai_model.default = json.dumps(
+            {"action": "archive", "reason": "seen it"}
+        )
+        self.records = self.assistant.result_sinks[0].records
+
+    def watch(self):
+        stop = threading.Event()
+        thread = threading.Thread(
+            target=self.assistant.watch,
+            kwargs={"folder": "INBOX", "stop": stop},
+            daemon=True,
+        )
+        thread.start()
+
+        def finish():
+            stop.set()
+            thread.join(10)
+
+        self.addCleanup(finish)
+
+    def test_new_mail_is_processed_on_arrival(self):
+        self.watch()
+        self.assertTrue(wait_for(lambda: len(self.records) == 3))
+        self.server.store.deliver(raw_message(4, subject="Fresh"))
+        self.assertTrue(wait_for(lambda: len(self.records) == 4))
+        self.assertEqual(self.records[3]["subject"], "Fresh")
+
+    def test_folder_is_processed_again_when_idle_times_out(self):
+        provider = self.assistant.email_provider
+
+        def idle_without_notice(folder, timeout, stop=None):
+            stop.wait(timeout)
+            return False
+
+        with mock.patch.object(provider, "idle", idle_without_notice):
+            self.watch()
+            self.assertTrue(wait_for(lambda: len(self.records) == 3))
+            self.server.store.folder("INBOX").append(raw_message(4))
+            self.assertTrue(wait_for(lambda: len(self.records) == 4))
+
+
+if __name__ == "__main__":
+    unittest.main()